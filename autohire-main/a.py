@@ -5,8 +5,9 @@ import pandas as pd
 import numpy as np
 from datetime import datetime
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import normalize
 from sklearn.impute import SimpleImputer
+from scipy.sparse import csr_matrix
 # Explicitly importing potentially missing standard libraries if prepare_features uses them
 from collections import Counter # Used in keyword extraction if called during training phase (won't be here, but good practice)
 import traceback # For detailed error logs
@@ -71,6 +72,69 @@ def calculate_single_experience(start_date_str, end_date_str):
         eprint(f"Error calculating single experience: {e} for dates '{start_date_str}', '{end_date_str}'")
         return 0
 
+def skill_vocabulary(feature_preserver):
+    """
+    Fixed column order for the preserved skill set.
+
+    Returns (skills, skill_index, job_cols, resume_cols) where skill_index maps each
+    skill to its column in the incidence matrices. Cached on the preserver so the
+    f-string column names are built once per loaded model rather than per request.
+    """
+    cached = getattr(feature_preserver, '_skill_vocabulary', None)
+    if cached is not None and len(cached[0]) == len(feature_preserver.all_skills):
+        return cached
+
+    skills = sorted(feature_preserver.all_skills, key=str)
+    skill_index = {skill: i for i, skill in enumerate(skills)}
+    job_cols = [f'job_has_{skill}' for skill in skills]
+    resume_cols = [f'resume_has_{skill}' for skill in skills]
+    feature_preserver._skill_vocabulary = (skills, skill_index, job_cols, resume_cols)
+    return feature_preserver._skill_vocabulary
+
+def skill_incidence_matrix(skill_lists, skill_index):
+    """
+    Sparse 0/1 matrix with one row per entry of skill_lists and one column per vocabulary skill.
+
+    Entries that are not lists/sets count as having no skills, and skills outside the
+    vocabulary are ignored, matching the per-skill `skill in skills` checks it replaces.
+    """
+    indptr = [0]
+    indices = []
+    for row_skills in skill_lists:
+        if isinstance(row_skills, (list, set)):
+            columns = set()
+            for skill in row_skills:
+                try:
+                    column = skill_index.get(skill)
+                except TypeError: # Unhashable entry (e.g. a raw skill object) can't be a vocabulary skill
+                    continue
+                if column is not None:
+                    columns.add(column)
+            indices.extend(sorted(columns))
+        indptr.append(len(indices))
+
+    data = np.ones(len(indices), dtype=np.int8)
+    return csr_matrix((data, np.asarray(indices, dtype=np.int32), np.asarray(indptr, dtype=np.int64)),
+                      shape=(len(indptr) - 1, len(skill_index)))
+
+def row_sums(matrix):
+    """Per-row sum of a sparse matrix as a flat ndarray."""
+    return np.asarray(matrix.sum(axis=1)).ravel()
+
+def rowwise_dot(a, b):
+    """Dot product of each row of `a` with the same row of `b` (both sparse, same shape)."""
+    return row_sums(a.multiply(b))
+
+def rowwise_cosine_similarity(a, b):
+    """
+    Cosine similarity between each row of `a` and the same row of `b`.
+
+    Both sparse matrices are L2-normalized once and multiplied elementwise, so the whole
+    batch is one sparse operation instead of a cosine_similarity call per row pair.
+    Empty rows stay all-zero after normalization and therefore score 0.
+    """
+    return rowwise_dot(normalize(a, norm='l2'), normalize(b, norm='l2'))
+
 def prepare_features(df, feature_preserver):
     """Prepare features for prediction using preserved setup"""
     eprint("Entering prepare_features...") # Debug print
@@ -78,29 +142,22 @@ def prepare_features(df, feature_preserver):
     is_training = False # This function is used for prediction here
 
     # --- Skill Features ---
-    skill_data = {}
-    if not feature_preserver.all_skills:
+    # One pass over each skills column builds a (rows x vocabulary) incidence matrix;
+    # the job_has_*/resume_has_* columns are then read straight off the matrices.
+    skills, skill_index, job_skill_cols, resume_skill_cols = skill_vocabulary(feature_preserver)
+    if not skills:
          eprint("Warning: FeaturePreserver has no skills recorded from training.")
 
-    for skill in feature_preserver.all_skills:
-        # Check jobSkills (list of strings)
-        if 'jobSkills' in df.columns:
-             skill_data[f'job_has_{skill}'] = df['jobSkills'].apply(
-                 lambda skills: skill in skills if isinstance(skills, (list, set)) else False
-             ).astype(int)
-        else:
-             skill_data[f'job_has_{skill}'] = 0
+    job_skill_matrix = skill_incidence_matrix(
+        df['jobSkills'] if 'jobSkills' in df.columns else [None] * len(df), skill_index)
+    resume_skill_matrix = skill_incidence_matrix(
+        df['resumeSkills'] if 'resumeSkills' in df.columns else [None] * len(df), skill_index)
 
-        # Check resumeSkills (list of strings)
-        if 'resumeSkills' in df.columns:
-             skill_data[f'resume_has_{skill}'] = df['resumeSkills'].apply(
-                 lambda skills: skill in skills if isinstance(skills, (list, set)) else False
-             ).astype(int)
-        else:
-             skill_data[f'resume_has_{skill}'] = 0
-
-    if skill_data:
-        skill_df = pd.DataFrame(skill_data, index=df.index)
+    if skills:
+        skill_df = pd.concat([
+            pd.DataFrame(job_skill_matrix.toarray(), columns=job_skill_cols, index=df.index),
+            pd.DataFrame(resume_skill_matrix.toarray(), columns=resume_skill_cols, index=df.index),
+        ], axis=1)
         df = pd.concat([df, skill_df], axis=1)
     else:
          # If no skills were preserved, create dummy columns expected by the model based on feature_cols
@@ -168,9 +225,7 @@ def prepare_features(df, feature_preserver):
         try:
             job_vectors = feature_preserver.role_vectorizer.transform(df['job_text'])
             resume_vectors = feature_preserver.role_vectorizer.transform(df['resume_text'])
-            df['role_similarity'] = [cosine_similarity(job_vec, resume_vec)[0][0]
-                                     if job_vec.nnz > 0 and resume_vec.nnz > 0 else 0
-                                     for job_vec, resume_vec in zip(job_vectors, resume_vectors)]
+            df['role_similarity'] = rowwise_cosine_similarity(job_vectors, resume_vectors)
         except Exception as e:
             eprint(f"Error calculating role similarity: {e}. Setting to 0.")
             df['role_similarity'] = 0
@@ -186,9 +241,7 @@ def prepare_features(df, feature_preserver):
         try:
             job_edu_vectors = feature_preserver.edu_vectorizer.transform(df['job_edu_text'])
             resume_edu_vectors = feature_preserver.edu_vectorizer.transform(df['resume_edu_text'])
-            df['education_similarity'] = [cosine_similarity(j_vec, r_vec)[0][0]
-                                          if j_vec.nnz > 0 and r_vec.nnz > 0 else 0
-                                          for j_vec, r_vec in zip(job_edu_vectors, resume_edu_vectors)]
+            df['education_similarity'] = rowwise_cosine_similarity(job_edu_vectors, resume_edu_vectors)
         except Exception as e:
              eprint(f"Error calculating education similarity: {e}. Setting to 0.")
              df['education_similarity'] = 0
@@ -204,15 +257,10 @@ def prepare_features(df, feature_preserver):
     df['experience_match_squared'] = df['experience_match'] ** 2
     df['role_similarity_squared'] = df['role_similarity'] ** 2
 
-    # Skill match ratios
-    job_skill_count = df.filter(like='job_has_').sum(axis=1).clip(lower=1)
-    resume_skill_count = df.filter(like='resume_has_').sum(axis=1).clip(lower=1)
-    skill_match_count = df.apply(
-        lambda row: sum(row[f'job_has_{skill}'] and row[f'resume_has_{skill}']
-                        for skill in feature_preserver.all_skills
-                        if f'job_has_{skill}' in row and f'resume_has_{skill}' in row), # Check column exists
-        axis=1
-    )
+    # Skill match ratios (row sums and the job/resume overlap come straight off the incidence matrices)
+    job_skill_count = pd.Series(row_sums(job_skill_matrix), index=df.index).clip(lower=1)
+    resume_skill_count = pd.Series(row_sums(resume_skill_matrix), index=df.index).clip(lower=1)
+    skill_match_count = pd.Series(rowwise_dot(job_skill_matrix, resume_skill_matrix), index=df.index)
     df['skill_match_ratio'] = (skill_match_count / job_skill_count).fillna(0)
     df['skill_coverage_ratio'] = (skill_match_count / resume_skill_count).fillna(0)
 
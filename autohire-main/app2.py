@@ -2,18 +2,33 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 from datetime import datetime
-from sklearn.model_selection import train_test_split, GridSearchCV, RandomizedSearchCV, cross_val_score
+from sklearn.model_selection import train_test_split, GridSearchCV, RandomizedSearchCV, cross_val_score, KFold
+from sklearn.base import clone
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401 (enables HalvingRandomSearchCV)
+from sklearn.model_selection import HalvingRandomSearchCV
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
 from sklearn.ensemble import RandomForestRegressor
-from sklearn.metrics import mean_squared_error, r2_score, mean_absolute_error
+from sklearn.metrics import mean_squared_error, r2_score, mean_absolute_error, make_scorer
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 from sklearn.impute import SimpleImputer
 import pickle
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
 from sklearn.cluster import KMeans
 from sklearn.preprocessing import StandardScaler
 from sklearn.decomposition import PCA
 from sklearn.cluster import Birch
 
+# Pieces the scorer must compute exactly as training does are imported from it, not copied
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend', 'services'))
+from app import FlatForest, KeywordMatcher, experience_match  # noqa: E402
+
 
 class FeaturePreserver:
     """Class to preserve feature engineering setup from training"""
@@ -25,40 +40,116 @@ class FeaturePreserver:
         self.edu_vectorizer = None
         self.imputer = SimpleImputer(strategy='mean')
         self.keywords = set()
+        self.training_history = []  # One entry per full or incremental training run
+
+
+# The six scores every model predicts
+TARGET_COLUMNS = ['skillsScore', 'experienceScore', 'locationScore',
+                  'roleSimilarity', 'educationScore', 'matchScore']
+
+
+def collect_skills(df):
+    """Distinct skill names found in the jobSkills*/resumeSkills* columns"""
+    skills = set()
+    for col in df.columns:
+        if 'jobSkills' in col or 'resumeSkills' in col:
+            skills.update(df[col].dropna().unique())
+    return skills
+
 
+def common_job_keywords(job_text):
+    """Words longer than 3 letters among the 50 most common words of the job texts"""
+    from collections import Counter
+    all_job_words = ' '.join(job_text.fillna('')).lower().split()
+    return [word for word, count in Counter(all_job_words).most_common(50)
+            if len(word) > 3]  # Filter out short words
 
-def calculate_experience(row):
-    """Calculate total experience from resume experience dates"""
+
+@lru_cache(maxsize=65536)
+def parse_month_year(date_str):
+    """
+    datetime for a '%m/%Y' resume date, or None if it doesn't parse.
+
+    Memoized: a few hundred month strings cover every row of the dataset.
+    """
     try:
-        if pd.isnull(row['resumeExperience__startDate']) or pd.isnull(row['resumeExperience__endDate']):
-            return 0
+        return datetime.strptime(date_str, '%m/%Y')
+    except (TypeError, ValueError):
+        return None
 
-        end_date_str = str(row['resumeExperience__endDate']).lower()
-        if end_date_str in ['present', 'null']:
-            end_date = datetime.now()
-        else:
-            end_date = datetime.strptime(row['resumeExperience__endDate'], '%m/%Y')
 
-        start_date = datetime.strptime(row['resumeExperience__startDate'], '%m/%Y')
-        experience_years = (end_date - start_date).days / 365.25
-        return max(0, round(experience_years, 1))
-    except Exception as e:
-        print(f"Error calculating experience: {e}")
-        return 0
+def rounded_years(days):
+    """max(0, round(days / 365.25, 1)) for an array of day counts, rounding each distinct count once"""
+    unique_days, inverse = np.unique(np.asarray(days, dtype=np.int64), return_inverse=True)
+    years = [max(0, round(day_count / 365.25, 1)) for day_count in unique_days.tolist()]
+    return np.array(years, dtype=float)[inverse.ravel()]
+
+
+def calculate_experience(df, now=None):
+    """
+    Experience in years of every row's resume experience dates.
+
+    Each distinct date string is parsed once (parse_month_year) and the year differences
+    are taken over arrays. 'present'/'null' end dates count up to now; rows with a
+    missing or unparseable date get 0.
+    """
+    now = now or datetime.now()
+    starts = df['resumeExperience__startDate']
+    ends = df['resumeExperience__endDate']
+    has_dates = (starts.notna() & ends.notna()).to_numpy()
+    ongoing = has_dates & ends.astype(str).str.lower().isin(['present', 'null']).to_numpy()
+
+    start_dates = np.array([parse_month_year(date) if present else None
+                            for date, present in zip(starts.tolist(), has_dates)], dtype='datetime64[us]')
+    end_dates = np.array([parse_month_year(date) if present and not is_ongoing else None
+                          for date, present, is_ongoing in zip(ends.tolist(), has_dates, ongoing)],
+                         dtype='datetime64[us]')
+    end_dates[ongoing] = np.datetime64(now, 'us')
+
+    unparsed = has_dates & (np.isnat(start_dates) | np.isnat(end_dates))
+    if unparsed.any():
+        print(f"Error calculating experience: {int(unparsed.sum())} rows have dates that are not '%m/%Y'; using 0")
+
+    years = np.zeros(len(df))
+    parsed = has_dates & ~unparsed
+    years[parsed] = rounded_years((end_dates[parsed] - start_dates[parsed]) // np.timedelta64(1, 'D'))
+    return pd.Series(years, index=df.index)
 
 
 def calculate_total_experience(df):
-    """Calculate total experience across all roles for each candidate"""
-    experience_groups = df.groupby('resumeSummary')
-    total_experience = {}
+    """
+    Calculate total experience across all roles for each candidate, aligned with df's rows
+
+    The dataset has one row per role and no candidate id, so rows are grouped by
+    resumeSummary: pd.factorize turns it into integer candidate codes and np.bincount sums
+    every candidate's years in row order (the same additions as a per-group loop). Rows
+    without a summary get 0.
+    """
+    candidate_codes, _ = pd.factorize(df['resumeSummary'])
+    years = calculate_experience(df).to_numpy()
+    has_candidate = candidate_codes >= 0
+    totals = np.bincount(candidate_codes[has_candidate], weights=years[has_candidate],
+                         minlength=candidate_codes.max() + 1 if len(df) else 0)
+    return pd.Series(np.where(has_candidate, totals[np.maximum(candidate_codes, 0)], 0.0), index=df.index)
+
+
+@lru_cache(maxsize=1024)
+def parse_required_years(required_experience):
+    """The number before the first '-' of a range like "2-4 years", else 0"""
+    return float(required_experience.split('-')[0]) if '-' in required_experience else 0
 
-    for name, group in experience_groups:
-        total_years = 0
-        for _, row in group.iterrows():
-            total_years += calculate_experience(row)
-        total_experience[name] = total_years
 
-    return total_experience
+def required_years(required_experience):
+    """
+    parse_required_years for a whole column, parsing each distinct string once
+
+    The dataset repeats a handful of values such as "2-4 years", so pd.factorize maps rows
+    to those few strings and the parsed years are gathered back by code. Missing values get 0.
+    """
+    codes, distinct = pd.factorize(required_experience)
+    years = np.array([parse_required_years(value) for value in distinct], dtype=float)
+    return pd.Series(np.where(codes >= 0, years[np.maximum(codes, 0)] if len(years) else 0.0, 0.0),
+                     index=required_experience.index).fillna(0)
 
 
 def prepare_features(df, feature_preserver=None):
@@ -70,10 +161,7 @@ def prepare_features(df, feature_preserver=None):
         feature_preserver = FeaturePreserver()
 
         # Collect all skills during training
-        for col in df.columns:
-            if 'jobSkills' in col or 'resumeSkills' in col:
-                skills = df[col].dropna().unique()
-                feature_preserver.all_skills.update(skills)
+        feature_preserver.all_skills.update(collect_skills(df))
 
     # Create skill columns using preserved skills
     skill_data = {}
@@ -95,22 +183,11 @@ def prepare_features(df, feature_preserver=None):
         df = pd.concat([df, skill_df], axis=1)
 
     # Experience features
-    df['required_years'] = (
-        df['requiredExperience']
-        .apply(lambda x: float(x.split('-')[0]) if pd.notnull(x) and '-' in x else 0)
-        .fillna(0)
-    )
+    df['required_years'] = required_years(df['requiredExperience'])
 
-    total_experience = calculate_total_experience(df)
-    df['actual_experience'] = df['resumeSummary'].map(total_experience).fillna(0)
+    df['actual_experience'] = calculate_total_experience(df)
 
-    df['experience_match'] = (
-        df.apply(
-            lambda x: max(0, 1 - abs(x['required_years'] - x['actual_experience']) / max(x['required_years'], 1)),
-            axis=1
-        )
-        .fillna(0)
-    )
+    df['experience_match'] = experience_match(df['required_years'], df['actual_experience'])
 
     # Location matching
     df['location_match'] = (
@@ -175,20 +252,12 @@ def prepare_features(df, feature_preserver=None):
     if is_training:
         # Extract important keywords during training
         feature_preserver.keywords = set()
-        from collections import Counter
 
         # Get most common words in job descriptions
-        all_job_words = ' '.join(df['job_text'].fillna('')).lower().split()
-        common_words = [word for word, count in Counter(all_job_words).most_common(50)
-                        if len(word) > 3]  # Filter out short words
-        feature_preserver.keywords.update(common_words)
+        feature_preserver.keywords.update(common_job_keywords(df['job_text']))
 
     # Count keyword matches
-    df['keyword_match_count'] = df.apply(
-        lambda row: sum(1 for keyword in feature_preserver.keywords
-                        if keyword in row['resume_text'].lower()),
-        axis=1
-    )
+    df['keyword_match_count'] = KeywordMatcher(feature_preserver.keywords).count(df['resume_text'])
 
     # 5. Create a composite score
     df['composite_feature'] = (
@@ -214,6 +283,10 @@ def prepare_features(df, feature_preserver=None):
     # Store feature columns during training
     if is_training:
         feature_preserver.feature_cols = feature_cols
+    else:
+        # The forests expect the training columns in training order. Skills added by an
+        # incremental update have no columns of their own; they only count in the ratios above
+        feature_cols = feature_preserver.feature_cols
 
     # Impute missing values using preserved setup
     numeric_features = df[feature_cols].apply(pd.to_numeric, errors='coerce')
@@ -224,19 +297,353 @@ def prepare_features(df, feature_preserver=None):
     return pd.DataFrame(imputed_data, columns=feature_cols, index=df.index), feature_preserver
 
 
-def train_model(df):
-    """Train the model and return feature preservation setup"""
-    X, feature_preserver = prepare_features(df)
-    y = df[['skillsScore', 'experienceScore', 'locationScore',
-            'roleSimilarity', 'educationScore', 'matchScore']].fillna(0)
+# models['__multi_output__'] holds {'model': forest, 'targets': [...]} when one forest predicts every target
+MULTI_OUTPUT_KEY = '__multi_output__'
+
+
+def target_r2(y_true, y_pred, column):
+    """R² of one output column of a multi-output prediction"""
+    return r2_score(np.asarray(y_true)[:, column], np.asarray(y_pred)[:, column])
+
+
+def build_search(param_grid, cv, search='random', n_jobs=-1, targets=None):
+    """
+    Hyperparameter search for a RandomForestRegressor.
+
+    'random' tries 20 sampled candidates on every fold (the original setup). 'halving'
+    uses the number of trees as the budget: 27 candidates start with a few trees each and
+    only the best third is grown 3x larger per round, up to the largest n_estimators in the
+    grid. Forest fit time scales with the tree count, so weak candidates are dropped cheaply.
+
+    With `targets` (the columns of a multi-output fit) the random search also scores every
+    column on each fold ('r2_<target>' in cv_results_) and still selects on the R² averaged
+    over them. Successive halving takes a single scorer, so it only has the averaged one.
+    """
+    base_model = RandomForestRegressor(random_state=42)
+    if search == 'halving':
+        halving_grid = {name: values for name, values in param_grid.items() if name != 'n_estimators'}
+        return HalvingRandomSearchCV(base_model, halving_grid, n_candidates=27, factor=3,
+                                     resource='n_estimators', max_resources=max(param_grid['n_estimators']),
+                                     min_resources='exhaust', cv=cv, scoring='r2',
+                                     random_state=42, n_jobs=n_jobs)
+    if targets is None:
+        scoring, refit = 'r2', True
+    else:
+        scoring = {'r2': 'r2', **{f'r2_{target}': make_scorer(target_r2, column=i) for i, target in enumerate(targets)}}
+        refit = 'r2'
+    return RandomizedSearchCV(base_model, param_grid, n_iter=20,
+                              cv=cv, scoring=scoring, refit=refit, random_state=42, n_jobs=n_jobs)
+
+
+def search_cv_scores(model_tuner, metric='score'):
+    """Mean/std of the chosen candidate's fold scores, straight from the search results"""
+    best = model_tuner.best_index_
+    return model_tuner.cv_results_[f'mean_test_{metric}'][best], model_tuner.cv_results_[f'std_test_{metric}'][best]
+
+
+# Training data shared with target worker processes (set once per worker, not per task)
+_training_data = None
+
+
+def _set_training_data(training_data):
+    global _training_data
+    _training_data = training_data
+
+
+def tune_target(target, search='random', n_jobs=-1, full_cv=False):
+    """Tune, fit and evaluate the forest for one target column of the shared training data"""
+    X, y, X_train, X_test, y_train, y_test, param_grid, cv = _training_data
+    print(f"Tuning model for {target}...")
+
+    # Choose one of these search methods:
+    # Option 1: Comprehensive but slower
+    # model_tuner = GridSearchCV(RandomForestRegressor(random_state=42), param_grid, cv=cv, scoring='r2', n_jobs=-1)
+
+    # Option 2: Faster but less comprehensive (search='random'), or successive halving (search='halving')
+    model_tuner = build_search(param_grid, cv, search, n_jobs)
+
+    model_tuner.fit(X_train, y_train[target])
+    best_model = model_tuner.best_estimator_
+
+    print(f"Best parameters for {target}: {model_tuner.best_params_}")
+
+    preds = best_model.predict(X_test)
+
+    # Calculate metrics including MAPE
+    mae = mean_absolute_error(y_test[target], preds)
+    rmse = np.sqrt(mean_squared_error(y_test[target], preds))
+
+    # Calculate MAPE
+    actual = y_test[target].values
+    mape = np.mean(np.abs((actual - preds) / (actual + 1e-10))) * 100
+
+    metrics = {
+        'mae': mae,
+        'rmse': rmse,
+        'mse': mean_squared_error(y_test[target], preds),
+        'r2': r2_score(y_test[target], preds),
+        'mape': mape,
+        'feature_importance': dict(zip(X.columns, best_model.feature_importances_))
+    }
+
+    if full_cv:
+        # Extra 5-fold cross-validation of the refitted model on all rows
+        cv_scores = cross_val_score(best_model, X, y[target], cv=5, scoring='r2')
+        metrics['cv_r2_mean'], metrics['cv_r2_std'] = cv_scores.mean(), cv_scores.std()
+    else:
+        # The search already scored the chosen parameters on every fold
+        metrics['cv_r2_mean'], metrics['cv_r2_std'] = search_cv_scores(model_tuner)
+
+    print(f"Cross-validation R² for {target}: {metrics['cv_r2_mean']:.4f} ± {metrics['cv_r2_std']:.4f}")
+    return target, best_model, metrics
+
+
+def train_multi_output_model(search='random', full_cv=False):
+    """
+    Tune and fit one RandomForestRegressor on all target columns at once.
+
+    Every tree predicts the whole target vector, so training and prediction walk a single
+    ensemble instead of one per target. Metrics are reported per target as in train_model;
+    without full_cv the CV R² comes from the search's folds, per target for the random
+    search and only averaged over the targets ('joint_cv_r2_*') for successive halving.
+    """
+    X, y, X_train, X_test, y_train, y_test, param_grid, cv = _training_data
+    print(f"Tuning multi-output model for {list(y.columns)}...")
+    model_tuner = build_search(param_grid, cv, search, targets=list(y.columns))
+    model_tuner.fit(X_train, y_train)
+    best_model = model_tuner.best_estimator_
+    print(f"Best parameters for multi-output model: {model_tuner.best_params_}")
+
+    all_preds = best_model.predict(X_test)
+
+    if full_cv:
+        # Cross-validation R² per target from a single set of fits (same folds as cross_val_score(cv=5))
+        cv_scores = {target: [] for target in y.columns}
+        for train_index, test_index in KFold(n_splits=5).split(X):
+            fold_model = clone(best_model).fit(X.iloc[train_index], y.iloc[train_index])
+            fold_preds = fold_model.predict(X.iloc[test_index])
+            for i, target in enumerate(y.columns):
+                cv_scores[target].append(r2_score(y.iloc[test_index][target], fold_preds[:, i]))
+        cv_summary = {target: (np.mean(scores), np.std(scores)) for target, scores in cv_scores.items()}
+    elif f'mean_test_r2_{y.columns[0]}' in model_tuner.cv_results_:
+        # The search scored each target on its folds
+        cv_summary = {target: search_cv_scores(model_tuner, f'r2_{target}') for target in y.columns}
+    else:
+        # Successive halving only has the R² averaged over targets: report it once, not per target
+        cv_summary = None
+        joint_mean, joint_std = search_cv_scores(model_tuner)
+        print(f"Joint search CV R² (averaged over all targets): {joint_mean:.4f} ± {joint_std:.4f}")
+
+    metrics = {}
+    for i, target in enumerate(y.columns):
+        preds = all_preds[:, i]
+        actual = y_test[target].values
+        metrics[target] = {
+            'mae': mean_absolute_error(actual, preds),
+            'rmse': np.sqrt(mean_squared_error(actual, preds)),
+            'mse': mean_squared_error(actual, preds),
+            'r2': r2_score(actual, preds),
+            'mape': np.mean(np.abs((actual - preds) / (actual + 1e-10))) * 100,
+            # Impurity decrease summed over all outputs, so it is shared by every target
+            'feature_importance': dict(zip(X.columns, best_model.feature_importances_)),
+        }
+        if cv_summary is not None:
+            metrics[target]['cv_r2_mean'], metrics[target]['cv_r2_std'] = cv_summary[target]
+            print(f"Cross-validation R² for {target}: {metrics[target]['cv_r2_mean']:.4f} ± {metrics[target]['cv_r2_std']:.4f}")
+        else:
+            metrics[target]['joint_cv_r2_mean'], metrics[target]['joint_cv_r2_std'] = joint_mean, joint_std
+
+    models = {MULTI_OUTPUT_KEY: {'model': best_model, 'targets': list(y.columns)}}
+    return models, metrics
+
+
+def predict_targets(models, X):
+    """Predictions per target, running a multi-output forest once for all of its targets"""
+    predictions = {}
+    for target, model in models.items():
+        if target == MULTI_OUTPUT_KEY:
+            joint_preds = model['model'].predict(X)
+            for i, joint_target in enumerate(model['targets']):
+                predictions[joint_target] = joint_preds[:, i]
+        else:
+            predictions[target] = model.predict(X)
+    return predictions
+
+
+# Layout version of the model artifact directory (model_artifact/manifest.json)
+ARTIFACT_FORMAT = 1
+
+
+def flatten_forest(forest):
+    """
+    Flatten every tree of a fitted forest into contiguous node arrays.
+
+    Node ids are global across trees (roots holds each tree's first node). Leaves have
+    feature -1 and point both children at themselves, so a traversal can run a fixed
+    number of steps. value is (n_nodes, n_outputs).
+    """
+    features, thresholds, children, values, roots = [], [], [], [], []
+    offset = 0
+    for estimator in forest.estimators_:
+        tree = estimator.tree_
+        node_ids = np.arange(tree.node_count)
+        is_leaf = tree.children_left < 0
+        roots.append(offset)
+        features.append(np.where(is_leaf, -1, tree.feature))
+        thresholds.append(tree.threshold)
+        children.append(np.stack([
+            np.where(is_leaf, node_ids, tree.children_left) + offset,
+            np.where(is_leaf, node_ids, tree.children_right) + offset
+        ], axis=1))
+        values.append(tree.value[:, :, 0])
+        offset += tree.node_count
+
+    return {
+        'feature': np.concatenate(features).astype(np.int32),
+        'threshold': np.concatenate(thresholds).astype(np.float64),
+        'children': np.concatenate(children).astype(np.int32),
+        'value': np.concatenate(values).astype(np.float64),
+        'roots': np.array(roots, dtype=np.int32)
+    }, max(estimator.tree_.max_depth for estimator in forest.estimators_)
+
+
+def export_forests(models, X_check, out_dir):
+    """
+    Write every forest in models as flat .npy arrays under out_dir for the scorer.
+
+    Each export is checked against model.predict on X_check before it is written.
+    Returns the manifest entry of each forest.
+    """
+    entries = []
+    for name, model in models.items():
+        forest, targets = (model['model'], model['targets']) if name == MULTI_OUTPUT_KEY else (model, [name])
+        arrays, depth = flatten_forest(forest)
+
+        expected = forest.predict(X_check).reshape(len(X_check), -1)
+        actual = FlatForest(arrays, depth).predict(X_check).reshape(len(X_check), -1)
+        if not np.array_equal(expected, actual):
+            raise ValueError(f"Flattened forest for {name} does not reproduce model.predict "
+                             f"(max abs diff {np.abs(expected - actual).max()})")
+
+        for array_name, array in arrays.items():
+            np.save(os.path.join(out_dir, f"{name}.{array_name}.npy"), array)
+        entries.append({'name': name, 'targets': targets, 'depth': int(depth),
+                        'n_trees': len(arrays['roots']), 'n_nodes': len(arrays['feature'])})
+        print(f"Exported {name}: {len(arrays['roots'])} trees, {len(arrays['feature'])} nodes, verified on {len(X_check)} rows")
+    return entries
+
+
+def export_vectorizer(vectorizer, out_dir, name):
+    """
+    Write a fitted TfidfVectorizer as its vocabulary (terms in column order) and idf arrays.
+
+    Returns the manifest entry: the array files plus the constructor parameters that affect
+    transform(), which is all the scorer needs to rebuild an identical vectorizer.
+    """
+    if vectorizer is None:
+        return None
+    terms = sorted(vectorizer.vocabulary_, key=vectorizer.vocabulary_.get)
+    np.save(os.path.join(out_dir, f"{name}.vocabulary.npy"), np.array(terms, dtype=str))
+    np.save(os.path.join(out_dir, f"{name}.idf.npy"), np.asarray(vectorizer.idf_, dtype=np.float64))
+
+    params = vectorizer.get_params()
+    for fit_only in ('vocabulary', 'max_df', 'min_df', 'max_features'):
+        params.pop(fit_only)
+    params['dtype'] = np.dtype(params['dtype']).name
+    params['ngram_range'] = list(params['ngram_range'])
+    return {'vocabulary': f"{name}.vocabulary.npy", 'idf': f"{name}.idf.npy", 'params': params}
+
+
+def export_artifact(models, feature_preserver, X_check, artifact_dir):
+    """
+    Write the models and their feature setup as a versioned artifact directory for the scorer.
+
+    Everything is JSON or .npy, so the scorer starts without unpickling anything and maps
+    only the forests a request needs:
+        manifest.json       feature columns, skill vocabulary, keywords, training history,
+                            vectorizer parameters and the forest list
+        <vectorizer>.*.npy  vocabulary terms and idf per TF-IDF vectorizer
+        imputer.statistics.npy  column means of the SimpleImputer
+        <forest>.*.npy      flat forest arrays (see flatten_forest)
+    The version is a content hash. Each version gets its own artifact_dir.<version>
+    directory and artifact_dir is a symlink to the current one, swapped atomically; older
+    versions are left in place for scorers that still have them open.
+
+    Returns:
+        The artifact version
+    """
+    if os.path.isdir(artifact_dir) and not os.path.islink(artifact_dir):
+        raise ValueError(f"{artifact_dir} is a plain directory; move it away so it can become a version symlink")
+    staging = f"{artifact_dir}.staging.{os.getpid()}"
+    os.makedirs(staging)
+    forests = export_forests(models, X_check, staging)
+    np.save(os.path.join(staging, 'imputer.statistics.npy'),
+            np.asarray(feature_preserver.imputer.statistics_, dtype=np.float64))
+    manifest = {
+        'format': ARTIFACT_FORMAT,
+        'feature_cols': list(feature_preserver.feature_cols),
+        'skills': sorted(feature_preserver.all_skills, key=str),
+        'keywords': sorted(feature_preserver.keywords),
+        'vectorizers': {
+            'role': export_vectorizer(feature_preserver.role_vectorizer, staging, 'role_vectorizer'),
+            'edu': export_vectorizer(feature_preserver.edu_vectorizer, staging, 'edu_vectorizer'),
+        },
+        'imputer': {'statistics': 'imputer.statistics.npy'},
+        'forests': forests,
+        'training_history': getattr(feature_preserver, 'training_history', []),
+    }
+
+    content = hashlib.sha1(json.dumps(manifest, sort_keys=True, default=str).encode())
+    for filename in sorted(os.listdir(staging)):
+        with open(os.path.join(staging, filename), 'rb') as f:
+            content.update(f.read())
+    manifest['version'] = content.hexdigest()[:16]
+    manifest['created_at'] = datetime.now().isoformat(timespec='seconds')
+    with open(os.path.join(staging, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2, default=str)
+
+    version_dir = f"{artifact_dir}.{manifest['version']}"
+    if os.path.exists(version_dir):
+        shutil.rmtree(staging)  # Same content as an existing version
+    else:
+        os.rename(staging, version_dir)
+    link = f"{version_dir}.link"
+    os.symlink(os.path.basename(version_dir), link)
+    os.replace(link, artifact_dir)
+    return manifest['version']
+
+
+def labelled_rows(X, df):
+    """Features and targets of the rows that have at least one non-zero target score"""
+    y = df[TARGET_COLUMNS].fillna(0)
 
     # Align indices
     X, y = X.align(y, axis=0, join='inner')
 
     # Remove rows with all zeros in targets
     valid_targets = y[(y != 0).any(axis=1)]
-    X = X.loc[valid_targets.index]
-    y = y.loc[valid_targets.index]
+    return X.loc[valid_targets.index], y.loc[valid_targets.index]
+
+
+def forest_trees(models):
+    """Number of trees in each forest of models"""
+    return {name: len((model['model'] if name == MULTI_OUTPUT_KEY else model).estimators_)
+            for name, model in models.items()}
+
+
+def train_model(df, multi_output=False, search='random', target_workers=1, full_cv=False):
+    """
+    Train the model and return feature preservation setup
+
+    Args:
+        df: Training rows with the six target columns
+        multi_output: Fit one forest for all targets instead of one per target
+        search: 'random' (RandomizedSearchCV) or 'halving' (successive halving, see build_search)
+        target_workers: Processes tuning per-target forests in parallel
+        full_cv: Run the extra 5-fold cross-validation instead of reusing the search's fold scores
+    """
+    X, feature_preserver = prepare_features(df)
+    X, y = labelled_rows(X, df)
 
     X_train, X_test, y_train, y_test = train_test_split(
         X, y, test_size=0.2, random_state=42
@@ -251,58 +658,114 @@ def train_model(df):
         'max_features': ['sqrt', 'log2', None]
     }
 
-    # For faster execution, you can use RandomizedSearchCV instead
-    # n_iter controls how many parameter combinations to try
-    # cv=3 for 3-fold cross-validation
+    # One set of 3-fold splits (what cv=3 uses for regressors) shared by every target's search
+    cv = KFold(n_splits=3)
+    training_data = (X, y, X_train, X_test, y_train, y_test, param_grid, cv)
+    _set_training_data(training_data)
+
+    if multi_output:
+        models, metrics = train_multi_output_model(search, full_cv)
+        feature_preserver.training_history.append(training_entry('full', len(X), models))
+        return models, metrics, feature_preserver
 
     models = {}
     metrics = {}
 
-    for target in y.columns:
-        print(f"Tuning model for {target}...")
-        base_model = RandomForestRegressor(random_state=42)
+    if target_workers > 1:
+        # Each worker gets the training data once; the CPUs are split between the workers' searches
+        inner_jobs = max(1, (os.cpu_count() or 1) // target_workers)
+        with ProcessPoolExecutor(max_workers=target_workers, initializer=_set_training_data,
+                                 initargs=(training_data,)) as pool:
+            results = list(pool.map(partial(tune_target, search=search, n_jobs=inner_jobs, full_cv=full_cv), y.columns))
+    else:
+        results = [tune_target(target, search=search, full_cv=full_cv) for target in y.columns]
+
+    for target, best_model, target_metrics in results:
+        models[target] = best_model
+        metrics[target] = target_metrics
+
+    feature_preserver.training_history.append(training_entry('full', len(X), models))
+    return models, metrics, feature_preserver
 
-        # Choose one of these search methods:
-        # Option 1: Comprehensive but slower
-        # model_tuner = GridSearchCV(base_model, param_grid, cv=3, scoring='r2', n_jobs=-1)
 
-        # Option 2: Faster but less comprehensive
-        model_tuner = RandomizedSearchCV(base_model, param_grid, n_iter=20,
-                                         cv=3, scoring='r2', random_state=42, n_jobs=-1)
+def training_entry(mode, rows, models, **delta):
+    """One FeaturePreserver.training_history record"""
+    return {'mode': mode, 'rows': int(rows), 'trees': forest_trees(models),
+            'trained_at': datetime.now().isoformat(timespec='seconds'), **delta}
 
-        model_tuner.fit(X_train, y_train[target])
-        best_model = model_tuner.best_estimator_
-        models[target] = best_model
 
-        print(f"Best parameters for {target}: {model_tuner.best_params_}")
+def extend_feature_preserver(feature_preserver, df):
+    """
+    Add the skills and keywords of new labelled rows that the preserver has not seen yet.
 
-        preds = best_model.predict(X_test)
+    The vectorizers, imputer and feature_cols stay as trained, so the existing trees keep
+    their inputs. Returns the added skills and keywords.
+    """
+    new_skills = collect_skills(df) - feature_preserver.all_skills
+    job_text = df['jobRole'].fillna('').astype(str) + ' ' + df['jobDescription'].fillna('').astype(str)
+    new_keywords = set(common_job_keywords(job_text)) - feature_preserver.keywords
 
-        # Calculate metrics including MAPE
-        mae = mean_absolute_error(y_test[target], preds)
-        rmse = np.sqrt(mean_squared_error(y_test[target], preds))
+    feature_preserver.all_skills.update(new_skills)
+    feature_preserver.keywords.update(new_keywords)
+    return sorted(new_skills, key=str), sorted(new_keywords)
 
-        # Calculate MAPE
-        actual = y_test[target].values
-        mape = np.mean(np.abs((actual - preds) / (actual + 1e-10))) * 100
 
-        metrics[target] = {
-            'mae': mae,
-            'rmse': rmse,
-            'mse': mean_squared_error(y_test[target], preds),
-            'r2': r2_score(y_test[target], preds),
-            'mape': mape,
-            'feature_importance': dict(zip(X.columns, best_model.feature_importances_))
-        }
+def grow_forests(models, X_new, y_new, seen_rows, extra_trees=None):
+    """
+    Warm-start every forest in models with extra trees fitted on the new rows only.
 
-        # Add cross-validation scores for monitoring
-        cv_scores = cross_val_score(best_model, X, y[target], cv=5, scoring='r2')
-        metrics[target]['cv_r2_mean'] = cv_scores.mean()
-        metrics[target]['cv_r2_std'] = cv_scores.std()
+    Unless extra_trees is given, a forest grows in proportion to the new data
+    (n_estimators * new rows / rows seen so far, at least one tree), so old and new rows keep
+    roughly equal weight per row. Returns the number of trees added per model.
+    """
+    trees_added = {}
+    for name, model in models.items():
+        forest, targets = (model['model'], model['targets']) if name == MULTI_OUTPUT_KEY else (model, name)
+        n_extra = extra_trees or max(1, round(forest.n_estimators * len(X_new) / seen_rows))
+        forest.set_params(warm_start=True, n_estimators=forest.n_estimators + n_extra)
+        forest.fit(X_new, y_new[targets])
+        forest.set_params(warm_start=False)  # A later fit() starts from scratch again
+        trees_added[name] = n_extra
+        print(f"Grew {name} by {n_extra} trees to {forest.n_estimators}")
+    return trees_added
+
+
+def update_model(models, feature_preserver, new_df, seen_rows, extra_trees=None):
+    """
+    Incrementally train the models on new labelled rows without revisiting old ones.
 
-        print(f"Cross-validation R² for {target}: {cv_scores.mean():.4f} ± {cv_scores.std():.4f}")
+    Extends the skill/keyword sets, warm-starts the forests on the new rows and appends the
+    delta to feature_preserver.training_history. Only the new rows are featurized and fitted,
+    so the cost follows the size of the update rather than the whole history.
 
-    return models, metrics, feature_preserver
+    Args:
+        models: Trained models, updated in place
+        feature_preserver: Feature setup of the models, updated in place
+        new_df: New labelled rows, preprocessed like the training data
+        seen_rows: Labelled rows the models were trained on so far
+        extra_trees: Trees to add to every forest (default: proportional to the new rows)
+
+    Returns:
+        The training_history entry for this update
+    """
+    new_skills, new_keywords = extend_feature_preserver(feature_preserver, new_df)
+    print(f"New skills: {len(new_skills)}, new keywords: {new_keywords}")
+
+    X_new, _ = prepare_features(new_df, feature_preserver)
+    X_new, y_new = labelled_rows(X_new, new_df)
+    if X_new.empty:
+        raise ValueError("No labelled rows (with a non-zero target score) in the new data")
+
+    # How well the current models do on data they have not seen yet
+    before = predict_targets(models, X_new)
+    for target in TARGET_COLUMNS:
+        print(f"R² on new rows before update for {target}: {r2_score(y_new[target], before[target]):.4f}")
+
+    trees_added = grow_forests(models, X_new, y_new, seen_rows, extra_trees)
+    entry = training_entry('incremental', len(X_new), models, trees_added=trees_added,
+                           new_skills=new_skills, new_keywords=new_keywords)
+    feature_preserver.training_history.append(entry)
+    return entry
 
 
 def predict_scores(models, feature_preserver, new_data, include_categories=True):
@@ -319,10 +782,7 @@ def predict_scores(models, feature_preserver, new_data, include_categories=True)
         DataFrame with predicted scores and optional match categories
     """
     X, _ = prepare_features(new_data, feature_preserver)
-    predictions = {}
-
-    for target, model in models.items():
-        predictions[target] = model.predict(X)
+    predictions = predict_targets(models, X)
 
     # Create DataFrame with continuous predictions
     prediction_df = pd.DataFrame(predictions, index=new_data.index)
@@ -546,10 +1006,10 @@ def analyze_high_match_distribution(clustered_df):
     return distribution
 
 
-if __name__ == "__main__":
-    # Load and preprocess data
+def load_labelled_data(path):
+    """Read a labelled CSV (dataset3.csv layout) and clean it for training"""
     df = (
-        pd.read_csv("dataset3.csv")
+        pd.read_csv(path)
         .drop(columns=[
             'minSalary',
             'maxSalary',
@@ -557,10 +1017,7 @@ if __name__ == "__main__":
             'resumeExperience__company',
             'resumeEducation__school'
         ], errors='ignore')
-        .dropna(subset=[
-            'skillsScore', 'experienceScore', 'locationScore',
-            'roleSimilarity', 'educationScore', 'matchScore'
-        ])
+        .dropna(subset=TARGET_COLUMNS)
         .fillna({
             'jobRole': '',
             'jobDescription': '',
@@ -576,15 +1033,94 @@ if __name__ == "__main__":
     text_columns = ['jobRole', 'jobDescription', 'resumeEducation__description',
                     'resumeSummary', 'resumeLocation', 'jobLocation']
     df[text_columns] = df[text_columns].astype(str)
+    return df
+
+
+def ensure_training_history(models, feature_preserver, history_file):
+    """
+    Give models saved before training_history existed a 'full' entry for their training rows.
+
+    The row count is what a full run on history_file would have used.
+    """
+    if getattr(feature_preserver, 'training_history', None):
+        return
+    targets = load_labelled_data(history_file)[TARGET_COLUMNS].fillna(0)
+    rows = (targets != 0).any(axis=1).sum()
+    feature_preserver.training_history = [training_entry('full', rows, models, trained_at=None)]
+
+
+# The scorer loads its artifact from its own directory, whatever the trainer's working directory is
+SCORER_ARTIFACT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend', 'services', 'model_artifact')
+
+
+def save_model(models, feature_preserver, model_file, artifact_dir, X_check):
+    """Pickle the models with their feature setup and export the scorer's artifact (unless artifact_dir is None)"""
+    with open(model_file, 'wb') as f:
+        pickle.dump((models, feature_preserver), f)
+    print(f"\nTrained model and feature preserver saved to {model_file}")
+
+    if artifact_dir:
+        # Flat forests are verified against model.predict on X_check before they are written
+        version = export_artifact(models, feature_preserver, X_check, artifact_dir)
+        print(f"Model artifact version {version} saved to {artifact_dir}/")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the resume/job matching models and save them to model.pkl")
+    parser.add_argument('--multi-output', action='store_true',
+                        help="Train one forest for all six targets instead of one forest per target")
+    parser.add_argument('--search', choices=['random', 'halving'], default='random',
+                        help="Hyperparameter search: 20 random candidates on every fold, or successive halving")
+    parser.add_argument('--target-workers', type=int, default=1,
+                        help="Processes tuning the per-target forests in parallel")
+    parser.add_argument('--full-cv', action='store_true',
+                        help="Run the extra 5-fold cross-validation instead of reporting the search's fold scores")
+    parser.add_argument('--no-artifact', action='store_true',
+                        help="Only write model.pkl, not the versioned artifact directory used by the scorer")
+    parser.add_argument('--artifact-dir', default=SCORER_ARTIFACT_DIR,
+                        help="Where to export the scorer's artifact (default: model_artifact next to "
+                             "backend/services/app.py, where the scorer looks for it)")
+    parser.add_argument('--incremental', metavar='NEW_CSV',
+                        help="Grow the saved model.pkl with extra trees fitted on the labelled rows of NEW_CSV "
+                             "and append those rows to dataset3.csv, instead of retraining from scratch")
+    parser.add_argument('--extra-trees', type=int,
+                        help="Trees added to each forest by --incremental (default: proportional to the new rows)")
+    args = parser.parse_args()
+    artifact_dir = None if args.no_artifact else args.artifact_dir
+
+    if args.incremental:
+        with open('model.pkl', 'rb') as f:
+            trained_models, feature_preserver = pickle.load(f)
+        ensure_training_history(trained_models, feature_preserver, 'dataset3.csv')
+        seen_rows = sum(entry['rows'] for entry in feature_preserver.training_history)
+
+        new_df = load_labelled_data(args.incremental)
+        print(f"Updating models trained on {seen_rows} rows with {len(new_df)} new rows...")
+        update_model(trained_models, feature_preserver, new_df, seen_rows, args.extra_trees)
+
+        X_check, _ = prepare_features(new_df.head(500), feature_preserver)
+        save_model(trained_models, feature_preserver, 'model.pkl', artifact_dir, X_check)
+
+        # Keep dataset3.csv complete, so a later full retrain sees the new rows too
+        history_columns = pd.read_csv('dataset3.csv', nrows=0).columns
+        pd.read_csv(args.incremental).reindex(columns=history_columns).to_csv(
+            'dataset3.csv', mode='a', header=False, index=False)
+        print(f"Appended {args.incremental} to dataset3.csv")
+        sys.exit(0)
+
+    # Load and preprocess data
+    df = load_labelled_data("dataset3.csv")
 
     # Train model and get feature preservation setup
     print("Training models...")
-    trained_models, performance_metrics, feature_preserver = train_model(df)
+    trained_models, performance_metrics, feature_preserver = train_model(
+        df, multi_output=args.multi_output, search=args.search,
+        target_workers=args.target_workers, full_cv=args.full_cv
+    )
 
     # === NEW: Save trained model and feature preserver ===
-    with open('model.pkl', 'wb') as f:
-        pickle.dump((trained_models, feature_preserver), f)
-    print("\nTrained model and feature preserver saved to model.pkl")
+    X_check = prepare_features(df.head(500), feature_preserver)[0] if artifact_dir else None
+    save_model(trained_models, feature_preserver, 'model.pkl', artifact_dir, X_check)
 
     print("\nModel performance metrics:")
     for target, metric in performance_metrics.items():
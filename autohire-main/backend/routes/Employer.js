@@ -9,10 +9,9 @@ require('dotenv').config();
 const passport = require("passport");
 const { authMiddleware } = require('../middleware');
 const { matchResumesForJob } = require('../services/JobMatch');
-const fs = require('fs');
-const { spawn } = require('child_process');
-const path = require('path');
+const { scoringJobData, queueJobScoring, updateJob, removeJob } = require('../services/Scorer');
 const CLIENT_URL = process.env.CLIENT_URL
+const HIGH_MATCH_SCORE = 60; // matchScore above which app.py puts a candidate in cluster 2
 // Zod Schema for Employer Signup
 const employerSignupSchema = z.object({
   fullName: z.string().min(3, 'Name should have at least 3 characters'),
@@ -182,155 +181,64 @@ router.post('/jobpost', authMiddleware, async (req, res) => {
     // Respond immediately after saving the job post
     res.status(200).json({ message: 'Job post created successfully. Matching process started.', jobId: newJobPost._id }); // Use _id
 
-    // --- Asynchronous ML processing starts here ---
-    const jobData = {
-      jobRole: newJobPost.jobRole,
-      jobDescription: newJobPost.jobDescription,
-      jobSkills: newJobPost.skills,
-      requiredExperience: newJobPost.experience,
-      jobLocation: newJobPost.jobLocation
-      // Add city/country if needed by ML, e.g., if jobLocation is onsite
-      // city: newJobPost.city,
-      // country: newJobPost.country
-    };
-
-    // Batch query to fetch all resumes with only the needed fields
-    // Consider adding filtering if the number of applicants is very large
-    const resumes = await JobApplicant.find({}, {
-      _id: 1, // Ensure we get the applicant ID
-      'resume.professionalSummary': 1,
-      'resume.skills.name': 1, // Get only the skill names
-      'resume.experience.startDate': 1,
-      'resume.experience.endDate': 1,
-      'resume.personal.city': 1,
-      'resume.personal.country': 1,
-      'resume.education.description': 1
-    }).lean(); // Use lean() for faster queries when full mongoose docs aren't needed
-
-    // Re-map resume skills to be just an array of strings if needed by python script
-    const processedResumes = resumes.map(r => ({
-        ...r,
-        resume: {
-            ...r.resume,
-            skills: r.resume.skills ? r.resume.skills.map(s => s.name) : []
-        }
-    }));
-
-
-    const inputData = {
-      jobId: newJobPost._id.toString(), // Pass the actual job post ID
-      jobData,
-      resumes: processedResumes // Use processed resumes
-    };
-
-    // Use a unique filename, e.g., based on job ID
-    const inputFilePath = path.join(__dirname, `../temp/ml_input_${newJobPost._id}.json`);
-    // Ensure temp directory exists
-    fs.mkdirSync(path.dirname(inputFilePath), { recursive: true });
-    fs.writeFileSync(inputFilePath, JSON.stringify(inputData));
-
-
-    const pythonExecutable = process.env.PYTHON_EXECUTABLE || 'python'; // Allow configuring python path
-    const scriptPath = path.join(__dirname, '../services/app.py');
-    const pythonProcess = spawn(pythonExecutable, [scriptPath, inputFilePath]);
-
-
-    let output = '';
-    pythonProcess.stdout.on('data', (data) => {
-      output += data.toString();
+    // Make the post available to applicant job recommendations (no-op until the scorer's job store is built)
+    updateJob(newJobPost).catch(storeError => {
+      console.error(`Failed to add job ${newJobPost._id} to the scorer's job store:`, storeError.message);
     });
 
-    let errorOutput = '';
-    pythonProcess.stderr.on('data', (data) => {
-      errorOutput += data.toString(); // Capture stderr
-      console.error(`Python stderr for Job ${newJobPost._id}: ${data}`); // Log stderr immediately with context
-    });
-
-    // Handle python process exit/error events
-    pythonProcess.on('error', (spawnError) => {
-        console.error(`Failed to start Python process for Job ${newJobPost._id}:`, spawnError);
-         // Clean up the input file even on spawn error
-         fs.unlink(inputFilePath, (err) => {
-            if (err) console.error(`Error deleting temp input file ${inputFilePath}:`, err);
+    // --- Asynchronous ML processing starts here ---
+    const jobData = scoringJobData(newJobPost);
+
+    // Only high matches (cluster 2, i.e. matchScore > 60) are kept, so the scorer is asked to
+    // return just those, as compact { _id, matchScore } results.
+    const highMatchSelection = { scoreAbove: HIGH_MATCH_SCORE };
+
+    // Save the high matches of one batch of results to the JobApplication collection.
+    // With chunked scoring this runs once per chunk, so matches are stored as soon as they are known.
+    let highMatchTotal = 0;
+    const saveHighMatches = async (highMatchCandidates) => {
+      highMatchTotal += highMatchCandidates.length;
+
+      // --- Save High Matches to JobApplication collection ---
+      if (highMatchCandidates.length > 0) {
+        console.log(`Saving ${highMatchCandidates.length} high-match applications to DB for Job ${newJobPost._id}...`);
+        const applicationPromises = highMatchCandidates.map(candidate => {
+          const newApplication = new JobApplication({
+            jobPost: newJobPost._id, // Reference to the JobPost document
+            jobApplicant: candidate._id, // Reference to the JobApplicant document
+            matchScore: candidate.matchScore // The calculated score
           });
-    });
-
-
-    pythonProcess.on('close', async (code) => { // Make the handler async
-      console.log(`Python process for Job ${newJobPost._id} closed with code ${code}`); // Log the exit code
-
-      if (errorOutput) { // Log accumulated stderr if any
-        console.error(`Accumulated Python stderr for Job ${newJobPost._id}:`, errorOutput);
-      }
-
-      if (code === 0) {
-        try {
-          const result = JSON.parse(output);
-          console.log(`ML matching result received for Job ${newJobPost._id}.`); // Log confirmation
-
-          let highMatchCandidates = [];
-          if (result && Array.isArray(result.matchResults)) {
-            highMatchCandidates = result.matchResults
-              .filter(candidate => candidate.cluster === 2) // Keep only cluster 2
-              .map(candidate => ({ // Extract desired fields
-                _id: candidate._id, // This is the JobApplicant _id
-                matchScore: candidate.matchScore
-              }));
-
-            console.log(`Found ${highMatchCandidates.length} high-match candidates (cluster 2) for Job ${newJobPost._id}.`);
-
-            // --- Save High Matches to JobApplication collection ---
-            if (highMatchCandidates.length > 0) {
-              console.log(`Saving ${highMatchCandidates.length} high-match applications to DB for Job ${newJobPost._id}...`);
-              const applicationPromises = highMatchCandidates.map(candidate => {
-                const newApplication = new JobApplication({
-                  jobPost: newJobPost._id, // Reference to the JobPost document
-                  jobApplicant: candidate._id, // Reference to the JobApplicant document
-                  matchScore: candidate.matchScore // The calculated score
-                });
-                return newApplication.save()
-                  .catch(saveError => {
-                    // Log error for individual save failure but continue trying others
-                    console.error(`Failed to save application for applicant ${candidate._id} to job ${newJobPost._id}:`, saveError);
-                    return null; // Indicate failure for this specific application
-                  });
-              });
-
-              // Wait for all save operations to complete
-              const savedApplications = await Promise.all(applicationPromises);
-              const successfulSaves = savedApplications.filter(app => app !== null).length;
-              console.log(`Successfully saved ${successfulSaves} applications for Job ${newJobPost._id}.`);
-              if (successfulSaves < highMatchCandidates.length) {
-                  console.error(`Failed to save ${highMatchCandidates.length - successfulSaves} applications for Job ${newJobPost._id}.`);
-              }
-            }
-            // -------------------------------------------------------
-
-          } else {
-            console.warn(`ML script output for Job ${newJobPost._id} did not contain a valid matchResults array.`);
-          }
-
-        } catch (parseError) {
-          console.error(`Error parsing Python output JSON for Job ${newJobPost._id}:`, parseError);
-          console.error('Raw Python output:', output);
-        }
-      } else {
-        console.error(`Python process for Job ${newJobPost._id} exited with error code ${code}`);
-        // Even if code is non-zero, try to parse output in case it's an error JSON
-        try {
-            const errorResult = JSON.parse(output);
-            console.error('Python error output (parsed):', errorResult);
-        } catch (e) {
-            // If parsing fails, it wasn't the JSON error message we expected
-            console.error('Raw Python output (on error):', output);
+          return newApplication.save()
+            .catch(saveError => {
+              // Log error for individual save failure but continue trying others
+              console.error(`Failed to save application for applicant ${candidate._id} to job ${newJobPost._id}:`, saveError);
+              return null; // Indicate failure for this specific application
+            });
+        });
+
+        // Wait for all save operations to complete
+        const savedApplications = await Promise.all(applicationPromises);
+        const successfulSaves = savedApplications.filter(app => app !== null).length;
+        console.log(`Successfully saved ${successfulSaves} applications for Job ${newJobPost._id}.`);
+        if (successfulSaves < highMatchCandidates.length) {
+            console.error(`Failed to save ${highMatchCandidates.length - successfulSaves} applications for Job ${newJobPost._id}.`);
         }
       }
-      // Clean up the input file (optional but good practice)
-      fs.unlink(inputFilePath, (err) => {
-          if (err) console.error(`Error deleting temp input file ${inputFilePath}:`, err);
-          else console.log(`Deleted temp input file: ${inputFilePath}`);
-      });
-    });
+      // -------------------------------------------------------
+    };
+
+    // Score against the persistent Python scoring server (services/Scorer.js)
+    // instead of spawning app.py and re-loading the model for every job post.
+    // Posts arriving together are batched, so the applicants (the candidate store, or MongoDB
+    // streamed in chunks) are featurized once for the whole batch.
+    try {
+      await queueJobScoring(newJobPost._id.toString(), jobData, saveHighMatches, highMatchSelection);
+      console.log(`ML matching result received for Job ${newJobPost._id}.`); // Log confirmation
+      console.log(`Found ${highMatchTotal} high-match candidates (cluster 2) for Job ${newJobPost._id}.`);
+    } catch (scoreError) {
+      console.error(`ML scoring failed for Job ${newJobPost._id}:`, scoreError.message);
+      return;
+    }
 
     // Note: The main response was already sent. This ML part runs in the background.
 
@@ -480,6 +388,10 @@ router.delete('/jobs/:id', authMiddleware, async (req, res) => {
     await JobPost.findByIdAndDelete(id);
     
     res.status(200).json({ message: 'Job post deleted successfully' });
+
+    removeJob(id).catch(storeError => {
+      console.error(`Failed to remove job ${id} from the scorer's job store:`, storeError.message);
+    });
   } catch (error) {
     console.error('Error deleting job post:', error);
     res.status(500).json({ message: 'Failed to delete job post', error: error.message });
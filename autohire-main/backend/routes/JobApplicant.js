@@ -8,7 +8,8 @@ const passport = require("passport");
 const CLIENT_URL = process.env.CLIENT_URL
 const { z } = require('zod'); // Import Zod
 const { authMiddleware } = require('../middleware');
-const { JobApplication } = require('../db');
+const { JobApplication, JobPost } = require('../db');
+const { updateCandidate, recommendJobs } = require('../services/Scorer');
 
 // Zod Schema for Job Applicant Signup
 const applicantSignupSchema = z.object({
@@ -203,6 +204,11 @@ router.post('/save-resume', authMiddleware, async (req, res) => {
     await applicant.save();
 
     res.status(200).json({ message: 'Resume saved successfully' });
+
+    // Keep the scorer's candidate store in sync (no-op unless SCORER_CANDIDATE_STORE=true)
+    updateCandidate(applicant._id).catch(storeError => {
+      console.error(`Failed to update candidate store for applicant ${applicant._id}:`, storeError.message);
+    });
   } catch (err) {
     if (err instanceof z.ZodError) {
       return res.status(400).json({ message: err.errors.map((e) => e.message) });
@@ -227,6 +233,29 @@ router.get('/resume', authMiddleware, async (req, res) => {
   }
 });
 
+// Open job posts ranked by the scorer's matchScore for the logged-in applicant's resume
+router.get('/recommended-jobs', authMiddleware, async (req, res) => {
+  try {
+    const limit = Math.min(parseInt(req.query.limit, 10) || 10, 50);
+    const recommendations = await recommendJobs(req.user.id, limit);
+    if (!recommendations) {
+      return res.status(404).json({ message: 'Save a resume to get job recommendations' });
+    }
+
+    const jobIds = recommendations.jobMatches.map(match => match.jobId);
+    const jobPosts = await JobPost.find({ _id: { $in: jobIds } },
+      { jobId: 1, companyName: 1, position: 1, jobRole: 1, jobLocation: 1, country: 1, city: 1, skills: 1, experience: 1 }).lean();
+    const jobPostsById = new Map(jobPosts.map(jobPost => [jobPost._id.toString(), jobPost]));
+
+    res.status(200).json(recommendations.jobMatches
+      .filter(match => jobPostsById.has(match.jobId)) // Skip posts deleted since the scorer saw them
+      .map(match => ({ ...jobPostsById.get(match.jobId), matchScore: match.matchScore })));
+  } catch (err) {
+    console.error(err);
+    res.status(500).json({ message: 'Error fetching recommended jobs', error: err.message });
+  }
+});
+
 router.post('/apply', authMiddleware, async (req, res) => {
   try {
     const { jobId } = req.body;
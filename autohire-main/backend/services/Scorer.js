@@ -0,0 +1,456 @@
+const { spawn } = require('child_process');
+const path = require('path');
+const readline = require('readline');
+const { JobApplicant, JobPost } = require('../db');
+
+// Long-lived Python scoring process (services/app.py --serve).
+// The model is unpickled once at startup; each request is one JSON line on stdin
+// and each response is one JSON line on stdout, matched back by requestId.
+const pythonExecutable = process.env.PYTHON_EXECUTABLE || 'python'; // Allow configuring python path
+const scriptPath = path.join(__dirname, 'app.py');
+
+const SCORER_CHUNK_SIZE = parseInt(process.env.SCORER_CHUNK_SIZE, 10) || 500; // Resumes per scoreChunk request
+const SCORER_BATCH_WINDOW_MS = parseInt(process.env.SCORER_BATCH_WINDOW_MS, 10) || 200; // How long queued job posts wait for others
+const SCORER_REQUEST_TIMEOUT_MS = parseInt(process.env.SCORER_REQUEST_TIMEOUT_MS, 10) || 300000; // Per request, unless the caller sets one
+const SCORER_BUILD_TIMEOUT_MS = parseInt(process.env.SCORER_BUILD_TIMEOUT_MS, 10) || 1800000; // buildStore featurizes every applicant
+
+let scorerProcess = null;
+let nextRequestId = 1;
+const pendingRequests = new Map(); // requestId -> { resolve, reject, timer }
+
+function failPendingRequests(error) {
+  for (const { reject, timer } of pendingRequests.values()) {
+    clearTimeout(timer);
+    reject(error);
+  }
+  pendingRequests.clear();
+}
+
+function handleScorerLine(line) {
+  if (!line.trim()) return;
+
+  let message;
+  try {
+    message = JSON.parse(line);
+  } catch (parseError) {
+    console.error('Error parsing scorer output line:', parseError, line.slice(0, 500));
+    return;
+  }
+
+  if (message.event === 'ready') {
+    console.log('Python scoring server is ready.');
+    return;
+  }
+
+  const pending = pendingRequests.get(message.requestId);
+  if (!pending) {
+    console.warn('Scorer response with no matching request:', line.slice(0, 500));
+    return;
+  }
+  pendingRequests.delete(message.requestId);
+  clearTimeout(pending.timer);
+
+  if (message.error) {
+    const error = new Error(message.error);
+    error.response = message;
+    pending.reject(error);
+  } else {
+    pending.resolve(message);
+  }
+}
+
+function getScorerProcess() {
+  if (scorerProcess) return scorerProcess;
+
+  const child = spawn(pythonExecutable, [scriptPath, '--serve']);
+  scorerProcess = child;
+
+  readline.createInterface({ input: child.stdout }).on('line', handleScorerLine);
+  child.stderr.on('data', (data) => {
+    console.error(`Python scorer stderr: ${data}`);
+  });
+
+  // Forget a process that failed or exited, so the next request spawns a fresh one
+  const discard = (error) => {
+    if (scorerProcess === child) {
+      scorerProcess = null;
+      jobStoreReady = null; // The job store lives in the process; the next one rebuilds it
+    }
+    failPendingRequests(error);
+  };
+
+  child.on('error', (spawnError) => {
+    console.error('Failed to start Python scoring server:', spawnError);
+    discard(spawnError);
+  });
+
+  // Writing to a process that died raises EPIPE here instead of in the write callback alone
+  child.stdin.on('error', (stdinError) => {
+    console.error('Error writing to Python scoring server:', stdinError);
+    discard(stdinError);
+    child.kill();
+  });
+
+  child.on('close', (code) => {
+    console.error(`Python scoring server exited with code ${code}`);
+    discard(new Error(`Python scoring server exited with code ${code}`));
+  });
+
+  return child;
+}
+
+// Send one request to the scoring server and resolve with its parsed response.
+// Rejects if no response arrives within timeoutMs; a late response is then ignored.
+function sendScorerRequest(payload, timeoutMs = SCORER_REQUEST_TIMEOUT_MS) {
+  return new Promise((resolve, reject) => {
+    const requestId = nextRequestId++;
+    const timer = setTimeout(() => {
+      if (pendingRequests.delete(requestId)) {
+        reject(new Error(`Scorer request ${payload.op} timed out after ${timeoutMs} ms`));
+      }
+    }, timeoutMs);
+    pendingRequests.set(requestId, { resolve, reject, timer });
+    getScorerProcess().stdin.write(JSON.stringify({ ...payload, requestId }) + '\n', (writeError) => {
+      if (writeError && pendingRequests.delete(requestId)) {
+        clearTimeout(timer);
+        reject(writeError);
+      }
+    });
+  });
+}
+
+// Only the applicant fields the scorer reads
+const scoringResumeProjection = {
+  _id: 1, // Ensure we get the applicant ID
+  'resume.professionalSummary': 1,
+  'resume.skills.name': 1, // Get only the skill names
+  'resume.experience.startDate': 1,
+  'resume.experience.endDate': 1,
+  'resume.personal.city': 1,
+  'resume.personal.country': 1,
+  'resume.education.description': 1
+};
+
+// Re-map resume skills to be just an array of strings, as expected by app.py
+function toScoringResume(r) {
+  return {
+    ...r,
+    resume: {
+      ...r.resume,
+      skills: r.resume && r.resume.skills ? r.resume.skills.map(s => s.name) : []
+    }
+  };
+}
+
+// Job location in the training data's format: "Remote" or "Onsite, <country>, <city>".
+// The scorer matches each comma-separated part against the resume's "<city>, <country>".
+function scoringJobLocation(jobPost) {
+  if (jobPost.jobLocation !== 'onsite') return 'Remote';
+  return ['Onsite', jobPost.country, jobPost.city].filter(Boolean).join(', ');
+}
+
+// The jobData the scorer reads from a JobPost document
+function scoringJobData(jobPost) {
+  return {
+    jobRole: jobPost.jobRole,
+    jobDescription: jobPost.jobDescription,
+    jobSkills: jobPost.skills,
+    requiredExperience: jobPost.experience,
+    jobLocation: scoringJobLocation(jobPost) // "Remote" or "Onsite, <country>, <city>", as in training
+  };
+}
+
+const scoringJobProjection = { jobRole: 1, jobDescription: 1, skills: 1, experience: 1, jobLocation: 1, country: 1, city: 1 };
+
+async function fetchScoringResumes(filter = {}) {
+  const resumes = await JobApplicant.find(filter, scoringResumeProjection).lean(); // Use lean() for faster queries when full mongoose docs aren't needed
+  return resumes.map(toScoringResume);
+}
+
+// Optional result selection, sent along with a job (see MatchSelection in app.py):
+//   { scoreAbove: 60 } -> only candidates with matchScore > 60
+//   { topK: 50 }       -> only the 50 best candidates by matchScore
+// Either one makes matchResults compact: [{ _id, matchScore }] instead of all six scores.
+//   { targets: ['skillsScore'] } -> return (and predict) only these scores besides matchScore;
+//                                   compact selections predict only matchScore by default
+//   { prefilter: { minShortlist: 2000, auditSize: 500, minRecall: 0.95 } }
+//                                -> with scoreAbove/topK, fully score only a shortlist ranked by cheap
+//                                   skill/role/experience/location signals, grown until the
+//                                   selection's recall estimated from a random audit sample reaches
+//                                   minRecall (see Prefilter in app.py); jobs whose qualifiers are
+//                                   hard to tell apart may still end up scoring every candidate
+//   { minSkillOverlap: 2 }       -> only score candidates listing at least 2 of the job's skills,
+//                                   found through the scorer's inverted skill index (SkillIndex in app.py)
+
+// Score every resume against one job post. Resolves with { jobId, matchResults }.
+function scoreJob(jobId, jobData, resumes, selection = {}) {
+  return sendScorerRequest({ op: 'score', jobId, jobData, resumes, ...selection });
+}
+
+// Score every resume against several job posts, featurizing the resumes once.
+// jobs is [{ jobId, jobData, ...per-job selection }]; selection applies to jobs that don't override it.
+// Resolves with { jobResults: [{ jobId, matchResults } or { jobId, error }] }, in the order of jobs.
+function scoreJobs(jobs, resumes, selection = {}) {
+  return sendScorerRequest({ op: 'score', jobs, resumes, ...selection });
+}
+
+// Score all applicants against one job post without loading them all at once.
+// Resumes are read from a MongoDB cursor and sent in chunks of chunkSize; onResults is
+// awaited with each chunk's matchResults before the next chunk is read, so memory stays
+// bounded by the chunk and high matches can be saved as soon as they are known.
+// With a topK selection the merged top-K arrives once, after the last chunk.
+async function scoreJobInChunks(jobId, jobData, onResults, { chunkSize = SCORER_CHUNK_SIZE, ...selection } = {}) {
+  await sendScorerRequest({ op: 'openJob', jobId, jobData, ...selection });
+  let closed = false;
+  try {
+    const cursor = JobApplicant.find({}, scoringResumeProjection).lean().cursor({ batchSize: chunkSize });
+    let chunk = [];
+    for await (const applicant of cursor) {
+      chunk.push(toScoringResume(applicant));
+      if (chunk.length >= chunkSize) {
+        const { matchResults } = await sendScorerRequest({ op: 'scoreChunk', jobId, resumes: chunk });
+        chunk = [];
+        await onResults(matchResults);
+      }
+    }
+    if (chunk.length > 0) {
+      const { matchResults } = await sendScorerRequest({ op: 'scoreChunk', jobId, resumes: chunk });
+      await onResults(matchResults);
+    }
+
+    const { matchResults } = await sendScorerRequest({ op: 'closeJob', jobId });
+    closed = true;
+    if (matchResults && matchResults.length > 0) await onResults(matchResults);
+  } finally {
+    if (!closed) sendScorerRequest({ op: 'closeJob', jobId }).catch(() => {}); // Best effort; the scorer may have exited
+  }
+}
+
+// Score several jobs against all applicants, reading and featurizing each chunk once for all of them.
+// onResults(jobId, matchResults) is awaited with each job's share of every chunk, and with the
+// merged top-K of each job after the last chunk when the selection has topK.
+async function scoreJobsInChunks(jobs, onResults, { chunkSize = SCORER_CHUNK_SIZE, ...selection } = {}) {
+  const opened = [];
+  try {
+    for (const { jobId, jobData } of jobs) {
+      await sendScorerRequest({ op: 'openJob', jobId, jobData, ...selection });
+      opened.push(jobId);
+    }
+    const jobIds = [...opened];
+    const scoreChunk = async (chunk) => {
+      const { jobResults } = await sendScorerRequest({ op: 'scoreChunk', jobIds, resumes: chunk });
+      for (const { jobId, matchResults } of jobResults) await onResults(jobId, matchResults);
+    };
+
+    const cursor = JobApplicant.find({}, scoringResumeProjection).lean().cursor({ batchSize: chunkSize });
+    let chunk = [];
+    for await (const applicant of cursor) {
+      chunk.push(toScoringResume(applicant));
+      if (chunk.length >= chunkSize) {
+        await scoreChunk(chunk);
+        chunk = [];
+      }
+    }
+    if (chunk.length > 0) await scoreChunk(chunk);
+
+    while (opened.length > 0) {
+      const { jobId, matchResults } = await sendScorerRequest({ op: 'closeJob', jobId: opened[0] });
+      opened.shift();
+      if (matchResults && matchResults.length > 0) await onResults(jobId, matchResults);
+    }
+  } finally {
+    for (const jobId of opened) sendScorerRequest({ op: 'closeJob', jobId }).catch(() => {}); // Best effort; the scorer may have exited
+  }
+}
+
+// --- Candidate store (SCORER_CANDIDATE_STORE=true) ---
+// The scorer keeps featurized resumes in a memory-mapped store on disk, so a job post
+// only sends the job and no resumes have to be fetched or re-featurized per post.
+const useCandidateStore = process.env.SCORER_CANDIDATE_STORE === 'true';
+let candidateStoreReady = null;
+
+// Store scoring shortlists candidates before running the forests (SCORER_PREFILTER=true).
+const storePrefilter = process.env.SCORER_PREFILTER === 'true' ? {
+  minShortlist: parseInt(process.env.SCORER_MIN_SHORTLIST, 10) || 2000,
+  minRecall: parseFloat(process.env.SCORER_MIN_RECALL) || 0.95
+} : undefined;
+
+// The store on disk outlives the server, so it is only rebuilt from all applicants when it is
+// missing, was built for another model or store format, or holds a different number of
+// applicants than MongoDB (edits missed while the server was down); later edits are upserted.
+async function loadCandidateStore() {
+  const [status, applicantCount] = await Promise.all([
+    sendScorerRequest({ op: 'storeStatus' }),
+    JobApplicant.countDocuments()
+  ]);
+  if (status.current && status.count === applicantCount) {
+    console.log(`Using the candidate store built at ${status.builtAt} with ${status.count} candidates.`);
+    return status;
+  }
+  console.log(`Rebuilding the candidate store (exists: ${status.exists}, current: ${status.current}, ` +
+              `count: ${status.count}, applicants: ${applicantCount}).`);
+  const resumes = await fetchScoringResumes();
+  return sendScorerRequest({ op: 'buildStore', resumes }, SCORER_BUILD_TIMEOUT_MS);
+}
+
+function ensureCandidateStore() {
+  if (!candidateStoreReady) {
+    candidateStoreReady = loadCandidateStore()
+      .catch(buildError => {
+        candidateStoreReady = null; // Retry the build on the next request
+        throw buildError;
+      });
+  }
+  return candidateStoreReady;
+}
+
+async function scoreJobFromStore(jobId, jobData, selection = {}) {
+  await ensureCandidateStore();
+  return sendScorerRequest({ op: 'score', source: 'store', jobId, jobData, prefilter: storePrefilter, ...selection });
+}
+
+// Score several jobs against the store in one request.
+// Resolves with { jobResults: [{ jobId, matchResults } or { jobId, error }] }, in the order of jobs.
+async function scoreJobsFromStore(jobs, selection = {}) {
+  await ensureCandidateStore();
+  return sendScorerRequest({ op: 'score', source: 'store', jobs, prefilter: storePrefilter, ...selection });
+}
+
+// --- Job post batches ---
+// Job posts that arrive close together (e.g. a bulk import) are scored as one batch, so the
+// applicants are read and featurized once for all of them instead of once per post.
+const queuedBatches = new Map(); // JSON of the selection -> jobs waiting to be scored with it
+
+// Score a new job post against all applicants (the store, or MongoDB in chunks), together with
+// the other posts queued within SCORER_BATCH_WINDOW_MS that use the same selection.
+// onResults(matchResults) receives this job's results; resolves once all of them were handled.
+function queueJobScoring(jobId, jobData, onResults, selection = {}) {
+  return new Promise((resolve, reject) => {
+    const key = JSON.stringify(selection);
+    if (!queuedBatches.has(key)) {
+      queuedBatches.set(key, []);
+      setTimeout(() => {
+        const queued = queuedBatches.get(key);
+        queuedBatches.delete(key);
+        runJobBatch(queued, selection);
+      }, SCORER_BATCH_WINDOW_MS);
+    }
+    queuedBatches.get(key).push({ jobId, jobData, onResults, resolve, reject });
+  });
+}
+
+async function runJobBatch(queued, selection) {
+  const queuedById = new Map(queued.map(job => [job.jobId, job]));
+  const jobs = queued.map(({ jobId, jobData }) => ({ jobId, jobData }));
+  const failures = new Map(); // jobId -> error; one job's failure doesn't stop the others
+  const deliver = async (jobId, matchResults) => {
+    if (failures.has(jobId)) return;
+    try {
+      await queuedById.get(jobId).onResults(matchResults);
+    } catch (resultsError) {
+      failures.set(jobId, resultsError);
+    }
+  };
+
+  try {
+    console.log(`Scoring a batch of ${jobs.length} job post(s).`);
+    if (useCandidateStore) {
+      const { jobResults } = await scoreJobsFromStore(jobs, selection);
+      for (const { jobId, matchResults, error } of jobResults) {
+        if (error) failures.set(jobId, new Error(error));
+        else await deliver(jobId, matchResults || []);
+      }
+    } else {
+      await scoreJobsInChunks(jobs, deliver, selection);
+    }
+  } catch (batchError) {
+    for (const { jobId } of jobs) if (!failures.has(jobId)) failures.set(jobId, batchError);
+  }
+  for (const job of queued) {
+    if (failures.has(job.jobId)) job.reject(failures.get(job.jobId));
+    else job.resolve();
+  }
+}
+
+// Refresh one applicant's row after their resume changes.
+async function updateCandidate(applicantId) {
+  if (!useCandidateStore || !candidateStoreReady) return; // The initial build will read the saved resume
+  await candidateStoreReady;
+  const resumes = await fetchScoringResumes({ _id: applicantId });
+  if (resumes.length > 0) {
+    await sendScorerRequest({ op: 'upsertCandidates', resumes });
+  } else {
+    await sendScorerRequest({ op: 'removeCandidates', ids: [String(applicantId)] });
+  }
+}
+
+// Stored applicants most like one applicant: members of the same candidateCluster (the
+// scorer's persistent BIRCH clustering of the store), ranked by skill, role and education
+// similarity. Resolves with { candidateId, candidateCluster, similarCandidates: [{ _id, similarity, candidateCluster }] }.
+async function findSimilarCandidates(applicantId, topK = 10) {
+  await ensureCandidateStore();
+  return sendScorerRequest({ op: 'similar', candidateId: String(applicantId), topK });
+}
+
+// --- Job store ---
+// The scorer keeps the featurized open job posts in memory, so one resume can be scored
+// against all of them in a single batch (applicant job recommendations).
+let jobStoreReady = null;
+
+function toScorerJob(jobPost) {
+  return { jobId: jobPost._id.toString(), jobData: scoringJobData(jobPost) };
+}
+
+// Send every job post once per scorer process; later posts and deletions are applied as they happen.
+function ensureJobStore() {
+  if (!jobStoreReady) {
+    const ready = JobPost.find({}, scoringJobProjection).lean()
+      .then(jobPosts => sendScorerRequest({ op: 'buildJobStore', jobs: jobPosts.map(toScorerJob) }))
+      .catch(buildError => {
+        if (jobStoreReady === ready) jobStoreReady = null; // Retry the build on the next request
+        throw buildError;
+      });
+    jobStoreReady = ready;
+  }
+  return jobStoreReady;
+}
+
+async function updateJob(jobPost) {
+  if (!jobStoreReady) return; // The initial build will read the saved post
+  await jobStoreReady;
+  await sendScorerRequest({ op: 'upsertJobs', jobs: [toScorerJob(jobPost)] });
+}
+
+async function removeJob(jobPostId) {
+  if (!jobStoreReady) return;
+  await jobStoreReady;
+  await sendScorerRequest({ op: 'removeJobs', jobIds: [String(jobPostId)] });
+}
+
+// Open job posts ranked for one applicant's saved resume. Resolves with
+// { candidateId, jobMatches: [{ jobId, matchScore }] } (best first), or null without a resume.
+async function recommendJobs(applicantId, topK = 10) {
+  await ensureJobStore();
+  const resumes = await fetchScoringResumes({ _id: applicantId, resume: { $exists: true } });
+  if (resumes.length === 0) return null;
+  return sendScorerRequest({ op: 'matchResume', resume: resumes[0], topK });
+}
+
+module.exports = {
+  useCandidateStore,
+  scoringJobLocation,
+  scoringJobData,
+  fetchScoringResumes,
+  scoreJob,
+  scoreJobs,
+  scoreJobInChunks,
+  scoreJobFromStore,
+  scoreJobsInChunks,
+  scoreJobsFromStore,
+  queueJobScoring,
+  updateCandidate,
+  findSimilarCandidates,
+  updateJob,
+  removeJob,
+  recommendJobs
+};
@@ -3,19 +3,28 @@ import json
 import pickle
 import pandas as pd
 import numpy as np
-from datetime import datetime
+from datetime import datetime, timezone
+from functools import lru_cache
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import normalize
 from sklearn.impute import SimpleImputer
+from scipy.sparse import csr_matrix, vstack as sparse_vstack
+from scipy.optimize import nnls
+from scipy.stats import t as student_t
 # Explicitly importing potentially missing standard libraries if prepare_features uses them
+from collections.abc import Mapping
 from collections import Counter # Used in keyword extraction if called during training phase (won't be here, but good practice)
 import traceback # For detailed error logs
 import os # <-- Import os module
+import argparse
+import hashlib
+import heapq
+import re
+import shutil
+import sqlite3
 
-# --- Add Birch and Scaler imports ---
-from sklearn.cluster import Birch
-from sklearn.preprocessing import StandardScaler
-# ------------------------------------
+from sklearn.cluster import AgglomerativeClustering
+from sklearn.metrics import pairwise_distances_argmin
 
 # Helper to print errors to stderr
 def eprint(*args, **kwargs):
@@ -32,80 +41,656 @@ class FeaturePreserver:
         self.edu_vectorizer = None
         self.imputer = SimpleImputer(strategy='mean')
         self.keywords = set()
+        self.training_history = []  # One entry per full or incremental training run (see app2.py)
 
-def calculate_single_experience(start_date_str, end_date_str):
-    """Calculate experience from single start/end date strings."""
+# End dates meaning the role is still ongoing
+ONGOING_END_DATES = ('present', 'null', '', 'current')
+
+@lru_cache(maxsize=65536)
+def parse_resume_date(date_str):
+    """
+    Parse one resume date: '%m/%Y' as used in training, else ISO format as stored by MongoDB.
+
+    Returns (datetime64 in UTC, is_timezone_aware), or None if neither format matches.
+    Memoized: the same month strings repeat across thousands of applicants. Non-string
+    dates raise TypeError.
+    """
     try:
-        if pd.isnull(start_date_str) or pd.isnull(end_date_str):
-            return 0
+        parsed = datetime.strptime(date_str, '%m/%Y')
+    except ValueError:
+        try:
+            # Handle ISO format like 'YYYY-MM-DDTHH:MM:SS.sssZ' from MongoDB
+            parsed = datetime.fromisoformat(str(date_str).replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    is_aware = parsed.tzinfo is not None
+    if is_aware:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return np.datetime64(parsed, 'us'), is_aware
+
+def years_from_days(days):
+    """Rounded years for an array of day counts, like max(0, round(days / 365.25, 1)) per role."""
+    days = np.asarray(days, dtype=np.int64)
+    # Round each distinct day count once; Python's round() keeps results identical to the per-role version
+    unique_days, inverse = np.unique(days, return_inverse=True)
+    return np.array([open_role_years(d) for d in unique_days.tolist()], dtype=float)[inverse.ravel()]
+
+def role_experience(start_dates, end_dates):
+    """
+    Split every role's experience into closed_years and open_starts (parallel date lists in).
+
+    Roles with a parseable end date contribute closed_years. Ongoing roles ('Present',
+    or an end date that can't be parsed) get their start date in open_starts instead
+    (NaT otherwise), because their length depends on today's date (see open_role_years).
+    Dates go through the memoized parse_resume_date and the year differences of all
+    closed roles are computed in one array operation.
+    """
+    n_roles = len(start_dates)
+    starts = np.full(n_roles, np.datetime64('NaT'), dtype='datetime64[us]')
+    ends = starts.copy()
+    start_aware = np.zeros(n_roles, dtype=bool)
+    end_aware = np.zeros(n_roles, dtype=bool)
+    has_start = np.zeros(n_roles, dtype=bool)
+    has_end = np.zeros(n_roles, dtype=bool)
+    unparsed_starts, unparsed_ends = Counter(), Counter()
+
+    for i, (start_date_str, end_date_str) in enumerate(zip(start_dates, end_dates)):
+        try:
+            if pd.isnull(start_date_str) or pd.isnull(end_date_str):
+                continue
+            parsed_end = None # None means the role is still ongoing
+            if str(end_date_str).lower() not in ONGOING_END_DATES:
+                parsed_end = parse_resume_date(end_date_str)
+                if parsed_end is None:
+                    unparsed_ends[end_date_str] += 1
+            parsed_start = parse_resume_date(start_date_str)
+        except (TypeError, ValueError) as e:
+            eprint(f"Error calculating single experience: {e} for dates '{start_date_str}', '{end_date_str}'")
+            continue
+        if parsed_start is None:
+            unparsed_starts[start_date_str] += 1 # Cannot calculate without valid start date
+            continue
+        starts[i], start_aware[i] = parsed_start
+        has_start[i] = True
+        if parsed_end is not None:
+            ends[i], end_aware[i] = parsed_end
+            has_end[i] = True
+
+    # One warning per distinct bad date instead of one per role
+    for date_str, count in unparsed_ends.items():
+        eprint(f"Warning: Could not parse end date '{date_str}' ({count} roles). Using current time.")
+    for date_str, count in unparsed_starts.items():
+        eprint(f"Error: Could not parse start date '{date_str}' ({count} roles). Returning 0 experience.")
+
+    # A timezone-aware start can't be compared with the naive current time; this has always scored 0
+    is_open = has_start & ~has_end & ~start_aware
+    open_starts = np.where(is_open, starts, np.datetime64('NaT'))
+
+    # Aware and naive dates can't be compared either, which has always scored 0
+    closed = has_end & (start_aware == end_aware)
+    backwards = closed & (starts > ends)
+    if backwards.any():
+        eprint(f"Warning: {int(backwards.sum())} roles start after their end date. Returning 0 experience for them.")
+    closed &= ~backwards
+
+    closed_years = np.zeros(n_roles)
+    closed_years[closed] = years_from_days((ends[closed] - starts[closed]) // np.timedelta64(1, 'D'))
+    return closed_years, open_starts
+
+def experience_parts(start_date_str, end_date_str):
+    """Split one role's experience into (closed_years, open_start); see role_experience."""
+    closed_years, open_starts = role_experience([start_date_str], [end_date_str])
+    open_start = None if np.isnat(open_starts[0]) else open_starts[0].astype(datetime)
+    return closed_years[0], open_start
+
+def open_role_years(days):
+    """Years for an ongoing role that has run for `days` days, rounded like closed roles (0 if it starts in the future)."""
+    return max(0, round(days / 365.25, 1))
 
-        end_date_str_lower = str(end_date_str).lower()
-        # Handle common representations of ongoing jobs
-        if end_date_str_lower in ['present', 'null', '', 'current']:
-             end_date = datetime.now()
+def calculate_single_experience(start_date_str, end_date_str):
+    """Calculate experience from single start/end date strings."""
+    closed_years, open_start = experience_parts(start_date_str, end_date_str)
+    if open_start is None:
+        return closed_years
+    return open_role_years((datetime.now() - open_start).days)
+
+class ExperienceParts:
+    """
+    Per-candidate experience, split so it can be stored and evaluated later.
+
+    closed_years is the summed length of roles that have an end date. Ongoing roles are
+    kept as start dates (ragged: open_starts[open_indptr[i]:open_indptr[i + 1]] belong
+    to candidate i) and measured against the current date in years().
+    """
+    def __init__(self, closed_years, open_indptr, open_starts):
+        self.closed_years = np.asarray(closed_years, dtype=float)
+        self.open_indptr = np.asarray(open_indptr, dtype=np.int64)
+        self.open_starts = np.asarray(open_starts, dtype='datetime64[us]')
+
+    def __len__(self):
+        return len(self.closed_years)
+
+    @classmethod
+    def from_roles(cls, roles_per_candidate):
+        """Build from one list of (startDate, endDate) pairs per candidate; all roles are summed."""
+        owners, start_dates, end_dates = [], [], []
+        for position, roles in enumerate(roles_per_candidate):
+            for start_date, end_date in roles:
+                owners.append(position)
+                start_dates.append(start_date)
+                end_dates.append(end_date)
+        n_candidates = len(roles_per_candidate)
+        owners = np.array(owners, dtype=np.int64)
+        closed, open_starts = role_experience(start_dates, end_dates)
+
+        is_open = ~np.isnat(open_starts)
+        open_indptr = np.concatenate([[0], np.cumsum(np.bincount(owners[is_open], minlength=n_candidates))])
+        return cls(np.bincount(owners, weights=closed, minlength=n_candidates), open_indptr, open_starts[is_open])
+
+    @classmethod
+    def from_years(cls, years):
+        """Experience that is already known in years (nothing left open)."""
+        return cls(years, np.zeros(len(years) + 1, dtype=np.int64), [])
+
+    def years(self, now=None):
+        """Total experience per candidate as of `now` (default: the current time)."""
+        years = self.closed_years.copy()
+        if len(self.open_starts):
+            now = np.datetime64(now or datetime.now(), 'us')
+            open_years = years_from_days((now - self.open_starts) // np.timedelta64(1, 'D'))
+            owners = np.repeat(np.arange(len(self)), np.diff(self.open_indptr))
+            years += np.bincount(owners, weights=open_years, minlength=len(self))
+        return years
+
+    def take(self, positions):
+        counts = np.diff(self.open_indptr)[positions]
+        open_indptr = np.concatenate([[0], np.cumsum(counts)])
+        starts = [self.open_starts[self.open_indptr[p]:self.open_indptr[p + 1]] for p in positions]
+        return ExperienceParts(self.closed_years[positions], open_indptr,
+                               np.concatenate(starts) if starts else self.open_starts[:0])
+
+    @staticmethod
+    def concat(parts):
+        offsets = np.cumsum([0] + [len(part.open_starts) for part in parts[:-1]])
+        open_indptr = np.concatenate([[0]] + [part.open_indptr[1:] + offset for part, offset in zip(parts, offsets)])
+        return ExperienceParts(np.concatenate([part.closed_years for part in parts]), open_indptr,
+                               np.concatenate([part.open_starts for part in parts]))
+
+def skill_vocabulary(feature_preserver):
+    """
+    Fixed column order for the preserved skill set.
+
+    Returns (skills, skill_index, job_cols, resume_cols) where skill_index maps each
+    skill to its column in the incidence matrices. Cached on the preserver so the
+    f-string column names are built once per loaded model rather than per request.
+    """
+    cached = getattr(feature_preserver, '_skill_vocabulary', None)
+    if cached is not None and len(cached[0]) == len(feature_preserver.all_skills):
+        return cached
+
+    skills = sorted(feature_preserver.all_skills, key=str)
+    skill_index = {skill: i for i, skill in enumerate(skills)}
+    job_cols = [f'job_has_{skill}' for skill in skills]
+    resume_cols = [f'resume_has_{skill}' for skill in skills]
+    feature_preserver._skill_vocabulary = (skills, skill_index, job_cols, resume_cols)
+    return feature_preserver._skill_vocabulary
+
+class KeywordMatcher:
+    """
+    Counts how many of the preserved keywords occur in each resume text (substring match).
+
+    Built once per keyword set. Each text is lower-cased once instead of once per keyword,
+    texts repeated within a batch are counted once, and counts are memoized per distinct
+    lower-cased text, so an unchanged resume is not searched again.
+    """
+    def __init__(self, keywords, memo_size=16384):
+        self.keywords = frozenset(keywords)
+        self._ordered = tuple(sorted(self.keywords))
+        self._count_text = lru_cache(maxsize=memo_size)(self._count_uncached)
+
+    def _count_uncached(self, text):
+        return sum(1 for keyword in self._ordered if keyword in text)
+
+    def count(self, texts):
+        """Number of distinct keywords found in each text, as an int64 array."""
+        codes, distinct = pd.factorize(pd.Series([str(text).lower() for text in texts], dtype=object))
+        counts = np.array([self._count_text(text) for text in distinct], dtype=np.int64)
+        return counts[codes] if len(counts) else np.zeros(len(codes), dtype=np.int64)
+
+def keyword_matcher(feature_preserver):
+    """KeywordMatcher for the preserved keywords, cached on the preserver like skill_vocabulary."""
+    cached = getattr(feature_preserver, '_keyword_matcher', None)
+    if cached is None or cached.keywords != feature_preserver.keywords:
+        feature_preserver._keyword_matcher = KeywordMatcher(feature_preserver.keywords)
+    return feature_preserver._keyword_matcher
+
+def skill_incidence_matrix(skill_lists, skill_index):
+    """
+    Sparse 0/1 matrix with one row per entry of skill_lists and one column per vocabulary skill.
+
+    Entries that are not lists/sets count as having no skills, and skills outside the
+    vocabulary are ignored, matching the per-skill `skill in skills` checks it replaces.
+    """
+    indptr = [0]
+    indices = []
+    for row_skills in skill_lists:
+        if isinstance(row_skills, (list, set)):
+            columns = set()
+            for skill in row_skills:
+                try:
+                    column = skill_index.get(skill)
+                except TypeError: # Unhashable entry (e.g. a raw skill object) can't be a vocabulary skill
+                    continue
+                if column is not None:
+                    columns.add(column)
+            indices.extend(sorted(columns))
+        indptr.append(len(indices))
+
+    data = np.ones(len(indices), dtype=np.int8)
+    return csr_matrix((data, np.asarray(indices, dtype=np.int32), np.asarray(indptr, dtype=np.int64)),
+                      shape=(len(indptr) - 1, len(skill_index)))
+
+def unseen_skills(skill_lists, skill_index):
+    """Per entry of skill_lists, the sorted distinct string skills outside the vocabulary (see SkillIndex)."""
+    return [tuple(sorted({skill for skill in row_skills if isinstance(skill, str) and skill not in skill_index}))
+            if isinstance(row_skills, (list, set)) else () for row_skills in skill_lists]
+
+def row_sums(matrix):
+    """Per-row sum of a sparse matrix as a flat ndarray."""
+    return np.asarray(matrix.sum(axis=1)).ravel()
+
+def rowwise_dot(a, b):
+    """
+    Dot product of each row of `a` with the same row of `b` (both sparse).
+
+    A single-row operand is broadcast against every row of the other one, which is how
+    one job's vectors are compared with a whole batch of candidates.
+    """
+    if a.shape[0] == 1 and b.shape[0] != 1:
+        a, b = b, a
+    if b.shape[0] == 1 and a.shape[0] != 1:
+        return np.asarray((a @ b.T).todense()).ravel()
+    return row_sums(a.multiply(b))
+
+def broadcast_to_rows(values, n_rows):
+    """Repeat single-job values (1-D, or a 1 x k array) for every candidate row; row-aligned values pass through."""
+    values = np.asarray(values)
+    if values.shape[0] == n_rows:
+        return values
+    return np.repeat(values, n_rows, axis=0)
+
+def rowwise_cosine_similarity(a, b):
+    """
+    Cosine similarity between each row of `a` and the same row of `b`.
+
+    Both sparse matrices are L2-normalized once and multiplied elementwise, so the whole
+    batch is one sparse operation instead of a cosine_similarity call per row pair.
+    Empty rows stay all-zero after normalization and therefore score 0.
+    """
+    return rowwise_dot(normalize(a, norm='l2'), normalize(b, norm='l2'))
+
+def as_text(value):
+    """Scalar equivalent of .fillna('').astype(str) for a single job field."""
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return ''
+    return str(value)
+
+# The leading number of "0-1 years", "5+ years" or "3 years": digits with at most one '.',
+# up to the first '-', '+' or space (or the end of the string)
+REQUIRED_YEARS_PATTERN = re.compile(r'(\d+\.?\d*|\.\d+)(?=[-+ ]|\Z)')
+
+@lru_cache(maxsize=1024)
+def required_years_from_text(text):
+    """Cached per distinct string: job posts reuse a handful of values like "2-4 years"."""
+    match = REQUIRED_YEARS_PATTERN.match(text)
+    return float(match.group(1)) if match else 0
+
+def parse_required_years(required_experience):
+    """Minimum years from strings like "0-1 years", "5+ years" or "3 years"; 0 when unparseable."""
+    if not pd.notnull(required_experience):
+        return 0
+    return required_years_from_text(str(required_experience))
+
+def experience_match(required_years, actual_experience):
+    """1 for an exact match, falling linearly to 0 as actual experience moves away from the required years."""
+    required_years = np.asarray(required_years, dtype=float)
+    match = np.maximum(0, 1 - np.abs(required_years - np.asarray(actual_experience, dtype=float))
+                       / np.maximum(required_years, 1))
+    return np.nan_to_num(match, nan=0.0)
+
+def job_location_parts(job_location):
+    """Lower-cased comma-separated parts of a job location, or None for a remote job (matches every resume)."""
+    if str(job_location).lower() == 'remote':
+        return None
+    return [loc.strip().lower() for loc in str(job_location).split(',') if loc.strip()]
+
+def location_match(job_locations, resume_locations):
+    """
+    1 where the resume location contains any part of the job location (or the job is remote), else 0.
+
+    A single job location is broadcast against every resume location; its parts are
+    split and lower-cased once instead of once per row.
+    """
+    n_rows = len(resume_locations) if len(job_locations) == 1 else len(job_locations)
+    parts_cache = {}
+    matches = np.zeros(n_rows, dtype=np.int64)
+    for i in range(n_rows):
+        job_location = job_locations[i if len(job_locations) > 1 else 0]
+        resume_location = resume_locations[i if len(resume_locations) > 1 else 0]
+        if not (pd.notnull(job_location) and pd.notnull(resume_location)):
+            continue
+        if job_location not in parts_cache:
+            parts_cache[job_location] = job_location_parts(job_location)
+        parts = parts_cache[job_location]
+        resume_location = str(resume_location).lower()
+        if parts is None or any(part in resume_location for part in parts):
+            matches[i] = 1
+    return matches
+
+class LocationIndex:
+    """
+    Inverted index from each distinct (lower-cased) resume location to its candidates.
+
+    Applicants share a few hundred locations ("bangalore, india"), so a job's location
+    parts are substring-searched once per distinct location instead of once per candidate,
+    and each part's hits are memoized for the next job. match() gives exactly what
+    location_match would for the same job, and candidates() the matching positions, which
+    can also narrow down who is scored at all.
+    """
+    def __init__(self, locations):
+        # codes[i] is candidate i's position in self.locations; -1 when it has no location
+        self.codes, distinct = pd.factorize(pd.Series(locations, dtype=object))
+        self.locations = list(distinct)
+        self._part_hits = {} # job location part -> bool per distinct location
+
+    def _location_hits(self, parts):
+        hits = np.zeros(len(self.locations) + 1, dtype=bool) # Trailing False is what code -1 reads
+        for part in parts:
+            if part not in self._part_hits:
+                self._part_hits[part] = np.array([part in location for location in self.locations], dtype=bool)
+            hits[:-1] |= self._part_hits[part]
+        return hits
+
+    def match(self, job_location):
+        """location_match of one job location against every candidate: 1 where it matches, else 0."""
+        if not pd.notnull(job_location):
+            return np.zeros(len(self.codes), dtype=np.int64)
+        parts = job_location_parts(job_location)
+        if parts is None:
+            hits = np.ones(len(self.locations) + 1, dtype=bool) # Remote jobs match every located resume
+            hits[-1] = False
         else:
-             # Attempt parsing known formats, prioritize '%m/%Y' as used in training
-             try:
-                 end_date = datetime.strptime(end_date_str, '%m/%Y')
-             except ValueError:
-                 try:
-                     # Handle ISO format like 'YYYY-MM-DDTHH:MM:SS.sssZ' from MongoDB
-                     end_date = datetime.fromisoformat(str(end_date_str).replace('Z', '+00:00'))
-                 except ValueError:
-                     eprint(f"Warning: Could not parse end date '{end_date_str}'. Using current time.")
-                     end_date = datetime.now() # Fallback
-
-
-        # Attempt parsing start date
+            hits = self._location_hits(parts)
+        return hits[self.codes].astype(np.int64)
+
+    def candidates(self, job_location):
+        """Positions of the candidates whose location matches the job location."""
+        return np.flatnonzero(self.match(job_location))
+
+class JobContext:
+    """
+    Job-side features, computed once and broadcast against a candidate-only frame.
+
+    Holds one row per job: skill incidence, TF-IDF vectors of the role and education
+    texts, parsed required years and the raw location. for_job() featurizes the single
+    jobData dict sent by Node and for_jobs() several of them (see JobStore); from_frame()
+    builds a row-aligned context from a frame that still repeats the job columns on every row.
+    """
+    def __init__(self, roles, descriptions, skills, required_experience, locations, feature_preserver):
+        _, skill_index, _, _ = skill_vocabulary(feature_preserver)
+        self.size = len(roles)
+        self.skill_matrix = skill_incidence_matrix(skills, skill_index)
+        self.skill_count = row_sums(self.skill_matrix)
+        self.required_years = np.array([parse_required_years(x) for x in required_experience], dtype=float)
+        self.locations = list(locations)
+
+        job_text = [f"{as_text(role)} {as_text(description)}" for role, description in zip(roles, descriptions)]
+        job_edu_text = [as_text(role) for role in roles] # Using jobRole as proxy for required education level/type
+        self.role_vectors = self._transform(feature_preserver.role_vectorizer, job_text, 'role')
+        self.edu_vectors = self._transform(feature_preserver.edu_vectorizer, job_edu_text, 'education')
+
+    @staticmethod
+    def _transform(vectorizer, texts, name):
+        if not vectorizer:
+            eprint(f"Warning: {name} vectorizer not found in feature_preserver. Setting {name} similarity to 0.")
+            return None
         try:
-            start_date = datetime.strptime(start_date_str, '%m/%Y')
-        except ValueError:
-            try:
-                start_date = datetime.fromisoformat(str(start_date_str).replace('Z', '+00:00'))
-            except ValueError:
-                 eprint(f"Error: Could not parse start date '{start_date_str}'. Returning 0 experience.")
-                 return 0 # Cannot calculate without valid start date
+            return vectorizer.transform(texts)
+        except Exception as e:
+            eprint(f"Error vectorizing job {name} text: {e}. Setting {name} similarity to 0.")
+            return None
+
+    @classmethod
+    def for_job(cls, job_data, feature_preserver):
+        return cls.for_jobs([job_data], feature_preserver)
+
+    @classmethod
+    def for_jobs(cls, job_datas, feature_preserver):
+        return cls([job_data.get('jobRole') for job_data in job_datas],
+                   [job_data.get('jobDescription') for job_data in job_datas],
+                   [job_data.get('jobSkills', []) for job_data in job_datas], # Expecting lists of strings
+                   [job_data.get('requiredExperience') for job_data in job_datas], # e.g., "2-4 years"
+                   [job_data.get('jobLocation') for job_data in job_datas], # e.g., "Remote" or "Onsite, India, Pune"
+                   feature_preserver)
+
+    @classmethod
+    def _from_rows(cls, skill_matrix, required_years, locations, role_vectors, edu_vectors):
+        job_context = cls.__new__(cls)
+        job_context.size = skill_matrix.shape[0]
+        job_context.skill_matrix = skill_matrix
+        job_context.skill_count = row_sums(skill_matrix)
+        job_context.required_years = required_years
+        job_context.locations = list(locations)
+        job_context.role_vectors = role_vectors
+        job_context.edu_vectors = edu_vectors
+        return job_context
+
+    def take(self, positions):
+        """Subset of jobs, in the order given by positions (repeats allowed)."""
+        positions = np.asarray(positions, dtype=np.int64)
+        return self._from_rows(self.skill_matrix[positions], self.required_years[positions],
+                               [self.locations[p] for p in positions],
+                               self.role_vectors[positions] if self.role_vectors is not None else None,
+                               self.edu_vectors[positions] if self.edu_vectors is not None else None)
+
+    @classmethod
+    def concat(cls, parts):
+        """Stack several contexts (built against the same model) into one."""
+        def stack(matrices):
+            return None if any(m is None for m in matrices) else sparse_vstack(matrices, format='csr')
+        return cls._from_rows(stack([part.skill_matrix for part in parts]),
+                              np.concatenate([part.required_years for part in parts]),
+                              [location for part in parts for location in part.locations],
+                              stack([part.role_vectors for part in parts]), stack([part.edu_vectors for part in parts]))
+
+    @classmethod
+    def from_frame(cls, df, feature_preserver):
+        def column(name):
+            return df[name].tolist() if name in df.columns else [None] * len(df)
+        return cls(column('jobRole'), column('jobDescription'), column('jobSkills'),
+                   column('requiredExperience'), column('jobLocation'), feature_preserver)
+
+class CandidateFeatures:
+    """
+    Job-independent resume-side features for a batch of candidates.
+
+    Everything here depends only on the resume and the loaded model, so it can be
+    computed once and reused for every job (see CandidateFeatureCache). Rows line up
+    with `index`/`ids`; pairwise_features() combines them with a JobContext.
+    """
+    def __init__(self, index, ids, skill_matrix, role_vectors, edu_vectors, locations,
+                 keyword_match_count, experience, clusters=None, extra_skills=None):
+        self.index = index
+        self.ids = list(ids)
+        self.skill_matrix = skill_matrix             # (rows x skills) int8 incidence
+        self.skill_count = row_sums(skill_matrix)
+        self.role_vectors = role_vectors             # TF-IDF of resumeSummary, or None
+        self.edu_vectors = edu_vectors               # TF-IDF of the education description, or None
+        self.locations = list(locations)             # Lower-cased resumeLocation, None when missing
+        self.keyword_match_count = np.asarray(keyword_match_count)
+        self.experience = experience                 # ExperienceParts, evaluated as of now
+        self.actual_experience = experience.years()
+        self.clusters = clusters                     # Applicant-base cluster per candidate from the store, or None
+        # resumeSkills outside the preserved vocabulary, for SkillIndex; not kept in the store's rows
+        self.extra_skills = list(extra_skills) if extra_skills is not None else [()] * len(self.ids)
+        self._location_index = None
+
+    @property
+    def location_index(self):
+        """LocationIndex over self.locations, built on first use and kept with the batch."""
+        if self._location_index is None:
+            self._location_index = LocationIndex(self.locations)
+        return self._location_index
+
+    def __len__(self):
+        return len(self.ids)
+
+    def take(self, positions):
+        """Subset of candidates, in the order given by positions."""
+        positions = np.asarray(positions, dtype=np.int64)
+        return CandidateFeatures(
+            pd.RangeIndex(len(positions)), [self.ids[p] for p in positions], self.skill_matrix[positions],
+            self.role_vectors[positions] if self.role_vectors is not None else None,
+            self.edu_vectors[positions] if self.edu_vectors is not None else None,
+            [self.locations[p] for p in positions], self.keyword_match_count[positions],
+            self.experience.take(positions), self.clusters[positions] if self.clusters is not None else None,
+            [self.extra_skills[p] for p in positions])
+
+    @staticmethod
+    def concat(parts):
+        """Stack several batches (built against the same model) into one."""
+        def stack(matrices):
+            return None if any(m is None for m in matrices) else sparse_vstack(matrices, format='csr')
+        clusters = [part.clusters for part in parts]
+        return CandidateFeatures(
+            pd.RangeIndex(sum(len(part) for part in parts)), [i for part in parts for i in part.ids],
+            stack([part.skill_matrix for part in parts]), stack([part.role_vectors for part in parts]),
+            stack([part.edu_vectors for part in parts]), [loc for part in parts for loc in part.locations],
+            np.concatenate([part.keyword_match_count for part in parts]),
+            ExperienceParts.concat([part.experience for part in parts]),
+            None if any(c is None for c in clusters) else np.concatenate(clusters),
+            [skills for part in parts for skills in part.extra_skills])
+
+    @classmethod
+    def from_frame(cls, df, feature_preserver):
+        """Featurize a candidate frame as built by build_candidate_frame()."""
+        _, skill_index, _, _ = skill_vocabulary(feature_preserver)
+        resume_skills = df['resumeSkills'] if 'resumeSkills' in df.columns else [None] * len(df)
+        skill_matrix = skill_incidence_matrix(resume_skills, skill_index)
+
+        resume_text = df['resumeSummary'].fillna('').astype(str)
+        resume_edu_text = df['resumeEducation__description'].fillna('').astype(str)
+        role_vectors = cls._transform(feature_preserver.role_vectorizer, resume_text, 'role')
+        edu_vectors = cls._transform(feature_preserver.edu_vectorizer, resume_edu_text, 'education')
+
+        locations = [str(loc).lower() if pd.notnull(loc) else None
+                     for loc in (df['resumeLocation'] if 'resumeLocation' in df.columns else [None] * len(df))]
+
+        # Keyword match count
+        keyword_match_count = np.zeros(len(df), dtype=np.int64)
+        if feature_preserver.keywords:
+            keyword_match_count = keyword_matcher(feature_preserver).count(resume_text)
+        else:
+            eprint("Warning: No keywords found in feature_preserver for keyword matching.")
 
-        if start_date > end_date:
-             eprint(f"Warning: Start date {start_date_str} is after end date {end_date_str}. Returning 0 experience.")
-             return 0 # Start date cannot be after end date
+        return cls(df.index, df['_id'] if '_id' in df.columns else df.index, skill_matrix, role_vectors,
+                   edu_vectors, locations, keyword_match_count, candidate_experience(df),
+                   extra_skills=unseen_skills(resume_skills, skill_index))
 
-        experience_years = (end_date - start_date).days / 365.25
-        return max(0, round(experience_years, 1))
-    except Exception as e:
-        eprint(f"Error calculating single experience: {e} for dates '{start_date_str}', '{end_date_str}'")
-        return 0
+    @staticmethod
+    def _transform(vectorizer, texts, name):
+        if not vectorizer:
+            return None
+        try:
+            return vectorizer.transform(texts)
+        except Exception as e:
+            eprint(f"Error vectorizing resume {name} text: {e}. Setting {name} similarity to 0.")
+            return None
+
+    def records(self):
+        """One compact dict per candidate (sparse rows as index/value arrays) for the on-disk cache."""
+        def sparse_row(matrix, i):
+            if matrix is None:
+                return None
+            start, end = matrix.indptr[i], matrix.indptr[i + 1]
+            return matrix.indices[start:end].copy(), matrix.data[start:end].copy()
+
+        return [{
+            'skills': sparse_row(self.skill_matrix, i)[0],
+            'role': sparse_row(self.role_vectors, i),
+            'edu': sparse_row(self.edu_vectors, i),
+            'location': self.locations[i],
+            'keywords': int(self.keyword_match_count[i]),
+            'extra_skills': self.extra_skills[i],
+        } for i in range(len(self))]
+
+    @classmethod
+    def from_records(cls, records, df, feature_preserver):
+        """Rebuild a batch from cached records, row-aligned with the candidate frame df."""
+        skills, _, _, _ = skill_vocabulary(feature_preserver)
+
+        def stack(rows, n_columns, dtype):
+            if any(row is None for row in rows):
+                return None
+            indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+            indptr[1:] = np.cumsum([len(row[0]) for row in rows])
+            indices = np.concatenate([row[0] for row in rows]) if rows else np.zeros(0, dtype=np.int32)
+            data = np.concatenate([row[1] for row in rows]) if rows else np.zeros(0, dtype=dtype)
+            return csr_matrix((data.astype(dtype, copy=False), indices, indptr), shape=(len(rows), n_columns))
+
+        def vocabulary_size(vectorizer):
+            return len(vectorizer.vocabulary_) if vectorizer else 0
+
+        skill_rows = [(r['skills'], np.ones(len(r['skills']), dtype=np.int8)) for r in records]
+        return cls(df.index, df['_id'],
+                   stack(skill_rows, len(skills), np.int8),
+                   stack([r['role'] for r in records], vocabulary_size(feature_preserver.role_vectorizer), np.float64),
+                   stack([r['edu'] for r in records], vocabulary_size(feature_preserver.edu_vectorizer), np.float64),
+                   [r['location'] for r in records],
+                   [r['keywords'] for r in records],
+                   candidate_experience(df),
+                   extra_skills=[r['extra_skills'] for r in records])
+
+def candidate_experience(df):
+    """ExperienceParts per candidate row. Not cached: 'Present' end dates move with today's date."""
+    if 'resumeExperience' in df.columns:
+        return ExperienceParts.from_roles(df['resumeExperience'])
+    # Use pre-calculated experience passed in 'actual_experience_calculated'
+    if 'actual_experience_calculated' in df.columns:
+        return ExperienceParts.from_years(df['actual_experience_calculated'].fillna(0).to_numpy(dtype=float))
+    eprint("Warning: 'actual_experience_calculated' column not found. Setting actual_experience to 0.")
+    return ExperienceParts.from_years(np.zeros(len(df)))
+
+def prepare_features(df, feature_preserver, job_context=None):
+    """
+    Prepare features for prediction using preserved setup.
 
-def prepare_features(df, feature_preserver):
-    """Prepare features for prediction using preserved setup"""
+    df holds one row per candidate. The job side comes from job_context (computed once
+    per job and broadcast); without one, the job columns are read from every row of df.
+    """
     eprint("Entering prepare_features...") # Debug print
-    df = df.copy()
-    is_training = False # This function is used for prediction here
+    if job_context is None:
+        job_context = JobContext.from_frame(df, feature_preserver)
+    candidates = CandidateFeatures.from_frame(df, feature_preserver)
+    return pairwise_features(job_context, candidates, feature_preserver), feature_preserver
+
+def pairwise_features(job_context, candidates, feature_preserver):
+    """Combine job-side and candidate-side features into the model's feature matrix."""
+    df = pd.DataFrame(index=candidates.index)
+    n_rows = len(candidates)
 
     # --- Skill Features ---
-    skill_data = {}
-    if not feature_preserver.all_skills:
+    # The job_has_*/resume_has_* columns are read straight off the incidence matrices.
+    skills, _, job_skill_cols, resume_skill_cols = skill_vocabulary(feature_preserver)
+    if not skills:
          eprint("Warning: FeaturePreserver has no skills recorded from training.")
 
-    for skill in feature_preserver.all_skills:
-        # Check jobSkills (list of strings)
-        if 'jobSkills' in df.columns:
-             skill_data[f'job_has_{skill}'] = df['jobSkills'].apply(
-                 lambda skills: skill in skills if isinstance(skills, (list, set)) else False
-             ).astype(int)
-        else:
-             skill_data[f'job_has_{skill}'] = 0
-
-        # Check resumeSkills (list of strings)
-        if 'resumeSkills' in df.columns:
-             skill_data[f'resume_has_{skill}'] = df['resumeSkills'].apply(
-                 lambda skills: skill in skills if isinstance(skills, (list, set)) else False
-             ).astype(int)
-        else:
-             skill_data[f'resume_has_{skill}'] = 0
-
-    if skill_data:
-        skill_df = pd.DataFrame(skill_data, index=df.index)
+    if skills:
+        skill_df = pd.concat([
+            pd.DataFrame(broadcast_to_rows(job_context.skill_matrix.toarray(), n_rows),
+                         columns=job_skill_cols, index=df.index),
+            pd.DataFrame(candidates.skill_matrix.toarray(), columns=resume_skill_cols, index=df.index),
+        ], axis=1)
         df = pd.concat([df, skill_df], axis=1)
     else:
          # If no skills were preserved, create dummy columns expected by the model based on feature_cols
@@ -118,88 +703,41 @@ def prepare_features(df, feature_preserver):
 
 
     # --- Experience Features ---
-    df['required_years'] = (
-        df['requiredExperience']
-        # Handle formats like "0-1 years", "5+ years", "3 years"
-        .apply(lambda x: float(str(x).split('-')[0].split('+')[0].split(' ')[0]) if pd.notnull(x) and str(x).split('-')[0].split('+')[0].split(' ')[0].replace('.','',1).isdigit() else 0) # Added check for digit
-        .fillna(0)
-    )
-
+    # Parsed once per job ("0-1 years", "5+ years", "3 years") in JobContext
+    df['required_years'] = broadcast_to_rows(job_context.required_years, n_rows)
+    df['actual_experience'] = broadcast_to_rows(candidates.actual_experience, n_rows)
 
-    # Use pre-calculated experience passed in 'actual_experience_calculated'
-    if 'actual_experience_calculated' in df.columns:
-        df['actual_experience'] = df['actual_experience_calculated'].fillna(0)
-    else:
-        eprint("Warning: 'actual_experience_calculated' column not found. Setting actual_experience to 0.")
-        df['actual_experience'] = 0
-
-    df['experience_match'] = (
-        df.apply(
-            lambda x: max(0, 1 - abs(x['required_years'] - x['actual_experience']) / max(x['required_years'], 1)),
-            axis=1
-        )
-        .fillna(0)
-    )
+    df['experience_match'] = experience_match(df['required_years'], df['actual_experience'])
 
     # --- Location Matching ---
-    # This logic assumes jobLocation might be city names and resumeLocation contains city/country.
-    # It might need adjustment if jobLocation is just "onsite"/"remote".
-    # For "remote", it might match if resumeLocation contains "remote"? Unlikely.
-    # For "onsite", it requires the job posting to have city info passed in jobLocation field.
-    df['location_match'] = 0 # Default to 0
-    if 'jobLocation' in df.columns and 'resumeLocation' in df.columns:
-        df['location_match'] = (
-            df.apply(
-                lambda x: 1 if pd.notnull(x['jobLocation']) and pd.notnull(x['resumeLocation']) and
-                               # Simple check: job is remote OR resume location contains job location (city)
-                               (str(x['jobLocation']).lower() == 'remote' or
-                                any(loc.strip().lower() in str(x['resumeLocation']).lower()
-                                    for loc in str(x['jobLocation']).split(',') if loc.strip()))
-                else 0,
-                axis=1
-            )
-            .fillna(0)
-        )
+    # jobLocation is "Remote" or "Onsite, <country>, <city>" as in the training data (Node
+    # builds it from the job post); resumeLocation is "<city>, <country>".
+    # Simple check: job is remote OR resume location contains a part of the job location.
+    # A single job is resolved through the candidates' LocationIndex in one lookup.
+    if job_context.size == 1:
+        df['location_match'] = candidates.location_index.match(job_context.locations[0])
     else:
-        eprint("Warning: jobLocation or resumeLocation column missing for location matching.")
+        df['location_match'] = location_match(job_context.locations, candidates.locations)
 
 
     # --- Text Similarity Features ---
-    # Role Similarity
-    df['job_text'] = df['jobRole'].fillna('').astype(str) + ' ' + df['jobDescription'].fillna('').astype(str)
-    df['resume_text'] = df['resumeSummary'].fillna('').astype(str)
-
-    if feature_preserver.role_vectorizer:
+    # Role Similarity (job vectors were transformed once in JobContext, resume vectors in CandidateFeatures)
+    df['role_similarity'] = 0
+    if job_context.role_vectors is not None and candidates.role_vectors is not None:
         try:
-            job_vectors = feature_preserver.role_vectorizer.transform(df['job_text'])
-            resume_vectors = feature_preserver.role_vectorizer.transform(df['resume_text'])
-            df['role_similarity'] = [cosine_similarity(job_vec, resume_vec)[0][0]
-                                     if job_vec.nnz > 0 and resume_vec.nnz > 0 else 0
-                                     for job_vec, resume_vec in zip(job_vectors, resume_vectors)]
+            df['role_similarity'] = rowwise_cosine_similarity(job_context.role_vectors, candidates.role_vectors)
         except Exception as e:
             eprint(f"Error calculating role similarity: {e}. Setting to 0.")
             df['role_similarity'] = 0
-    else:
-        eprint("Warning: role_vectorizer not found in feature_preserver. Setting role_similarity to 0.")
-        df['role_similarity'] = 0
 
     # Education Similarity
-    df['job_edu_text'] = df['jobRole'].fillna('').astype(str) # Using jobRole as proxy for required education level/type
-    df['resume_edu_text'] = df['resumeEducation__description'].fillna('').astype(str)
-
-    if feature_preserver.edu_vectorizer:
+    df['education_similarity'] = 0
+    if job_context.edu_vectors is not None and candidates.edu_vectors is not None:
         try:
-            job_edu_vectors = feature_preserver.edu_vectorizer.transform(df['job_edu_text'])
-            resume_edu_vectors = feature_preserver.edu_vectorizer.transform(df['resume_edu_text'])
-            df['education_similarity'] = [cosine_similarity(j_vec, r_vec)[0][0]
-                                          if j_vec.nnz > 0 and r_vec.nnz > 0 else 0
-                                          for j_vec, r_vec in zip(job_edu_vectors, resume_edu_vectors)]
+            df['education_similarity'] = rowwise_cosine_similarity(job_context.edu_vectors, candidates.edu_vectors)
         except Exception as e:
              eprint(f"Error calculating education similarity: {e}. Setting to 0.")
              df['education_similarity'] = 0
-    else:
-        eprint("Warning: edu_vectorizer not found in feature_preserver. Setting education_similarity to 0.")
-        df['education_similarity'] = 0
 
     # --- Advanced Features (using preserved setup) ---
     # Interaction features
@@ -209,28 +747,17 @@ def prepare_features(df, feature_preserver):
     df['experience_match_squared'] = df['experience_match'] ** 2
     df['role_similarity_squared'] = df['role_similarity'] ** 2
 
-    # Skill match ratios
-    job_skill_count = df.filter(like='job_has_').sum(axis=1).clip(lower=1)
-    resume_skill_count = df.filter(like='resume_has_').sum(axis=1).clip(lower=1)
-    skill_match_count = df.apply(
-        lambda row: sum(row[f'job_has_{skill}'] and row[f'resume_has_{skill}']
-                        for skill in feature_preserver.all_skills
-                        if f'job_has_{skill}' in row and f'resume_has_{skill}' in row), # Check column exists
-        axis=1
-    )
+    # Skill match ratios (row sums and the job/resume overlap come straight off the incidence matrices)
+    job_skill_count = pd.Series(broadcast_to_rows(job_context.skill_count, n_rows), index=df.index).clip(lower=1)
+    resume_skill_count = pd.Series(broadcast_to_rows(candidates.skill_count, n_rows), index=df.index).clip(lower=1)
+    # int32 so a job-vs-resume matrix product can't overflow the int8 incidence entries
+    skill_match_count = pd.Series(rowwise_dot(job_context.skill_matrix.astype(np.int32), candidates.skill_matrix),
+                                  index=df.index)
     df['skill_match_ratio'] = (skill_match_count / job_skill_count).fillna(0)
     df['skill_coverage_ratio'] = (skill_match_count / resume_skill_count).fillna(0)
 
-    # Keyword match count
-    df['keyword_match_count'] = 0
-    if feature_preserver.keywords:
-        df['keyword_match_count'] = df.apply(
-            lambda row: sum(1 for keyword in feature_preserver.keywords
-                            if keyword in row['resume_text'].lower()),
-            axis=1
-        )
-    else:
-        eprint("Warning: No keywords found in feature_preserver for keyword matching.")
+    # Keyword match count (counted once per resume in CandidateFeatures)
+    df['keyword_match_count'] = broadcast_to_rows(candidates.keyword_match_count, n_rows)
 
     # Composite score
     df['composite_feature'] = (
@@ -263,7 +790,11 @@ def prepare_features(df, feature_preserver):
     eprint(f"Selected feature columns: {X.columns.tolist()}") # Debug print
 
     # Impute missing values using preserved imputer
-    numeric_features = X.apply(pd.to_numeric, errors='coerce')
+    # Every generated column is already numeric; the per-column coercion costs ~0.4s per call on its own
+    if all(pd.api.types.is_numeric_dtype(dtype) for dtype in X.dtypes):
+        numeric_features = X
+    else:
+        numeric_features = X.apply(pd.to_numeric, errors='coerce')
     if feature_preserver.imputer:
         try:
             eprint("Attempting imputation using feature_preserver.imputer...") # Debug print
@@ -286,75 +817,1139 @@ def prepare_features(df, feature_preserver):
 
     eprint("Exiting prepare_features.") # Debug print
     # Return DataFrame with correct columns and index
-    return pd.DataFrame(imputed_data, columns=feature_cols, index=df.index), feature_preserver
+    return pd.DataFrame(imputed_data, columns=feature_cols, index=df.index)
 
 # --- End: Components adapted from app2.py ---
 
 
-def main():
-    eprint("Python script started.") # Debug print
-    if len(sys.argv) <= 1:
-        # Output error JSON to stdout as intended for the calling process
-        print(json.dumps({"error": "No input file path provided."}))
-        eprint("Error: No input file path provided.") # Also log to stderr
-        sys.exit(1)
-
-    input_file = sys.argv[1]
-    eprint(f"Input file: {input_file}") # Debug print
-
-    try:
-        eprint("Attempting to read input file...") # Debug print
-        with open(input_file, 'r') as f:
-            data = json.load(f)
-        eprint("Input file read successfully.") # Debug print
-    except FileNotFoundError:
-        print(json.dumps({"error": f"Input file '{input_file}' not found."}))
-        eprint(f"Error: Input file '{input_file}' not found.")
-        sys.exit(1)
-    except json.JSONDecodeError as e:
-        print(json.dumps({"error": f"Could not decode JSON from '{input_file}': {str(e)}"}))
-        eprint(f"Error: Could not decode JSON from '{input_file}': {str(e)}")
-        sys.exit(1)
-    except Exception as e:
-        print(json.dumps({"error": f"Error reading input file: {str(e)}"}))
-        eprint(f"Error reading input file: {str(e)}")
-        eprint(traceback.format_exc()) # Print full traceback to stderr
-        sys.exit(1)
+def shortlist_signals(job_context, candidates, skill_match_count=None):
+    """
+    Cheap per-candidate signals for one job, used to rank candidates before full scoring.
+
+    The skill-overlap, experience, location and text-similarity quantities pairwise_features
+    derives, read straight off the sparse matrices without building the dense model input.
+    skill_match_count, when the caller has it from a SkillIndex, saves the skill matrix product.
+    Returns an (n_candidates x 10) array whose last column is a constant 1.
+    """
+    n_rows = len(candidates)
+
+    def similarity(job_vectors, resume_vectors):
+        if job_vectors is None or resume_vectors is None:
+            return np.zeros(n_rows)
+        return rowwise_cosine_similarity(job_vectors, resume_vectors)
+
+    if skill_match_count is None:
+        skill_match_count = rowwise_dot(job_context.skill_matrix.astype(np.int32), candidates.skill_matrix)
+    role_similarity = similarity(job_context.role_vectors, candidates.role_vectors)
+    return np.column_stack([
+        skill_match_count / max(job_context.skill_count[0], 1),
+        skill_match_count / np.maximum(candidates.skill_count, 1),
+        experience_match(broadcast_to_rows(job_context.required_years, n_rows), candidates.actual_experience),
+        candidates.actual_experience,
+        candidates.location_index.match(job_context.locations[0]),
+        role_similarity,
+        role_similarity ** 2,
+        similarity(job_context.edu_vectors, candidates.edu_vectors),
+        candidates.keyword_match_count,
+        np.ones(n_rows),
+    ]).astype(float)
+
+
+class ScoringError(Exception):
+    """Raised when a scoring request cannot be completed; carries the jobId for the error JSON."""
+    def __init__(self, message, job_id=None):
+        super().__init__(message)
+        self.job_id = job_id
+
+    def to_dict(self):
+        return {"error": str(self), "jobId": self.job_id}
+
+
+# Resume fields whose values determine the cached CandidateFeatures
+CACHED_RESUME_FIELDS = ['resumeSummary', 'resumeSkills', 'resumeLocation', 'resumeEducation__description']
+# Layout of CandidateFeatures.records(); part of every cache digest, so older entries miss after a change
+CANDIDATE_RECORD_FORMAT = 2
+
+
+def script_path(filename):
+    """Files the scorer owns (model.pkl, caches) live next to this script, regardless of the caller's working directory."""
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(script_dir, filename)
+
+
+def default_model_path():
+    return script_path('model.pkl')
+
+
+class CandidateFeatureCache:
+    """
+    Persistent cache of CandidateFeatures records in a local SQLite file.
+
+    Entries are keyed by applicant _id and store a digest of the resume fields that
+    feed the features (CACHED_RESUME_FIELDS) together with the model version and record
+    layout, so an edited resume or a retrained model simply misses and gets re-featurized.
+    """
+    def __init__(self, path, model_version):
+        self.path = path
+        self.model_version = model_version
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS candidate_features ("
+            "candidate_id TEXT PRIMARY KEY, digest TEXT NOT NULL, features BLOB NOT NULL)"
+        )
+        self.connection.commit()
+
+    def digest(self, resume_fields):
+        payload = json.dumps([CANDIDATE_RECORD_FORMAT, self.model_version, resume_fields], default=str)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    def get_many(self, candidate_ids, digests):
+        """Cached records whose digest still matches, as {position: record}."""
+        wanted = {}
+        for position, (candidate_id, digest) in enumerate(zip(candidate_ids, digests)):
+            wanted.setdefault(candidate_id, []).append((position, digest))
+
+        found = {}
+        keys = list(wanted)
+        for start in range(0, len(keys), 500): # Stay under SQLite's bound-parameter limit
+            chunk = keys[start:start + 500]
+            rows = self.connection.execute(
+                f"SELECT candidate_id, digest, features FROM candidate_features "
+                f"WHERE candidate_id IN ({','.join('?' * len(chunk))})", chunk)
+            for candidate_id, stored_digest, blob in rows:
+                for position, digest in wanted[candidate_id]:
+                    if digest == stored_digest:
+                        found[position] = pickle.loads(blob)
+        return found
+
+    def put_many(self, candidate_ids, digests, records):
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO candidate_features (candidate_id, digest, features) VALUES (?, ?, ?)",
+            [(candidate_id, digest, pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL))
+             for candidate_id, digest, record in zip(candidate_ids, digests, records)])
+        self.connection.commit()
+
+
+CANDIDATE_EMBEDDING_DIM = 128
+CANDIDATE_CLUSTERS = 3 # Same number of groups the old per-request Birch run used
+
+
+@lru_cache(maxsize=8)
+def embedding_projection(block, n_columns, dim=CANDIDATE_EMBEDDING_DIM):
+    """Fixed Gaussian random projection for one feature block, seeded by the block and its width."""
+    rng = np.random.default_rng([block, n_columns, dim])
+    return rng.standard_normal((n_columns, dim)) / np.sqrt(dim)
+
+
+def candidate_embeddings(candidates, dim=CANDIDATE_EMBEDDING_DIM):
+    """
+    Dense, job-independent vector per candidate for clustering and similarity lookups.
+
+    The skill incidence, role TF-IDF and education TF-IDF rows are each L2-normalized and
+    given equal weight, then reduced to `dim` dimensions with a fixed random projection, so
+    a resume always maps to the same vector and distances between candidates are roughly
+    preserved. A missing block contributes nothing.
+    """
+    embeddings = np.zeros((len(candidates), dim))
+    if len(candidates) == 0:
+        return embeddings.astype(np.float32) # normalize() rejects zero rows
+    blocks = (candidates.skill_matrix, candidates.role_vectors, candidates.edu_vectors)
+    for block, matrix in enumerate(blocks):
+        if matrix is None or matrix.shape[1] == 0:
+            continue
+        rows = normalize(csr_matrix(matrix, dtype=np.float64), norm='l2')
+        embeddings += rows @ embedding_projection(block, matrix.shape[1], dim)
+    return (embeddings / np.sqrt(len(blocks))).astype(np.float32)
+
+
+class CandidateClusters:
+    """
+    Persistent BIRCH model of the applicant base, over candidate_embeddings().
+
+    Fit once when the candidate store is built and grown with partial_fit as resumes are
+    added or edited, so no clustering runs per request: stored candidates carry their
+    label and new ones are labelled by a descent of the CF-tree.
+
+    The tree is kept as flat arrays rather than node objects: a clustering feature (point
+    count, linear sum, sum of squared norms) per leaf subcluster, the leaf holding it and
+    its cluster, plus the CFs of the leaves under the root. A point descends to the
+    nearest leaf and its nearest subcluster there, which absorbs it if the merged radius
+    stays within THRESHOLD; otherwise it starts a new subcluster in that leaf, and a leaf
+    holding more than BRANCHING subclusters is split around its two farthest ones.
+    Labelling takes the same descent, comparing a candidate with the leaves and then
+    with one leaf's subclusters instead of with every subcluster.
+
+    The global clustering (Ward over every subcluster, quadratic in their number) is
+    frozen between refits: new subclusters join the cluster of the nearest existing one,
+    so labels already published stay valid and an update only labels its own rows. The
+    subclusters are regrouped once the points absorbed since the last grouping outnumber
+    those it was computed on. BIRCH cannot forget points, so replaced and removed resumes
+    are counted as stale and the tree is refit from the current embeddings once they
+    outnumber half the live candidates. Published labels are numbered by cluster size
+    (0 = largest).
+    """
+    THRESHOLD = 0.7
+    BRANCHING = 50
+    ARRAYS = ('counts', 'sums', 'squares', 'leaf_of', 'groups')
+
+    def __init__(self, dim=CANDIDATE_EMBEDDING_DIM, fitted=0, stale=0, label_map=None, grouped=0):
+        self.fitted = fitted        # Points absorbed by the CF-tree
+        self.stale = stale          # Absorbed points whose resume was since replaced or removed
+        self.label_map = label_map  # Cluster -> published label, set by label()
+        self.grouped = grouped      # Points absorbed when the subclusters were last regrouped
+        self.counts = np.zeros(0, dtype=np.int64)         # Per leaf subcluster: points absorbed,
+        self.sums = np.zeros((0, dim))                    # their linear sum,
+        self.squares = np.zeros(0)                        # the sum of their squared norms,
+        self.leaf_of = np.zeros(0, dtype=np.int64)        # the leaf holding it
+        self.groups = np.zeros(0, dtype=np.int64)         # and its cluster (-1 until grouped)
+        self._set_arrays(**{name: getattr(self, name) for name in self.ARRAYS})
+        self._base = None    # Snapshot directory holding the arrays saved in full last
+        self._changed = set() # Subclusters changed or added since then
+
+    def _set_arrays(self, counts, sums, squares, leaf_of, groups):
+        """Take over the subcluster arrays and derive the centroids and leaves from them."""
+        self.size = len(counts)
+        capacity = max(16, 2 * self.size)
+        self.counts, self.squares = np.zeros(capacity, dtype=np.int64), np.zeros(capacity)
+        self.leaf_of, self.groups = np.zeros(capacity, dtype=np.int64), np.full(capacity, -1, dtype=np.int64)
+        self.sums, self.centers = np.zeros((capacity, sums.shape[1])), np.zeros((capacity, sums.shape[1]))
+        self.counts[:self.size], self.squares[:self.size] = counts, squares
+        self.leaf_of[:self.size], self.groups[:self.size] = leaf_of, groups
+        self.sums[:self.size] = sums
+        self.centers[:self.size] = self.sums[:self.size] / np.maximum(self.counts[:self.size], 1)[:, None]
+
+        n_leaves = int(self.leaf_of[:self.size].max()) + 1 if self.size else 0
+        self.members = [[] for _ in range(n_leaves)]
+        for subcluster, leaf in enumerate(self.leaf_of[:self.size].tolist()):
+            self.members[leaf].append(subcluster)
+        self.leaf_counts = np.bincount(self.leaf_of[:self.size], weights=self.counts[:self.size], minlength=n_leaves)
+        self.leaf_sums = np.zeros((n_leaves, sums.shape[1]))
+        np.add.at(self.leaf_sums, self.leaf_of[:self.size], self.sums[:self.size])
+        self.leaf_centers = self.leaf_sums / np.maximum(self.leaf_counts, 1)[:, None]
+
+    def _add_subcluster(self, leaf, point):
+        if self.size == len(self.counts):
+            for name in ('counts', 'squares', 'leaf_of', 'groups', 'sums', 'centers'):
+                array = getattr(self, name)
+                grown = np.full((2 * len(array),) + array.shape[1:], -1 if name == 'groups' else 0, dtype=array.dtype)
+                grown[:len(array)] = array
+                setattr(self, name, grown)
+        subcluster = self.size
+        self.size += 1
+        self.counts[subcluster], self.sums[subcluster], self.centers[subcluster] = 1, point, point
+        self.squares[subcluster], self.leaf_of[subcluster], self.groups[subcluster] = point @ point, leaf, -1
+        self.members[leaf].append(subcluster)
+        self._changed.add(subcluster)
+
+    def _update_leaf(self, leaf):
+        members = self.members[leaf]
+        self.leaf_counts[leaf] = self.counts[members].sum()
+        self.leaf_sums[leaf] = self.sums[members].sum(axis=0)
+        self.leaf_centers[leaf] = self.leaf_sums[leaf] / max(self.leaf_counts[leaf], 1)
+
+    def _split_leaf(self, leaf):
+        members = np.asarray(self.members[leaf])
+        centers = self.centers[members]
+        distances = ((centers[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+        first, second = np.unravel_index(np.argmax(distances), distances.shape)
+        moved = distances[:, second] < distances[:, first]
+        new_leaf = len(self.members)
+        self.members[leaf] = members[~moved].tolist()
+        self.members.append(members[moved].tolist())
+        self.leaf_of[members[moved]] = new_leaf
+        self._changed.update(members[moved].tolist())
+        self.leaf_counts = np.append(self.leaf_counts, 0)
+        self.leaf_sums = np.vstack([self.leaf_sums, np.zeros((1, self.sums.shape[1]))])
+        self.leaf_centers = np.vstack([self.leaf_centers, np.zeros((1, self.sums.shape[1]))])
+        self._update_leaf(leaf)
+        self._update_leaf(new_leaf)
+
+    def _insert(self, point):
+        if not self.members:
+            self.members.append([])
+            self.leaf_counts, self.leaf_sums = np.zeros(1), np.zeros((1, len(point)))
+            self.leaf_centers = np.zeros((1, len(point)))
+            self._add_subcluster(0, point)
+            self._update_leaf(0)
+            return
+        leaf = int(np.argmin(((self.leaf_centers - point) ** 2).sum(axis=1)))
+        members = self.members[leaf]
+        nearest = members[int(np.argmin(((self.centers[members] - point) ** 2).sum(axis=1)))]
+        count, linear_sum = self.counts[nearest] + 1, self.sums[nearest] + point
+        squares = self.squares[nearest] + point @ point
+        centroid = linear_sum / count
+        if squares / count - centroid @ centroid <= self.THRESHOLD ** 2:
+            self.counts[nearest], self.sums[nearest], self.squares[nearest] = count, linear_sum, squares
+            self.centers[nearest] = centroid
+            self._changed.add(nearest)
+        else:
+            self._add_subcluster(leaf, point)
+        self.leaf_counts[leaf] += 1
+        self.leaf_sums[leaf] += point
+        self.leaf_centers[leaf] = self.leaf_sums[leaf] / self.leaf_counts[leaf]
+        if len(self.members[leaf]) > self.BRANCHING:
+            self._split_leaf(leaf)
+
+    def fit(self, embeddings):
+        dim = self.sums.shape[1]
+        self._set_arrays(np.zeros(0, dtype=np.int64), np.zeros((0, dim)), np.zeros(0), np.zeros(0, dtype=np.int64),
+                         np.zeros(0, dtype=np.int64))
+        self._base, self._changed, self.stale = None, set(), 0
+        for point in np.asarray(embeddings, dtype=np.float64):
+            self._insert(point)
+        self.fitted = len(embeddings)
+        self._regroup()
+        return self
+
+    def _regroup(self):
+        if self.size < CANDIDATE_CLUSTERS:
+            self.groups[:self.size] = np.arange(self.size)
+        elif self.size:
+            self.groups[:self.size] = AgglomerativeClustering(n_clusters=CANDIDATE_CLUSTERS).fit_predict(self.centers[:self.size])
+        self.grouped = self.fitted
+        self._changed.update(range(self.size))
+
+    def partial_fit(self, embeddings, replaced=0):
+        """
+        Absorb added or edited candidates; `replaced` counts the stored rows they supersede.
+
+        Returns True when the subclusters were regrouped, i.e. the labels already published
+        for the applicant base may have changed and every candidate must be relabelled.
+        """
+        self.stale += replaced
+        if len(embeddings) == 0:
+            return False
+        if self.size == 0:
+            self.fit(embeddings)
+            return True
+        for point in np.asarray(embeddings, dtype=np.float64):
+            self._insert(point)
+        self.fitted += len(embeddings)
+        if (self.fitted - self.grouped) > self.grouped:
+            self._regroup()
+            return True
+        groups = self.groups[:self.size]
+        new = groups < 0
+        if new.any():
+            groups[new] = groups[~new][pairwise_distances_argmin(self.centers[:self.size][new], self.centers[:self.size][~new])]
+        return False
+
+    def needs_refit(self, live_count):
+        return self.size == 0 or self.stale * 2 > live_count
+
+    def _descend(self, embeddings):
+        """Leaf subcluster of each embedding: the nearest one in the nearest leaf."""
+        embeddings = np.asarray(embeddings, dtype=np.float64)
+        leaves = pairwise_distances_argmin(embeddings, self.leaf_centers)
+        subclusters = np.empty(len(embeddings), dtype=np.int64)
+        order = np.argsort(leaves, kind='stable')
+        leaf_ids, starts = np.unique(leaves[order], return_index=True)
+        for leaf, rows in zip(leaf_ids.tolist(), np.split(order, starts[1:])):
+            members = np.asarray(self.members[leaf])
+            subclusters[rows] = members[pairwise_distances_argmin(embeddings[rows], self.centers[members])]
+        return subclusters
+
+    def predict(self, embeddings):
+        if self.size == 0 or len(embeddings) == 0:
+            return np.zeros(len(embeddings), dtype=np.int64)
+        groups = self.groups[self._descend(embeddings)]
+        return groups if self.label_map is None else np.asarray(self.label_map, dtype=np.int64)[groups]
+
+    def label(self, embeddings):
+        """Labels of the whole applicant base, renumbering the clusters by how many candidates they hold."""
+        if self.size == 0 or len(embeddings) == 0:
+            self.label_map = None
+            return np.zeros(len(embeddings), dtype=np.int64)
+        groups = self.groups[self._descend(embeddings)]
+        counts = np.bincount(groups, minlength=int(self.groups[:self.size].max()) + 1)
+        label_map = np.empty(len(counts), dtype=np.int64)
+        label_map[np.argsort(-counts, kind='stable')] = np.arange(len(counts))
+        self.label_map = label_map.tolist()
+        return label_map[groups]
+
+    def summary(self):
+        """Counters, layout and label numbering kept in the store manifest next to the arrays."""
+        return {'fitted': self.fitted, 'stale': self.stale, 'grouped': self.grouped, 'subclusters': self.size,
+                'leaves': len(self.members), 'dim': self.sums.shape[1], 'changed': len(self._changed),
+                'labels': self.label_map}
+
+    def save(self, directory):
+        """
+        Write the tree into a snapshot directory. While few subclusters changed since the
+        arrays were last written in full, those are hard-linked from that snapshot and only
+        the changed rows are written (clusters.changed.*), so an update does not rewrite the
+        whole tree.
+        """
+        def target(name):
+            return os.path.join(directory, f'clusters.{name}.npy')
+
+        if self._base is not None and len(self._changed) * 4 <= self.size:
+            for name in self.ARRAYS:
+                try:
+                    os.link(os.path.join(self._base, f'clusters.{name}.npy'), target(name))
+                except OSError:
+                    shutil.copyfile(os.path.join(self._base, f'clusters.{name}.npy'), target(name))
+            rows = np.array(sorted(self._changed), dtype=np.int64)
+            np.save(target('changed.rows'), rows)
+            for name in self.ARRAYS:
+                np.save(target(f'changed.{name}'), getattr(self, name)[rows])
+        else:
+            for name in self.ARRAYS:
+                np.save(target(name), getattr(self, name)[:self.size])
+            self._changed = set()
+        self._base = directory
+
+    @classmethod
+    def load(cls, directory, summary):
+        def source(name):
+            return np.load(os.path.join(directory, f'clusters.{name}.npy'))
+
+        clusters = cls(summary['dim'], summary['fitted'], summary['stale'], summary.get('labels'), summary['grouped'])
+        arrays = {name: source(name) for name in cls.ARRAYS}
+        if summary['changed']:
+            rows = source('changed.rows')
+            for name in cls.ARRAYS:
+                full = np.zeros((summary['subclusters'],) + arrays[name].shape[1:], dtype=arrays[name].dtype)
+                full[:len(arrays[name])] = arrays[name]
+                full[rows] = source(f'changed.{name}')
+                arrays[name] = full
+            clusters._changed = set(rows.tolist())
+        clusters._set_arrays(**arrays)
+        clusters._base = directory
+        return clusters
+
+
+def varint_lengths(values):
+    """Bytes each non-negative integer takes as a LEB128 varint."""
+    lengths = np.ones(len(values), dtype=np.int64)
+    for shift in range(7, 63, 7):
+        lengths += values >= (1 << shift)
+    return lengths
+
+
+def encode_varints(values):
+    """
+    LEB128 encoding of non-negative integers into one uint8 array: 7 bits per byte, low
+    bits first, with the high bit set on every byte but the last of each value.
+    """
+    values = np.asarray(values, dtype=np.int64)
+    lengths = varint_lengths(values)
+    starts = np.cumsum(lengths) - lengths
+    encoded = np.empty(int(lengths.sum()), dtype=np.uint8)
+    for k in range(int(lengths.max()) if len(values) else 0):
+        rows = np.flatnonzero(lengths > k)
+        encoded[starts[rows] + k] = ((values[rows] >> (7 * k)) & 0x7F) | ((lengths[rows] > k + 1) << 7)
+    return encoded
+
+
+def decode_varints(encoded):
+    """Integers written by encode_varints."""
+    encoded = np.asarray(encoded, dtype=np.uint8)
+    if len(encoded) == 0:
+        return np.zeros(0, dtype=np.int64)
+    ends = np.flatnonzero(encoded < 0x80)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    shifts = 7 * (np.arange(len(encoded)) - np.repeat(starts, ends - starts + 1))
+    return np.add.reduceat((encoded & 0x7F).astype(np.int64) << shifts, starts)
+
+
+class SkillIndex:
+    """
+    Inverted index from skill to the candidates listing it, so a job's skills are matched
+    by merging their posting lists instead of scanning every resume's skills.
+
+    The vocabulary is the preserved skill set in skill_vocabulary() order (ids below
+    `n_known`, the skill matrix columns) followed by every other skill a resume listed.
+    Rows are named by document numbers handed out in insertion order and never reused;
+    `docnos` holds each indexed row's number, ascending. A posting list is the ascending
+    document numbers of one skill, stored as varint-encoded gaps in one shared byte array,
+    so adding or editing a resume only appends to the lists of its skills under a new
+    number. Entries of replaced or removed rows are skipped when postings are merged,
+    because their numbers left `docnos`, and the lists are re-encoded without them once
+    they outnumber the live entries.
+    """
+    ARRAYS = ('vocabulary', 'postings', 'offsets', 'lengths', 'last', 'docnos', 'skill_counts')
+
+    def __init__(self, vocabulary, n_known, postings, offsets, lengths, last, docnos, skill_counts,
+                 next_docno, dead=0):
+        self.vocabulary = list(vocabulary)
+        self.n_known = n_known
+        self.postings = postings          # uint8 varint gaps of every posting list, skill by skill
+        self.offsets = offsets            # Skill s's bytes are postings[offsets[s]:offsets[s + 1]]
+        self.lengths = lengths            # Entries per posting list, dead ones included
+        self.last = last                  # Last document number per list (-1 when empty); appends continue from it
+        self.docnos = docnos              # Document number of each indexed row, ascending
+        self.skill_counts = skill_counts  # Distinct skills per row, preserved and unseen
+        self.next_docno = next_docno
+        self.dead = dead                  # Entries whose row is no longer indexed
+        self._ids = None
+
+    def __len__(self):
+        return len(self.docnos)
+
+    @property
+    def ids(self):
+        """Skill -> id in the vocabulary."""
+        if self._ids is None:
+            self._ids = {skill: i for i, skill in enumerate(self.vocabulary)}
+        return self._ids
+
+    @classmethod
+    def build(cls, candidates, skills):
+        """Index candidates as rows 0..n-1, with the preserved skill list `skills` as known vocabulary."""
+        n_skills = len(skills)
+        empty = cls(skills, n_skills, np.zeros(0, dtype=np.uint8), np.zeros(n_skills + 1, dtype=np.int64),
+                    np.zeros(n_skills, dtype=np.int64), np.full(n_skills, -1, dtype=np.int64),
+                    np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), 0)
+        return empty.updated(np.zeros(0, dtype=np.int64), candidates)
+
+    @staticmethod
+    def _encode(skill_ids, docnos, last, n_skills):
+        """
+        Varint gaps of (skill, document number) pairs sorted by skill then number, each list
+        continuing from last[skill]. Returns (bytes, bytes per skill, entries per skill, new last).
+        """
+        last = last.copy()
+        if len(skill_ids) == 0:
+            return np.zeros(0, dtype=np.uint8), np.zeros(n_skills, dtype=np.int64), np.zeros(n_skills, dtype=np.int64), last
+        first = np.concatenate(([True], skill_ids[1:] != skill_ids[:-1]))
+        final = np.concatenate((first[1:], [True]))
+        previous = np.concatenate(([0], docnos[:-1]))
+        previous[first] = last[skill_ids[first]]
+        gaps = docnos - previous
+        last[skill_ids[final]] = docnos[final]
+        byte_counts = np.bincount(skill_ids, weights=varint_lengths(gaps), minlength=n_skills).astype(np.int64)
+        return encode_varints(gaps), byte_counts, np.bincount(skill_ids, minlength=n_skills), last
+
+    def _decode_all(self):
+        """Skill id and document number of every entry, dead ones included."""
+        skill_ids = np.repeat(np.arange(len(self.vocabulary)), self.lengths)
+        totals = np.cumsum(decode_varints(self.postings))
+        list_starts = np.concatenate(([0], np.cumsum(self.lengths)[:-1]))
+        before = np.concatenate(([0], totals))[list_starts]
+        return skill_ids, totals - np.repeat(before, self.lengths) - 1
+
+    def updated(self, keep, added=None):
+        """
+        Index after keeping the rows at positions `keep` (in order) and appending the candidates
+        `added`, as CandidateStore.upsert merges them. Kept rows keep their document numbers;
+        the added rows get new ones, so the existing posting bytes are reused unchanged.
+        """
+        keep = np.asarray(keep, dtype=np.int64)
+        n_added = len(added) if added is not None else 0
+        new_docnos = np.arange(self.next_docno, self.next_docno + n_added, dtype=np.int64)
+        vocabulary, ids = list(self.vocabulary), dict(self.ids)
+        skill_ids = np.zeros(0, dtype=np.int64)
+        rows = np.zeros(0, dtype=np.int64)
+        if n_added:
+            matrix = csr_matrix(added.skill_matrix)
+            extra_rows, extra_ids = [], []
+            for row, extra in enumerate(added.extra_skills):
+                for skill in extra:
+                    if skill not in ids:
+                        ids[skill] = len(vocabulary)
+                        vocabulary.append(skill)
+                    extra_rows.append(row)
+                    extra_ids.append(ids[skill])
+            skill_ids = np.concatenate((matrix.indices.astype(np.int64), np.asarray(extra_ids, dtype=np.int64)))
+            rows = np.concatenate((np.repeat(np.arange(n_added), np.diff(matrix.indptr)),
+                                   np.asarray(extra_rows, dtype=np.int64)))
+
+        n_skills, n_new = len(vocabulary), len(vocabulary) - len(self.vocabulary)
+        old_offsets = np.concatenate((self.offsets, np.full(n_new, self.offsets[-1])))
+        old_bytes = np.diff(old_offsets)
+        docnos = new_docnos[rows]
+        order = np.lexsort((docnos, skill_ids))
+        appended, added_bytes, added_lengths, last = self._encode(
+            skill_ids[order], docnos[order], np.concatenate((self.last, np.full(n_new, -1, dtype=np.int64))), n_skills)
+
+        # Each skill's old bytes, then its appended ones
+        offsets = np.zeros(n_skills + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(old_bytes + added_bytes)
+        postings = np.empty(int(offsets[-1]), dtype=np.uint8)
+        postings[np.arange(int(old_bytes.sum())) + np.repeat(offsets[:-1] - old_offsets[:-1], old_bytes)] = self.postings
+        appended_starts = np.cumsum(added_bytes) - added_bytes
+        postings[np.arange(len(appended)) + np.repeat(offsets[:-1] + old_bytes - appended_starts, added_bytes)] = appended
+
+        skill_counts = np.asarray(self.skill_counts, dtype=np.int64)
+        index = SkillIndex(vocabulary, self.n_known, postings, offsets,
+                           np.concatenate((self.lengths, np.zeros(n_new, dtype=np.int64))) + added_lengths, last,
+                           np.concatenate((self.docnos[keep], new_docnos)),
+                           np.concatenate((skill_counts[keep], np.bincount(rows, minlength=n_added))),
+                           self.next_docno + n_added, self.dead + int(skill_counts.sum() - skill_counts[keep].sum()))
+        return index.compacted() if index.dead > index.skill_counts.sum() else index
+
+    def compacted(self):
+        """Same index with the entries of rows no longer indexed dropped from every posting list."""
+        skill_ids, docnos = self._decode_all()
+        live = self.rows(docnos) >= 0
+        n_skills = len(self.vocabulary)
+        postings, byte_counts, lengths, last = self._encode(
+            skill_ids[live], docnos[live], np.full(n_skills, -1, dtype=np.int64), n_skills)
+        offsets = np.concatenate(([0], np.cumsum(byte_counts)))
+        eprint(f"Compacted skill index: dropped {len(docnos) - int(live.sum())} dead postings.")
+        return SkillIndex(self.vocabulary, self.n_known, postings, offsets, lengths, last, self.docnos,
+                          self.skill_counts, self.next_docno)
+
+    def rows(self, docnos):
+        """Row of each document number, -1 for rows no longer indexed."""
+        rows = np.searchsorted(self.docnos, docnos)
+        found = rows < len(self.docnos)
+        found[found] = self.docnos[rows[found]] == docnos[found]
+        return np.where(found, rows, -1)
+
+    def skill_ids(self, skills, known_only=False):
+        """Distinct vocabulary ids of a job's skills; skills no resume lists are skipped."""
+        if not isinstance(skills, (list, set)):
+            return []
+        ids = {self.ids.get(skill) for skill in skills if isinstance(skill, str)}
+        return sorted(i for i in ids if i is not None and (i < self.n_known or not known_only))
+
+    def posting_list(self, skill_id):
+        """Document numbers listing one skill, ascending (dead ones included)."""
+        gaps = decode_varints(self.postings[self.offsets[skill_id]:self.offsets[skill_id + 1]])
+        return np.cumsum(gaps) - 1
+
+    def match_counts(self, skills, known_only=False):
+        """
+        How many of the given skills each row lists, by merging only those skills' postings.
+
+        With known_only, only preserved skills count, which gives the skill_match_count
+        numerator of skill_match_ratio and skill_coverage_ratio.
+        """
+        ids = self.skill_ids(skills, known_only)
+        if not ids:
+            return np.zeros(len(self), dtype=np.int64)
+        rows = self.rows(np.concatenate([self.posting_list(i) for i in ids]))
+        return np.bincount(rows[rows >= 0], minlength=len(self))
+
+    def candidates(self, skills, min_overlap):
+        """Rows listing at least min_overlap of the given skills."""
+        return np.flatnonzero(self.match_counts(skills) >= min_overlap)
+
+    def arrays(self):
+        """Columns written into a candidate store snapshot (see CandidateStore.write)."""
+        columns = {name: getattr(self, name) for name in self.ARRAYS}
+        columns['vocabulary'] = np.array(self.vocabulary, dtype=str)
+        return {f'skill_index.{name}': array for name, array in columns.items()}
+
+    def summary(self):
+        return {'known': self.n_known, 'next_docno': int(self.next_docno), 'dead': int(self.dead),
+                'entries': int(np.sum(self.skill_counts))}
+
+    @classmethod
+    def from_arrays(cls, arrays, summary):
+        columns = {name: arrays[f'skill_index.{name}'] for name in cls.ARRAYS}
+        columns['vocabulary'] = columns['vocabulary'].tolist()
+        return cls(n_known=summary['known'], next_docno=summary['next_docno'], dead=summary['dead'], **columns)
+
+
+CANDIDATE_STORE_FORMAT = 3
+
+
+class CandidateStore:
+    """
+    Columnar, memory-mapped snapshot of CandidateFeatures for the whole applicant base.
+
+    Every column is a plain .npy file opened with mmap_mode='r', so opening a store
+    parses nothing and all scorer processes reading it share the same pages through the
+    OS page cache. Sparse matrices are kept as their CSR data/indices/indptr arrays and
+    rows are addressed through ids.npy. `path` is a symlink to the current snapshot
+    directory; writers build a new snapshot next to it and swap the link atomically,
+    so readers never see a half-written store. The snapshot the link replaced is kept
+    for readers that resolved the link just before the swap; older ones are deleted by
+    the next write. Each snapshot also holds the
+    CandidateClusters of its applicant base and every candidate's label (cluster.npy),
+    and the SkillIndex of its rows (skill_index.*.npy).
+    """
+    MATRICES = ('skills', 'role', 'edu')
+
+    def __init__(self, path, manifest, arrays, clusters=None, skill_index=None):
+        self.path = path
+        self.manifest = manifest
+        self.arrays = arrays
+        self.clusters = clusters
+        self.skill_index = skill_index
+        self._positions = None
+
+    def __len__(self):
+        return self.manifest['count']
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(os.path.join(os.path.realpath(path), 'manifest.json'))
+
+    @staticmethod
+    def status(path, model_version):
+        """What the current snapshot's manifest says, without mapping its arrays ("storeStatus" op)."""
+        try:
+            with open(os.path.join(os.path.realpath(path), 'manifest.json'), 'r') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {"exists": False, "current": False}
+        return {
+            "exists": True,
+            "format": manifest.get('format'),
+            "modelVersion": manifest.get('model_version'),
+            "count": manifest.get('count'),
+            "builtAt": manifest.get('built_at'),
+            # open() accepts it: scoring and upserts can use it as it is
+            "current": manifest.get('format') == CANDIDATE_STORE_FORMAT and manifest.get('model_version') == model_version,
+        }
 
+    @classmethod
+    def open(cls, path, model_version):
+        # Pin the snapshot before reading anything, so a concurrent swap can't pair one
+        # snapshot's manifest with another one's arrays
+        snapshot = os.path.realpath(path)
+        manifest_file = os.path.join(snapshot, 'manifest.json')
+        if not os.path.exists(manifest_file):
+            raise ScoringError(f"Candidate store '{path}' does not exist; build it first.")
+        with open(manifest_file, 'r') as f:
+            manifest = json.load(f)
+        if manifest.get('format') != CANDIDATE_STORE_FORMAT:
+            raise ScoringError(f"Candidate store '{path}' has format {manifest.get('format')}, expected {CANDIDATE_STORE_FORMAT}; rebuild it.")
+        if manifest.get('model_version') != model_version:
+            raise ScoringError(f"Candidate store '{path}' was built for model {manifest.get('model_version')}, "
+                               f"but model {model_version} is loaded; rebuild it.")
+
+        arrays = {name: np.load(os.path.join(snapshot, name + '.npy'), mmap_mode='r') for name in manifest['arrays']}
+        clusters = CandidateClusters.load(snapshot, manifest['clusters']) if 'clusters' in manifest else None
+        skill_index = SkillIndex.from_arrays(arrays, manifest['skill_index']) if 'skill_index' in manifest else None
+        eprint(f"Opened candidate store {snapshot} with {manifest['count']} candidates.")
+        return cls(path, manifest, arrays, clusters, skill_index)
+
+    def position(self, candidate_id):
+        """Row of candidate_id in the store, or None if it is not stored."""
+        if self._positions is None:
+            self._positions = {stored_id: position for position, stored_id in enumerate(self.arrays['ids'].tolist())}
+        return self._positions.get(str(candidate_id))
+
+    def candidate_features(self):
+        """CandidateFeatures backed directly by the mapped arrays (no copy of the matrices)."""
+        arrays = self.arrays
+
+        def matrix(name):
+            if f'{name}.indptr' not in arrays:
+                return None
+            return csr_matrix((arrays[f'{name}.data'], arrays[f'{name}.indices'], arrays[f'{name}.indptr']),
+                              shape=tuple(self.manifest['shapes'][name]))
+
+        locations = [location if present else None
+                     for location, present in zip(arrays['locations'].tolist(), arrays['location_present'].tolist())]
+        experience = ExperienceParts(arrays['experience.closed_years'], arrays['experience.open_indptr'],
+                                     arrays['experience.open_starts'])
+        return CandidateFeatures(pd.RangeIndex(len(self)), arrays['ids'].tolist(), matrix('skills'),
+                                 matrix('role'), matrix('edu'), locations, arrays['keyword_match_count'], experience,
+                                 arrays.get('cluster'))
+
+    @classmethod
+    def write(cls, path, candidates, model_version, clusters=None, skill_index=None, labels=None):
+        """
+        Write candidates as a new snapshot and atomically make it the current store at `path`.
+
+        `clusters` is the updated CandidateClusters of the previous snapshot; without one (or
+        once too many of its points are stale) the BIRCH model is fit on these candidates.
+        `labels` are the candidates' cluster labels when the caller still knows them; otherwise
+        every candidate is embedded and labelled with the current global clustering.
+        `skill_index`, row-aligned with candidates, is written alongside when given.
+        """
+        if labels is None or clusters is None or clusters.needs_refit(len(candidates)):
+            embeddings = candidate_embeddings(candidates)
+            if clusters is None or clusters.needs_refit(len(candidates)):
+                clusters = CandidateClusters().fit(embeddings)
+            labels = clusters.label(embeddings)
+        arrays = {
+            'ids': np.array([str(candidate_id) for candidate_id in candidates.ids], dtype=str),
+            'locations': np.array([location or '' for location in candidates.locations], dtype=str),
+            'location_present': np.array([location is not None for location in candidates.locations], dtype=bool),
+            'keyword_match_count': np.asarray(candidates.keyword_match_count, dtype=np.int64),
+            'experience.closed_years': candidates.experience.closed_years,
+            'experience.open_indptr': candidates.experience.open_indptr,
+            'experience.open_starts': candidates.experience.open_starts,
+            'cluster': np.asarray(labels, dtype=np.int64),
+        }
+        shapes = {}
+        for name, matrix in zip(cls.MATRICES, (candidates.skill_matrix, candidates.role_vectors, candidates.edu_vectors)):
+            if matrix is None:
+                continue
+            matrix = csr_matrix(matrix)
+            arrays[f'{name}.data'] = matrix.data
+            arrays[f'{name}.indices'] = matrix.indices
+            arrays[f'{name}.indptr'] = matrix.indptr
+            shapes[name] = list(matrix.shape)
+        if skill_index is not None:
+            arrays.update(skill_index.arrays())
+
+        snapshot = f"{path}.{datetime.now().strftime('%Y%m%d%H%M%S%f')}.{os.getpid()}"
+        os.makedirs(snapshot)
+        for name, array in arrays.items():
+            np.save(os.path.join(snapshot, name + '.npy'), np.ascontiguousarray(array))
+        clusters.save(snapshot)
+        manifest = {
+            'format': CANDIDATE_STORE_FORMAT,
+            'model_version': model_version,
+            'count': len(candidates),
+            'arrays': sorted(arrays),
+            'shapes': shapes,
+            'clusters': clusters.summary(),
+            'built_at': datetime.now().isoformat(),
+        }
+        if skill_index is not None:
+            manifest['skill_index'] = skill_index.summary()
+        with open(os.path.join(snapshot, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f)
+
+        previous = os.path.realpath(path) if os.path.islink(path) else None
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path) # Replace a plain directory left by hand with a managed symlink
+        link = f"{snapshot}.link"
+        os.symlink(os.path.basename(snapshot), link)
+        os.replace(link, path)
+        cls._remove_old_snapshots(path, keep={snapshot, previous})
+        eprint(f"Wrote candidate store {snapshot} with {len(candidates)} candidates.")
+
+    @staticmethod
+    def _remove_old_snapshots(path, keep):
+        """
+        Delete the snapshots of `path` written before every snapshot in `keep` (the current
+        one and the one it replaced). The replaced snapshot stays for a reader that resolved
+        the link just before the swap and has yet to load it, and newer ones may still be
+        being written by another process. Readers that already mapped older files keep them
+        until they close.
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        pattern = re.compile(re.escape(os.path.basename(path)) + r'\.(\d{20})\.\d+')
+        stamps = [pattern.fullmatch(os.path.basename(kept)) for kept in keep if kept]
+        oldest_kept = min(match.group(1) for match in stamps if match)
+        for name in os.listdir(directory):
+            match = pattern.fullmatch(name)
+            if match and match.group(1) < oldest_kept:
+                shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+    @classmethod
+    def upsert(cls, path, candidates, model_version, removed_ids=(), skills=None):
+        """
+        Replace (or add) the given candidates and drop removed_ids, keeping every other row as stored.
+
+        The snapshot's BIRCH model absorbs the new rows with partial_fit instead of being refit:
+        only they are embedded and labelled, and kept rows keep their stored label unless the
+        clusters were regrouped (see CandidateClusters). Its SkillIndex appends their postings. `skills` (the preserved skill list) is used
+        to build a SkillIndex when the stored snapshot has none. A missing store is started from
+        the given candidates; one built for another model or format raises ScoringError.
+        """
+        replaced = {str(candidate_id) for candidate_id in candidates.ids} if candidates is not None else set()
+        replaced |= {str(candidate_id) for candidate_id in removed_ids}
+        if not cls.exists(path) and candidates is not None:
+            eprint(f"Candidate store '{path}' does not exist yet; starting it from the updated candidates.")
+            cls.write(path, candidates, model_version,
+                      skill_index=SkillIndex.build(candidates, skills) if skills is not None else None)
+            return len(candidates)
+        # A store for another model or format is not replaced here: that would drop every
+        # candidate not in this update. open() raises and the caller rebuilds with buildStore.
+        store = cls.open(path, model_version)
+        existing = store.candidate_features()
+
+        keep = [position for position, candidate_id in enumerate(existing.ids) if candidate_id not in replaced]
+        merged = existing.take(keep)
+        clusters = store.clusters
+        labels = merged.clusters # Stored labels of the kept rows, None for a store without clusters
+        if candidates is not None:
+            merged = CandidateFeatures.concat([merged, candidates])
+            if clusters is not None:
+                added = candidate_embeddings(candidates)
+                if clusters.partial_fit(added, replaced=len(existing) - len(keep)) or labels is None:
+                    eprint("Relabelling every stored candidate: the clusters were regrouped.")
+                    labels = None
+                else:
+                    labels = np.concatenate([labels, clusters.predict(added)])
+        elif clusters is not None:
+            clusters.partial_fit(np.zeros((0, CANDIDATE_EMBEDDING_DIM), dtype=np.float32), replaced=len(existing) - len(keep))
+        skill_index = store.skill_index
+        if skill_index is not None:
+            skill_index = skill_index.updated(keep, candidates)
+        elif skills is not None:
+            skill_index = SkillIndex.build(merged, skills) # Stored rows' unseen skills are not recoverable
+        cls.write(path, merged, model_version, clusters, skill_index, labels)
+        return len(merged)
+
+
+class JobStore:
+    """
+    Job-side features of the open job posts, for matching one resume against all of them.
+
+    Each job is featurized once, when it is added, into one row of a JobContext and is
+    addressed by its jobId. The store lives in the serving process: Node builds it from the
+    JobPost collection once the scorer is up and upserts or removes posts as they change.
+    upsert() and remove() return a new store, like CandidateStore swaps in a new snapshot.
+    """
+    def __init__(self, job_ids=(), jobs=None):
+        self.job_ids = list(job_ids)
+        self.jobs = jobs # JobContext with one row per job id, None when empty
+
+    def __len__(self):
+        return len(self.job_ids)
+
+    def _keep(self, dropped):
+        dropped = set(dropped)
+        keep = [position for position, job_id in enumerate(self.job_ids) if job_id not in dropped]
+        return [self.job_ids[p] for p in keep], self.jobs.take(keep) if keep else None
+
+    def upsert(self, job_ids, jobs):
+        """Store with the jobs `job_ids` (rows of the JobContext `jobs`) added or replaced."""
+        kept_ids, kept = self._keep(job_ids)
+        return JobStore(kept_ids + list(job_ids), JobContext.concat([kept, jobs]) if kept is not None else jobs)
+
+    def remove(self, job_ids):
+        return JobStore(*self._keep(job_ids))
+
+
+class ScoringContext:
+    """
+    Everything that outlives a single request: loaded models, their preserver and version,
+    the candidate cache and store, and the job store of open job posts.
+    """
+    def __init__(self, trained_models, feature_preserver, model_version, candidate_cache=None, candidate_store_path=None):
+        self.trained_models = trained_models
+        self.feature_preserver = feature_preserver
+        self.model_version = model_version
+        self.candidate_cache = candidate_cache
+        self.candidate_store_path = candidate_store_path
+        self.job_store = JobStore()
+        self.open_jobs = {} # jobId -> JobSession for chunked (openJob/scoreChunk/closeJob) requests
+        self._store = None
+        self._store_candidates = None
+        self._store_stamp = None
+
+    def candidate_store(self):
+        """The candidate store, reopened whenever another process swaps in a new snapshot."""
+        if not self.candidate_store_path:
+            raise ScoringError("No candidate store configured (start the scorer with --store).")
+        try:
+            stamp = os.path.realpath(self.candidate_store_path)
+        except OSError:
+            stamp = None
+        if self._store is None or stamp != self._store_stamp:
+            self._store = CandidateStore.open(self.candidate_store_path, self.model_version)
+            self._store_candidates = self._store.candidate_features()
+            self._store_stamp = stamp
+        return self._store
+
+    def store_candidates(self):
+        """CandidateFeatures of the candidate store (see candidate_store)."""
+        self.candidate_store()
+        return self._store_candidates
+
+    def candidate_clusters(self):
+        """The store's CandidateClusters, or None when no usable candidate store has been built."""
+        if not self.candidate_store_path or not os.path.exists(os.path.join(self.candidate_store_path, 'manifest.json')):
+            return None
+        try:
+            return self.candidate_store().clusters
+        except ScoringError as e:
+            eprint(f"Warning: {e} Candidates are returned without candidateCluster.")
+            return None
+
+    def write_store(self, candidates):
+        skills, _, _, _ = skill_vocabulary(self.feature_preserver)
+        CandidateStore.write(self.candidate_store_path, candidates, self.model_version,
+                             skill_index=SkillIndex.build(candidates, skills))
+        self._store = self._store_candidates = None
+
+    def upsert_store(self, candidates, removed_ids=()):
+        skills, _, _, _ = skill_vocabulary(self.feature_preserver)
+        count = CandidateStore.upsert(self.candidate_store_path, candidates, self.model_version, removed_ids, skills)
+        self._store = self._store_candidates = None
+        return count
+
+
+# Layout version of the model artifact directory written by app2.py (model_artifact/manifest.json)
+ARTIFACT_FORMAT = 1
+
+
+class FlatForest:
+    """
+    A RandomForestRegressor exported by app2.py as flat node arrays (see flatten_forest there).
+
+    predict() walks every tree for a block of rows at once with NumPy gathers instead of
+    calling each sklearn tree in turn, and returns exactly what model.predict would. The
+    arrays are opened with mmap_mode='r', so the pages are shared between scorer processes.
+    """
+    ARRAYS = ('feature', 'threshold', 'children', 'value', 'roots')
+
+    def __init__(self, arrays, depth, block_size=256):
+        self.depth = depth
+        self.block_size = block_size
+        self.n_outputs = arrays['value'].shape[1]
+        self.value = arrays['value']
+        self.roots = np.asarray(arrays['roots'], dtype=np.int64)
+        # Leaves keep feature 0 and an infinite threshold, so they always "go left" to themselves
+        is_leaf = np.asarray(arrays['feature']) < 0
+        self.feature = np.where(is_leaf, 0, arrays['feature']).astype(np.int64)
+        self.threshold = np.where(is_leaf, np.inf, arrays['threshold'])
+        self.children = np.asarray(arrays['children'], dtype=np.int64).ravel()
+
+    @classmethod
+    def load(cls, directory, name, depth):
+        arrays = {array_name: np.load(os.path.join(directory, f"{name}.{array_name}.npy"), mmap_mode='r')
+                  for array_name in cls.ARRAYS}
+        return cls(arrays, depth)
+
+    def predict(self, X):
+        # Trees compare float32 features against float64 thresholds, exactly as sklearn does
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n_rows, n_features = X.shape
+        n_trees = len(self.roots)
+        predictions = np.empty((n_rows, self.n_outputs))
+
+        for start in range(0, n_rows, self.block_size):
+            block = X[start:start + self.block_size]
+            block_rows = len(block)
+            flat_block = block.ravel()
+            nodes = np.tile(self.roots, block_rows)
+            row_offsets = np.repeat(np.arange(block_rows, dtype=np.int64) * n_features, n_trees)
+            active = np.arange(len(nodes))
+            for _ in range(self.depth):
+                current = nodes[active]
+                go_right = flat_block[row_offsets[active] + self.feature[current]] > self.threshold[current]
+                following = self.children[current * 2 + go_right]
+                nodes[active] = following
+                active = active[following != current] # Drop (row, tree) pairs that reached a leaf
+                if len(active) == 0:
+                    break
+            leaf_values = self.value[nodes.reshape(block_rows, n_trees)]
+            # Sum trees in order, like RandomForestRegressor.predict, so results match it exactly
+            predictions[start:start + block_rows] = np.cumsum(leaf_values, axis=1)[:, -1] / n_trees
+
+        return predictions[:, 0] if self.n_outputs == 1 else predictions
+
+
+class LazyForest:
+    """
+    Stands in for an artifact's FlatForest until the first predict(), so the arrays of
+    forests no request has needed yet are never mapped or read.
+    """
+    def __init__(self, directory, name, depth):
+        self.directory = directory
+        self.name = name
+        self.depth = depth
+        self._forest = None
+
+    def predict(self, X):
+        if self._forest is None:
+            eprint(f"Loading forest {self.name} from {self.directory}")
+            self._forest = FlatForest.load(self.directory, self.name, self.depth)
+        return self._forest.predict(X)
+
+
+class ArrayImputer:
+    """
+    Mean imputation from the artifact's column means; transform() matches the fitted SimpleImputer.
+
+    Columns without a mean (missing in every training row) are dropped, as SimpleImputer does.
+    """
+    def __init__(self, statistics):
+        self.statistics_ = np.asarray(statistics, dtype=np.float64)
+
+    def transform(self, X):
+        X = np.array(X, dtype=np.float64)
+        if X.shape[1] != len(self.statistics_):
+            raise ValueError(f"X has {X.shape[1]} features, but the imputer expects {len(self.statistics_)}")
+        missing_rows, missing_cols = np.nonzero(np.isnan(X))
+        X[missing_rows, missing_cols] = self.statistics_[missing_cols]
+        return X[:, ~np.isnan(self.statistics_)]
+
+
+def load_vectorizer(directory, entry):
+    """Rebuild a fitted TfidfVectorizer from its vocabulary and idf arrays (see export_vectorizer in app2.py)."""
+    if entry is None:
+        return None
+    params = dict(entry['params'])
+    params['dtype'] = np.dtype(params['dtype']).type
+    params['ngram_range'] = tuple(params['ngram_range'])
+    terms = np.load(os.path.join(directory, entry['vocabulary'])).tolist()
+    vectorizer = TfidfVectorizer(vocabulary=terms, **params)
+    vectorizer.idf_ = np.load(os.path.join(directory, entry['idf']))
+    return vectorizer
+
+
+def load_artifact(artifact_dir):
+    """
+    Load the versioned model artifact directory written by app2.py.
+
+    Returns (trained_models, feature_preserver, model_version) like load_model, but nothing is
+    unpickled: the preserver is rebuilt from the manifest and arrays, and every forest is a
+    LazyForest, so only the targets that requests actually predict get mapped. The forest
+    files are opened with mmap_mode='r' and shared read-only by all scorer processes.
+    """
+    eprint(f"Attempting to load model artifact: {artifact_dir}") # Debug print
+    directory = os.path.realpath(artifact_dir) # Pin this version in case a newer one is swapped in
+    with open(os.path.join(directory, 'manifest.json'), 'r') as f:
+        manifest = json.load(f)
+    if manifest.get('format') != ARTIFACT_FORMAT:
+        raise ValueError(f"Model artifact '{artifact_dir}' has format {manifest.get('format')}, expected {ARTIFACT_FORMAT}")
+
+    feature_preserver = FeaturePreserver()
+    feature_preserver.all_skills = set(manifest['skills'])
+    feature_preserver.feature_cols = manifest['feature_cols']
+    feature_preserver.keywords = set(manifest['keywords'])
+    feature_preserver.training_history = manifest.get('training_history', [])
+    feature_preserver.role_vectorizer = load_vectorizer(directory, manifest['vectorizers']['role'])
+    feature_preserver.edu_vectorizer = load_vectorizer(directory, manifest['vectorizers']['edu'])
+    feature_preserver.imputer = ArrayImputer(np.load(os.path.join(directory, manifest['imputer']['statistics'])))
+
+    trained_models = {}
+    for entry in manifest['forests']:
+        forest = LazyForest(directory, entry['name'], entry['depth'])
+        trained_models[entry['name']] = {'model': forest, 'targets': entry['targets']} if entry['name'] == MULTI_OUTPUT_KEY else forest
+    eprint(f"Loaded model artifact {directory} (version {manifest['version']}) with forests {list(trained_models)}")
+    return trained_models, feature_preserver, manifest['version']
+
+
+def load_model(model_file):
+    """Load the (models_dict, feature_preserver) tuple written by app2.py, plus a version hash of the file."""
+    eprint(f"Attempting to load model file: {model_file}") # Debug print
+    with open(model_file, 'rb') as f:
+        model_bytes = f.read()
+    trained_models, feature_preserver = pickle.loads(model_bytes)
+    model_version = hashlib.sha1(model_bytes).hexdigest()[:16]
+    eprint(f"Loaded model and feature preserver from {model_file} (version {model_version})")
+    return trained_models, feature_preserver, model_version
 
-    job_id = data.get('jobId', 'unknown_job')
-    job_data = data.get('jobData')
-    resumes = data.get('resumes') # List of resume objects
-    eprint(f"Job ID: {job_id}, Found {len(resumes) if resumes else 0} resumes.") # Debug print
 
-    if not job_data or not resumes:
-        print(json.dumps({"error": "Missing 'jobData' or 'resumes' in input JSON.", "jobId": job_id}))
-        eprint("Error: Missing 'jobData' or 'resumes' in input JSON.")
-        sys.exit(1)
+def featurize_candidates(input_df, feature_preserver, candidate_cache=None):
+    """
+    CandidateFeatures for the candidate frame, reusing cached rows where the resume is unchanged.
 
-    # --- Load the trained model and feature preserver ---
-    # Determine the script's directory
-    script_dir = os.path.dirname(os.path.abspath(__file__)) # <-- Get absolute path of script's dir
-    model_file = os.path.join(script_dir, 'model.pkl') # <-- Build path relative to script
-    # model_file = 'model.pkl' # <-- Remove this old line
+    Only new or edited resumes go through the vectorizers; cache errors fall back to
+    featurizing everything so scoring never depends on the cache being healthy.
+    """
+    if candidate_cache is None:
+        return CandidateFeatures.from_frame(input_df, feature_preserver)
 
-    eprint(f"Attempting to load model file: {model_file}") # Debug print
     try:
-        with open(model_file, 'rb') as f:
-            # Assuming the pkl file contains a tuple: (models_dict, feature_preserver_object)
-            trained_models, feature_preserver = pickle.load(f)
-            eprint(f"Loaded model and feature preserver from {model_file}")
-    except FileNotFoundError:
-         print(json.dumps({"error": f"Model file '{model_file}' not found.", "jobId": job_id}))
-         eprint(f"Error: Model file '{model_file}' not found.")
-         sys.exit(1)
-    except Exception as e:
-         print(json.dumps({"error": f"Error loading model file '{model_file}': {str(e)}", "jobId": job_id}))
-         eprint(f"Error loading model file '{model_file}': {str(e)}")
-         eprint(traceback.format_exc()) # Print full traceback to stderr
-         sys.exit(1)
-
-    # Prepare data for DataFrame
+        candidate_ids = input_df['_id'].astype(str).tolist()
+        digests = [candidate_cache.digest(fields)
+                   for fields in input_df[CACHED_RESUME_FIELDS].itertuples(index=False, name=None)]
+        records = candidate_cache.get_many(candidate_ids, digests)
+        missing = [position for position in range(len(input_df)) if position not in records]
+        eprint(f"Candidate feature cache: {len(records)} hits, {len(missing)} misses.")
+
+        if missing:
+            fresh = CandidateFeatures.from_frame(input_df.iloc[missing], feature_preserver).records()
+            candidate_cache.put_many([candidate_ids[p] for p in missing], [digests[p] for p in missing], fresh)
+            records.update(zip(missing, fresh))
+
+        return CandidateFeatures.from_records([records[p] for p in range(len(input_df))], input_df, feature_preserver)
+    except (sqlite3.Error, pickle.UnpicklingError, KeyError, ValueError) as e:
+        eprint(f"Warning: candidate feature cache unavailable ({e}). Featurizing all resumes.")
+        eprint(traceback.format_exc())
+        return CandidateFeatures.from_frame(input_df, feature_preserver)
+
+
+def build_candidate_frame(resumes, job_id):
+    """Flatten the nested resume objects sent by Node into one row per resume (no job columns)."""
     data_for_df = []
     eprint(f"Processing {len(resumes)} resumes for job ID: {job_id}")
     for i, resume in enumerate(resumes):
@@ -375,9 +1970,11 @@ def main():
             eprint(f"Warning: Skills data for resume {resume_id} is not a list, treating as empty.")
             skills_list = []
 
-        # Ensure personal and experience are dicts
+        # Ensure personal and education are dicts, and experience a list of role dicts
         if not isinstance(personal, dict): personal = {}
-        if not isinstance(experience, dict): experience = {}
+        if isinstance(experience, dict): experience = [experience] # Older single-role payloads
+        if not isinstance(experience, list): experience = []
+        experience = [role for role in experience if isinstance(role, dict)]
         if not isinstance(education, dict): education = {}
 
 
@@ -386,82 +1983,221 @@ def main():
         country = personal.get('country', '')
         resume_location = f"{city}, {country}".strip(', ') if city or country else ''
 
-        # Calculate actual experience for this resume
-        start_date = experience.get('startDate')
-        end_date = experience.get('endDate')
-        actual_experience = calculate_single_experience(start_date, end_date)
+        # Experience is evaluated later (ExperienceParts) so ongoing roles are measured against today
+        roles = [(role.get('startDate'), role.get('endDate')) for role in experience]
+        start_date, end_date = roles[0] if roles else (None, None)
 
         row = {
-            # Job Data (repeated for each resume)
-            'jobRole': job_data.get('jobRole'),
-            'jobDescription': job_data.get('jobDescription'),
-            'jobSkills': job_data.get('jobSkills', []), # Expecting list of strings
-            'requiredExperience': job_data.get('requiredExperience'), # e.g., "2-4 years"
-            'jobLocation': job_data.get('jobLocation'), # e.g., "onsite", "remote", or "City, State"
-
-            # Resume Data
+            # Resume Data (the job side is featurized once in JobContext)
             'resumeSummary': resume_details.get('professionalSummary', ''),
             'resumeSkills': skills_list,
-            'resumeExperience__startDate': start_date, # Keep original if needed elsewhere
-            'resumeExperience__endDate': end_date,     # Keep original if needed elsewhere
-            'actual_experience_calculated': actual_experience, # Use pre-calculated experience
+            'resumeExperience__startDate': start_date, # First role, kept if needed elsewhere
+            'resumeExperience__endDate': end_date,     # First role, kept if needed elsewhere
+            'resumeExperience': roles, # (startDate, endDate) per role, all summed
             'resumeLocation': resume_location,
             'resumeEducation__description': education.get('description', ''),
             '_id': resume_id # Keep track of resume ID
         }
         data_for_df.append(row)
 
-    if not data_for_df:
-        print(json.dumps({"message": "No valid resumes processed.", "jobId": job_id}))
-        eprint("Warning: No valid resumes processed, exiting.")
-        sys.exit(0) # Exit with 0 as it's not necessarily an error state
-
     # Create DataFrame
     eprint(f"Creating DataFrame with {len(data_for_df)} rows.")
-    input_df = pd.DataFrame(data_for_df)
-    # Set resume ID as index temporarily if needed, or keep it as a column
-    # input_df = input_df.set_index('_id')
+    return pd.DataFrame(data_for_df)
 
-    # Preprocess the data using the loaded feature_preserver
-    eprint("Starting preprocessing...")
-    try:
-        # Pass a copy to avoid modifying the original df unless intended
-        X_processed, _ = prepare_features(input_df.copy(), feature_preserver)
-        eprint(f"Preprocessing complete. Processed features shape: {X_processed.shape}")
 
-        if X_processed.empty or X_processed.shape[0] != len(input_df):
-             raise ValueError(f"Preprocessing resulted in mismatching number of rows or empty DataFrame. Input: {len(input_df)}, Output: {len(X_processed)}")
+TARGETS = ['skillsScore', 'experienceScore', 'locationScore', 'roleSimilarity', 'educationScore', 'matchScore']
+# Key of the single multi-output forest written by `app2.py --multi-output`: {'model': forest, 'targets': [...]}
+MULTI_OUTPUT_KEY = '__multi_output__'
 
-    except Exception as e:
-         error_msg = f"Error during preprocessing: {str(e)}"
-         print(json.dumps({"error": error_msg, "jobId": job_id}))
-         eprint(error_msg)
-         eprint(traceback.format_exc()) # Print full traceback to stderr
-         # Consider logging more details for debugging:
-         # eprint("DataFrame columns:", input_df.columns)
-         # eprint("DataFrame dtypes:", input_df.dtypes)
-         # eprint("DataFrame head:\n", input_df.head())
-         # eprint("Feature Preserver Cols:", feature_preserver.feature_cols)
-         sys.exit(1)
 
+class LazyPredictions(Mapping):
+    """
+    Target name -> model predictions for X, running each target's forest only when it is first read.
 
-    # --- Prediction Step ---
-    eprint("Starting prediction...")
-    predictions = {}
-    try:
+    Callers that only need matchScore (compact selections, or a 'targets' subset) skip the
+    other forests entirely. A multi-output model fills all of its targets in one pass.
+    Targets in predicted (already known, e.g. matchScore from Prefilter) are not run again;
+    X_processed may then be None until some other target is read.
+    """
+    def __init__(self, trained_models, X_processed, feature_preserver, predicted=None):
+        self.models = {}
         for target, model in trained_models.items():
-            if target in ['skillsScore', 'experienceScore', 'locationScore', 'roleSimilarity', 'educationScore', 'matchScore']:
-                 if list(X_processed.columns) != feature_preserver.feature_cols:
-                     eprint(f"CRITICAL WARNING: Processed features columns do NOT match feature_preserver.feature_cols for model '{target}'!")
-                     eprint(f"Processed: {list(X_processed.columns)}")
-                     eprint(f"Expected: {feature_preserver.feature_cols}")
-                 eprint(f"Predicting for target: {target}") # Debug print
-                 predictions[target] = model.predict(X_processed)
+            if target == MULTI_OUTPUT_KEY:
+                for joint_target in model['targets']:
+                    if joint_target in TARGETS:
+                        self.models[joint_target] = model
+            elif target in TARGETS:
+                self.models[target] = model
             else:
                  eprint(f"Skipping prediction for unexpected item in loaded model dict: {target}")
+        self.X_processed = X_processed
+        self.feature_preserver = feature_preserver
+        self._predicted = dict(predicted or {})
+
+    def __getitem__(self, target):
+        if target not in self._predicted:
+            model = self.models[target]
+            if list(self.X_processed.columns) != self.feature_preserver.feature_cols:
+                eprint(f"CRITICAL WARNING: Processed features columns do NOT match feature_preserver.feature_cols for model '{target}'!")
+                eprint(f"Processed: {list(self.X_processed.columns)}")
+                eprint(f"Expected: {self.feature_preserver.feature_cols}")
+            if isinstance(model, dict):
+                eprint(f"Predicting all targets in one pass: {model['targets']}") # Debug print
+                joint_predictions = model['model'].predict(self.X_processed)
+                for i, joint_target in enumerate(model['targets']):
+                    self._predicted[joint_target] = joint_predictions[:, i]
+            else:
+                eprint(f"Predicting for target: {target}") # Debug print
+                self._predicted[target] = model.predict(self.X_processed)
+        return self._predicted[target]
+
+    def needs_features(self, targets):
+        """Whether reading these targets runs a forest, i.e. X_processed is needed."""
+        return any(target not in self._predicted for target in targets)
+
+    def __iter__(self):
+        return iter(self.models)
+
+    def __len__(self):
+        return len(self.models)
+
+
+class MatchSelection:
+    """
+    Which candidates, and which of their scores, a request wants back.
+
+    By default every candidate is returned with all six scores. With 'scoreAbove'
+    (keep matchScore > threshold) and/or 'topK' (keep the K best by matchScore) the
+    response is compact: only {"_id", "matchScore"} for the selected candidates.
+    Top-K uses np.argpartition, so only the K survivors are sorted.
+
+    'targets' lists the scores to return besides matchScore (which is always predicted,
+    since match_category and cluster derive from it); only those forests are run.
+    """
+    def __init__(self, score_above=None, top_k=None, targets=None):
+        self.score_above = score_above
+        self.top_k = top_k
+        self.targets = targets
+
+    @classmethod
+    def from_request(cls, request, job_id=None):
+        score_above, top_k, targets = request.get('scoreAbove'), request.get('topK'), request.get('targets')
+        if targets is not None:
+            if not isinstance(targets, list) or any(target not in TARGETS for target in targets):
+                raise ScoringError(f"'targets' must be a list of {TARGETS}, got {targets!r}.", job_id)
+        if score_above is not None:
+            if isinstance(score_above, bool) or not isinstance(score_above, (int, float)):
+                raise ScoringError(f"'scoreAbove' must be a number, got {score_above!r}.", job_id)
+            score_above = float(score_above)
+        if top_k is not None:
+            if isinstance(top_k, bool) or not isinstance(top_k, int) or top_k < 1:
+                raise ScoringError(f"'topK' must be a positive integer, got {top_k!r}.", job_id)
+        return cls(score_above, top_k, targets)
+
+    @property
+    def compact(self):
+        return self.score_above is not None or self.top_k is not None
+
+    def output_targets(self, available):
+        """Targets to predict and return, in model order: matchScore plus any requested ones."""
+        if self.targets is None:
+            return ['matchScore'] if self.compact else list(available)
+        return [target for target in available if target == 'matchScore' or target in self.targets]
+
+    def positions(self, match_scores):
+        """Positions of the selected candidates; best first when topK is set, input order otherwise."""
+        match_scores = np.asarray(match_scores, dtype=float)
+        positions = np.arange(len(match_scores))
+        if self.score_above is not None:
+            positions = positions[match_scores > self.score_above]
+        if self.top_k is not None:
+            if len(positions) > self.top_k:
+                best = np.argpartition(-match_scores[positions], self.top_k - 1)[:self.top_k]
+                positions = positions[best]
+            # Best first; ties keep input order
+            positions = positions[np.lexsort((positions, -match_scores[positions]))]
+        return positions
+
+    def compact_results(self, ids, scores):
+        """{"_id", "matchScore", <requested targets>} for the selected candidates; scores maps target -> array."""
+        columns = {target: np.asarray(values, dtype=float) for target, values in scores.items()}
+        return [{"_id": ids[p], **{target: float(values[p]) for target, values in columns.items()}}
+                for p in self.positions(columns['matchScore']).tolist()]
+
+
+class TopMatches:
+    """Running top-K of compact results across chunks (a min-heap of the K best seen so far)."""
+    def __init__(self, k):
+        self.k = k
+        self._heap = []
+        self._seen = 0
+
+    def add(self, match_results):
+        for match_result in match_results:
+            # The arrival counter breaks ties in favour of earlier candidates, like MatchSelection.positions
+            entry = (match_result['matchScore'], -self._seen, match_result)
+            self._seen += 1
+            if len(self._heap) < self.k:
+                heapq.heappush(self._heap, entry)
+            elif entry[:2] > self._heap[0][:2]:
+                heapq.heapreplace(self._heap, entry)
+
+    def results(self):
+        return [match_result for _, _, match_result in sorted(self._heap, key=lambda entry: entry[:2], reverse=True)]
+
+
+def score_candidates(job_context, candidates, context, job_id, selection=None, match_scores=None):
+    """
+    Featurize, predict and categorize one batch of candidates for a prepared job.
+
+    Args:
+        job_context: JobContext of the job being matched
+        candidates: CandidateFeatures of the batch
+        context: ScoringContext with the loaded models
+        job_id: Job ID, only used in error messages
+        selection: Optional MatchSelection; compact selections return only {"_id", "matchScore"},
+            and only the forests of its output targets are run
+        match_scores: Optional matchScores of the batch, already predicted (by Prefilter); the
+            features are then only built if the selection wants other targets too
+
+    Returns:
+        (match_results, birch_execution_successful), where match_results is the list of
+        per-candidate dicts placed in "matchResults" and birch_execution_successful tells
+        whether they carry a candidateCluster from the persistent BIRCH model
+
+    Raises:
+        ScoringError: If preprocessing or prediction fails
+    """
+    trained_models, feature_preserver = context.trained_models, context.feature_preserver
+    selection = selection or MatchSelection()
+    predictions = LazyPredictions(trained_models, None, feature_preserver,
+                                  predicted=None if match_scores is None else {'matchScore': np.asarray(match_scores, dtype=float)})
+    output_targets = selection.output_targets(predictions)
+
+    # Preprocess the data using the loaded feature_preserver
+    if predictions.needs_features(output_targets):
+        eprint("Starting preprocessing...")
+        try:
+            X_processed = pairwise_features(job_context, candidates, feature_preserver)
+            eprint(f"Preprocessing complete. Processed features shape: {X_processed.shape}")
+
+            if X_processed.empty or X_processed.shape[0] != len(candidates):
+                 raise ValueError(f"Preprocessing resulted in mismatching number of rows or empty DataFrame. Input: {len(candidates)}, Output: {len(X_processed)}")
+
+        except Exception as e:
+             eprint(traceback.format_exc()) # Print full traceback to stderr
+             raise ScoringError(f"Error during preprocessing: {str(e)}", job_id)
+        predictions.X_processed = X_processed
+    else:
+        eprint("Reusing the prefilter's matchScores; no features to build.")
+
 
-        prediction_df = pd.DataFrame(predictions, index=X_processed.index)
-        prediction_df['_id'] = input_df.loc[X_processed.index, '_id'].values
+    # --- Prediction Step ---
+    eprint("Starting prediction...")
+    try:
+        # Only the targets this request returns are predicted
+        prediction_df = pd.DataFrame({target: predictions[target] for target in output_targets}, index=candidates.index)
+        prediction_df['_id'] = candidates.ids
 
         # Calculate threshold-based match category (0: <40, 1: 40-60, 2: >60)
         prediction_df['match_category'] = 0 # Default low match
@@ -469,28 +2205,25 @@ def main():
         prediction_df.loc[prediction_df['matchScore'] > 60, 'match_category'] = 2 # High match > 60
         eprint("Threshold-based match categories calculated.")
 
-        # --- Execute Birch Clustering Step (for process demonstration) ---
-        eprint("Executing Birch clustering (output label will be based on thresholds)...")
+        # --- Applicant-base cluster from the persistent BIRCH model (see CandidateClusters) ---
+        # Stored candidates carry their label; other resumes are labelled by a descent of its CF-tree.
+        # Compact results have no room for it, so nothing is assigned for them.
         birch_execution_successful = False
         try:
-            # 1. Scale the features
-            scaler = StandardScaler()
-            X_numeric = X_processed.select_dtypes(include=np.number).fillna(0)
-            X_scaled = scaler.fit_transform(X_numeric)
-            eprint(f"Features scaled for Birch. Shape: {X_scaled.shape}")
-
-            # 2. Apply Birch (using n_clusters=3) - We run this but won't use its direct output label
-            birch_model = Birch(n_clusters=3)
-            # We call fit_predict to actually run the algorithm
-            _ = birch_model.fit_predict(X_scaled) # Assign to dummy variable '_'
-            eprint("Birch model fitted and prediction executed.")
-            birch_execution_successful = True # Mark that Birch ran
-
+            candidate_clusters = candidates.clusters if not selection.compact else None
+            if candidate_clusters is None and not selection.compact:
+                clusters = context.candidate_clusters()
+                if clusters is not None:
+                    candidate_clusters = clusters.predict(candidate_embeddings(candidates))
+            if candidate_clusters is not None:
+                prediction_df['candidateCluster'] = np.asarray(candidate_clusters, dtype=np.int64)
+                birch_execution_successful = True
+                eprint("Applicant-base clusters assigned from the persistent Birch model.")
         except Exception as cluster_error:
-            eprint(f"Error during Birch clustering execution: {cluster_error}")
+            eprint(f"Error assigning Birch clusters: {cluster_error}")
             eprint(traceback.format_exc())
-            # Clustering execution failed, but we can still proceed with threshold-based category
-        # --- End Birch Clustering Execution Step ---
+            # Clustering failed, but we can still proceed with threshold-based category
+        # --- End Birch Clustering Step ---
 
         # --- Assign final cluster label based on threshold category ---
         # The 'cluster' label *directly mirrors* the match_category
@@ -499,29 +2232,888 @@ def main():
 
 
         # Prepare results for JSON output
-        # Convert numpy types to standard Python types for JSON serialization
-        # Include the new 'cluster' column (derived from match_category)
-        output_data = prediction_df.astype({
-             col: float for col in prediction_df.columns if col not in ['_id', 'match_category', 'cluster'] # Float scores
-         }).astype({
-             'match_category': int, # Int category (for reference, maybe remove if redundant)
-             'cluster': int         # Int cluster label (based on threshold)
-         }).to_dict(orient='records')
-
-
-        result = {
-            "jobId": job_id,
-            "matchResults": output_data,
-            # Optionally add a flag indicating Birch was run
-            "birch_algorithm_executed": birch_execution_successful
-        }
+        if selection.compact:
+            # Only the selected candidates' ids and scores are serialized
+            output_data = selection.compact_results(candidates.ids, {target: prediction_df[target].to_numpy() for target in output_targets})
+            eprint(f"Selected {len(output_data)} of {len(prediction_df)} candidates for output.")
+        else:
+            # Convert numpy types to standard Python types for JSON serialization
+            # Include the new 'cluster' column (derived from match_category)
+            label_columns = [col for col in ('match_category', 'cluster', 'candidateCluster') if col in prediction_df.columns]
+            output_data = prediction_df.astype({
+                 col: float for col in prediction_df.columns if col not in ['_id'] + label_columns # Float scores
+             }).astype({
+                 col: int for col in label_columns # Int category, threshold cluster and applicant-base cluster
+             }).to_dict(orient='records')
+
+
         eprint("Prediction and threshold-based clustering complete.")
 
     except Exception as e:
-        error_msg = f"Error during prediction/clustering steps: {str(e)}"
-        print(json.dumps({"error": error_msg, "jobId": job_id}))
-        eprint(error_msg)
         eprint(traceback.format_exc()) # Print full traceback to stderr
+        raise ScoringError(f"Error during prediction/clustering steps: {str(e)}", job_id)
+
+    return output_data, birch_execution_successful
+
+
+class Prefilter:
+    """
+    Two-stage retrieval for compact requests over a large candidate pool ('prefilter' option).
+
+    Stage one ranks every candidate by a cheap surrogate of matchScore: shortlist_signals()
+    weighted by a non-negative least-squares fit, per job, to the real scores of a uniform
+    random audit sample (non-negative weights keep a small audit from ranking strong
+    candidates last through cancelling signals). Stage two runs pairwise_features and the
+    forests on the top of that ranking only, starting with minShortlist candidates and
+    doubling the shortlist until the estimated recall of the selection (the share of the
+    candidates it would return that were scored) reaches minRecall, or every candidate has
+    been scored.
+
+    Missed qualifiers are estimated from the audit members beyond the shortlist only: the
+    rest of the ranking is cut into about sqrt(m) strata by surrogate rank (m audit members
+    beyond the shortlist), and each unscored candidate of a stratum counts with the
+    predictive probability (Student t) that a score drawn like the stratum's audited ones
+    is above the selection's floor. Strata scoring well below the floor add next to nothing,
+    so clear-cut jobs stop early; flat score distributions (a small topK among near ties)
+    keep the shortlist growing. A qualifier that is rare and misranked by the surrogate can
+    still be missed when the audit does not sample it.
+    """
+    def __init__(self, min_shortlist=2000, audit_size=500, min_recall=0.95):
+        self.min_shortlist = min_shortlist
+        self.audit_size = audit_size
+        self.min_recall = min_recall
+
+    @classmethod
+    def from_request(cls, request, job_id=None):
+        """Prefilter for the request's 'prefilter' option (true or {minShortlist, auditSize, minRecall}), or None."""
+        options = request.get('prefilter')
+        if options is None or options is False:
+            return None
+        if options is True:
+            options = {}
+        if not isinstance(options, dict):
+            raise ScoringError(f"'prefilter' must be true or an object, got {options!r}.", job_id)
+        prefilter = cls()
+        for name, attribute in (('minShortlist', 'min_shortlist'), ('auditSize', 'audit_size')):
+            value = options.get(name, getattr(prefilter, attribute))
+            if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+                raise ScoringError(f"'prefilter.{name}' must be a positive integer, got {value!r}.", job_id)
+            setattr(prefilter, attribute, value)
+        min_recall = options.get('minRecall', prefilter.min_recall)
+        if isinstance(min_recall, bool) or not isinstance(min_recall, (int, float)) or not 0 < min_recall <= 1:
+            raise ScoringError(f"'prefilter.minRecall' must be a number in (0, 1], got {min_recall!r}.", job_id)
+        prefilter.min_recall = float(min_recall)
+        return prefilter
+
+    @staticmethod
+    def _match_scores(job_context, candidates, positions, context):
+        X = pairwise_features(job_context, candidates.take(positions), context.feature_preserver)
+        return np.asarray(LazyPredictions(context.trained_models, X, context.feature_preserver)['matchScore'], dtype=float)
+
+    @staticmethod
+    def _floor(scored_scores, selection):
+        """Lowest score the selection would return, given every score computed so far."""
+        floor = -np.inf
+        if selection.top_k is not None and len(scored_scores) >= selection.top_k:
+            floor = np.partition(scored_scores, len(scored_scores) - selection.top_k)[len(scored_scores) - selection.top_k]
+        if selection.score_above is not None:
+            floor = max(floor, selection.score_above)
+        return floor
+
+    @classmethod
+    def _estimated_recall(cls, scores, scored, ranking, shortlist_size, in_audit, selection):
+        floor = cls._floor(scores[scored], selection)
+        qualifying = scores[scored] >= floor
+        if selection.score_above is not None:
+            qualifying &= scores[scored] > selection.score_above
+        found = int(qualifying.sum())
+        rest = ranking[shortlist_size:]
+        rest_audited = in_audit[rest]
+        if rest_audited.all():
+            return 1.0
+
+        missed = 0.0
+        for stratum in np.array_split(rest, max(1, int(np.sqrt(rest_audited.sum())))):
+            audited = scores[stratum[in_audit[stratum]]]
+            if len(audited) < 3:
+                audited = scores[rest[rest_audited]]
+            unscored = len(stratum) - int(in_audit[stratum].sum())
+            spread = audited.std(ddof=1) * np.sqrt(1 + 1 / len(audited)) if len(audited) > 1 else 0.0
+            if spread > 0:
+                missed += unscored * float(student_t.sf((floor - audited.mean()) / spread, len(audited) - 1))
+            elif audited.size and audited.mean() > floor:
+                missed += unscored
+        if found == 0:
+            # Nothing qualifies yet: the recall target stands for the chance of missing any qualifier
+            return max(0.0, 1.0 - missed)
+        return found / (found + missed)
+
+    def select(self, job_context, candidates, context, selection, skill_match_count=None):
+        """
+        Positions of the candidates the selection keeps after the shortlist was scored.
+        skill_match_count is passed on to shortlist_signals.
+
+        Returns:
+            (positions, match_scores, stats): match_scores are the matchScores of those
+            candidates, to pass on to score_candidates (None when the pool was too small to
+            prefilter and nothing was scored), and stats are reported as "prefilter" in the
+            response
+        """
+        n = len(candidates)
+        if n <= self.min_shortlist + self.audit_size:
+            return np.arange(n), None, {"candidates": n, "scored": n, "audited": 0, "estimatedRecall": 1.0}
+
+        scores = np.full(n, np.nan)
+        audit = np.sort(np.random.default_rng(0).choice(n, self.audit_size, replace=False))
+        scores[audit] = self._match_scores(job_context, candidates, audit, context)
+        signals = shortlist_signals(job_context, candidates, skill_match_count)
+        weights, _ = nnls(signals[audit], scores[audit])
+        ranking = np.argsort(-(signals @ weights), kind='stable')
+        in_audit = np.zeros(n, dtype=bool)
+        in_audit[audit] = True
+
+        shortlist_size = self.min_shortlist
+        while True:
+            shortlist = ranking[:shortlist_size]
+            fresh = shortlist[np.isnan(scores[shortlist])]
+            if len(fresh):
+                scores[fresh] = self._match_scores(job_context, candidates, fresh, context)
+            scored = ~np.isnan(scores)
+            recall = self._estimated_recall(scores, scored, ranking, shortlist_size, in_audit, selection)
+            eprint(f"Prefilter: scored {int(scored.sum())} of {n} candidates, estimated recall {recall:.3f}.")
+            if recall >= self.min_recall or shortlist_size >= n:
+                break
+            shortlist_size *= 2
+
+        positions = np.flatnonzero(scored)
+        positions = positions[selection.positions(scores[positions])]
+        stats = {"candidates": n, "scored": int(scored.sum()), "audited": self.audit_size, "estimatedRecall": float(recall)}
+        return positions, scores[positions], stats
+
+
+# Request keys that choose what a job is matched against and returns; a batch request's
+# top-level values apply to each of its jobs unless the job entry sets its own
+JOB_OPTION_KEYS = ('scoreAbove', 'topK', 'targets', 'prefilter', 'minSkillOverlap')
+
+
+def job_request_options(data, job_id):
+    """(selection, prefilter, min_skill_overlap) of one job's score request, validated."""
+    selection = MatchSelection.from_request(data, job_id)
+    prefilter = Prefilter.from_request(data, job_id)
+    if prefilter is not None and not selection.compact:
+        raise ScoringError("'prefilter' needs a 'scoreAbove' or 'topK' selection.", job_id)
+    min_skill_overlap = data.get('minSkillOverlap')
+    if min_skill_overlap is not None and (isinstance(min_skill_overlap, bool) or not isinstance(min_skill_overlap, int)
+                                          or min_skill_overlap < 1):
+        raise ScoringError(f"'minSkillOverlap' must be a positive integer, got {min_skill_overlap!r}.", job_id)
+    return selection, prefilter, min_skill_overlap
+
+
+def request_candidates(data, context, job_id):
+    """
+    The candidates a score request is matched against: every stored candidate for
+    "source": "store", else its featurized 'resumes'.
+
+    Returns:
+        (candidates, skill_index), where skill_index is the store's SkillIndex (None for
+        inline resumes); candidates is None when no inline resume is usable (an empty
+        store gives zero rows)
+    """
+    if data.get('source') == 'store':
+        try:
+            candidates = context.store_candidates()
+            skill_index = context.candidate_store().skill_index
+        except ScoringError as e:
+            raise ScoringError(str(e), job_id)
+        eprint(f"Scoring {len(candidates)} candidates from the candidate store.")
+        return candidates, skill_index # An empty store matches no one
+
+    input_df = build_candidate_frame(data.get('resumes'), job_id)
+    if input_df.empty:
+        return None, None
+    try:
+        return featurize_candidates(input_df, context.feature_preserver, context.candidate_cache), None
+    except Exception as e:
+         eprint(traceback.format_exc()) # Print full traceback to stderr
+         raise ScoringError(f"Error during preprocessing: {str(e)}", job_id)
+
+
+def match_job(job_id, job_data, job_context, candidates, skill_index, options, context):
+    """
+    Skill retrieval, prefiltering and scoring of prepared candidates for one prepared job.
+
+    Args:
+        options: (selection, prefilter, min_skill_overlap) from job_request_options()
+        skill_index: SkillIndex row-aligned with candidates, or None (built here if
+            'minSkillOverlap' needs one)
+
+    Returns:
+        The score_job response for this job
+    """
+    selection, prefilter, min_skill_overlap = options
+    skill_match_count = None
+    try:
+        job_skills = job_data.get('jobSkills', [])
+        if skill_index is not None and prefilter is not None:
+            skill_match_count = skill_index.match_counts(job_skills, known_only=True)
+        if min_skill_overlap is not None:
+            if skill_index is None:
+                skills, _, _, _ = skill_vocabulary(context.feature_preserver)
+                skill_index = SkillIndex.build(candidates, skills)
+            positions = skill_index.candidates(job_skills, min_skill_overlap)
+            eprint(f"{len(positions)} of {len(candidates)} candidates list at least {min_skill_overlap} of the job's skills.")
+            candidates = candidates.take(positions)
+            if skill_match_count is not None:
+                skill_match_count = skill_match_count[positions]
+    except Exception as e:
+        eprint(traceback.format_exc())
+        raise ScoringError(f"Error during skill retrieval: {str(e)}", job_id)
+
+    prefilter_stats = match_scores = None
+    if prefilter is not None:
+        try:
+            positions, match_scores, prefilter_stats = prefilter.select(job_context, candidates, context, selection,
+                                                                        skill_match_count)
+        except Exception as e:
+            eprint(traceback.format_exc())
+            raise ScoringError(f"Error during prefiltering: {str(e)}", job_id)
+        candidates = candidates.take(positions)
+
+    if len(candidates) == 0:
+        match_results, birch_execution_successful = [], False
+    else:
+        match_results, birch_execution_successful = score_candidates(job_context, candidates, context, job_id, selection,
+                                                                     match_scores)
+    response = {
+        "jobId": job_id,
+        "matchResults": match_results,
+        # Optionally add a flag indicating Birch was run
+        "birch_algorithm_executed": birch_execution_successful
+    }
+    if prefilter_stats is not None:
+        response["prefilter"] = prefilter_stats
+    return response
+
+
+def score_job(data, context):
+    """
+    Run the full matching pipeline for one job against a list of resumes.
+
+    Args:
+        data: Parsed request with 'jobId', 'jobData' and 'resumes', or with
+            "source": "store" to score every candidate in the candidate store instead.
+            Optional 'scoreAbove'/'topK' select a compact subset (see MatchSelection),
+            which 'prefilter' can find without scoring every candidate (see Prefilter).
+            Optional 'minSkillOverlap' scores only candidates listing at least that
+            many of the job's skills (see SkillIndex)
+        context: ScoringContext with the loaded models, candidate cache and store
+
+    Returns:
+        Dict in the {"jobId", "matchResults"} shape expected by routes/Employer.js
+
+    Raises:
+        ScoringError: If the request is malformed or any pipeline step fails
+    """
+    job_id = data.get('jobId', 'unknown_job')
+    job_data = data.get('jobData')
+    from_store = data.get('source') == 'store'
+    resumes = data.get('resumes') # List of resume objects
+    eprint(f"Job ID: {job_id}, Found {len(resumes) if resumes else 0} resumes.") # Debug print
+
+    if not job_data or not (resumes or from_store):
+        raise ScoringError("Missing 'jobData' or 'resumes' in input JSON.", job_id)
+    options = job_request_options(data, job_id)
+
+    candidates, skill_index = request_candidates(data, context, job_id)
+    if candidates is None:
+        eprint("Warning: No valid resumes processed.")
+        return {"message": "No valid resumes processed.", "jobId": job_id}
+
+    try:
+        job_context = JobContext.for_job(job_data, context.feature_preserver)
+    except Exception as e:
+         eprint(traceback.format_exc()) # Print full traceback to stderr
+         raise ScoringError(f"Error during preprocessing: {str(e)}", job_id)
+    return match_job(job_id, job_data, job_context, candidates, skill_index, options, context)
+
+
+def score_jobs(data, context):
+    """
+    Run the matching pipeline for several jobs against the same resumes in one request.
+
+    The resumes are featurized once and the job texts vectorized together, so only the
+    job-vs-candidate features and the predictions are computed per job. Candidate-side
+    lookups built on first use (the LocationIndex, an inline SkillIndex) are shared too.
+
+    Args:
+        data: Parsed request with 'jobs' ([{"jobId", "jobData"}, ...]) and 'resumes', or
+            "source": "store". Top-level JOB_OPTION_KEYS apply to every job; a job entry
+            may set its own
+        context: ScoringContext with the loaded models, candidate cache and store
+
+    Returns:
+        {"jobResults": [...]} with one score_job response per job, in request order. A job
+        that fails gets its own {"error", "jobId"} entry without failing the others
+
+    Raises:
+        ScoringError: If the request is malformed or the shared resume or job featurization fails
+    """
+    jobs = data.get('jobs')
+    if not isinstance(jobs, list) or not jobs or not all(isinstance(job, dict) for job in jobs):
+        raise ScoringError("'jobs' must be a non-empty list of {\"jobId\", \"jobData\"} objects.")
+    if not (data.get('resumes') or data.get('source') == 'store'):
+        raise ScoringError("Missing 'resumes' in input JSON.")
+    shared_options = {key: data[key] for key in JOB_OPTION_KEYS if key in data}
+    requests = [{**shared_options, **job} for job in jobs]
+    job_ids = [request.get('jobId', 'unknown_job') for request in requests]
+    eprint(f"Batch of {len(jobs)} jobs: {job_ids}")
+
+    candidates, skill_index = request_candidates(data, context, 'batch')
+    if candidates is None:
+        eprint("Warning: No valid resumes processed.")
+        return {"jobResults": [{"message": "No valid resumes processed.", "jobId": job_id} for job_id in job_ids]}
+
+    valid = [position for position, request in enumerate(requests)
+             if request.get('jobData') and isinstance(request['jobData'], dict)]
+    try:
+        job_contexts = JobContext.for_jobs([requests[p]['jobData'] for p in valid], context.feature_preserver) if valid else None
+    except Exception as e:
+         eprint(traceback.format_exc()) # Print full traceback to stderr
+         raise ScoringError(f"Error during preprocessing: {str(e)}")
+    if skill_index is None and any(request.get('minSkillOverlap') is not None for request in requests):
+        skills, _, _, _ = skill_vocabulary(context.feature_preserver)
+        skill_index = SkillIndex.build(candidates, skills)
+
+    job_results = []
+    row = {position: k for k, position in enumerate(valid)}
+    for position, (job_id, request) in enumerate(zip(job_ids, requests)):
+        try:
+            if position not in row:
+                raise ScoringError("Missing 'jobData' in batch job.", job_id)
+            options = job_request_options(request, job_id)
+            job_results.append(match_job(job_id, request['jobData'], job_contexts.take([row[position]]),
+                                         candidates, skill_index, options, context))
+        except ScoringError as e:
+            eprint(f"Job {job_id} failed: {e}")
+            job_results.append(e.to_dict())
+    return {"jobResults": job_results}
+
+
+STREAM_CHUNK_SIZE = 500
+
+
+def featurize_resume_chunk(resumes, context, job_id):
+    """CandidateFeatures of one chunk of raw resumes, or None if none is usable."""
+    input_df = build_candidate_frame(resumes, job_id)
+    if input_df.empty:
+        return None
+    try:
+        return featurize_candidates(input_df, context.feature_preserver, context.candidate_cache)
+    except Exception as e:
+         eprint(traceback.format_exc()) # Print full traceback to stderr
+         raise ScoringError(f"Error during preprocessing: {str(e)}", job_id)
+
+
+class JobSession:
+    """
+    One job scored chunk by chunk (--stream mode or the openJob/scoreChunk/closeJob ops).
+
+    Threshold-only and full results can be returned as each chunk is scored; with topK the
+    per-chunk winners are merged in TopMatches and only returned by finish().
+    """
+    def __init__(self, job_context, selection):
+        self.job_context = job_context
+        self.selection = selection
+        self.top_matches = TopMatches(selection.top_k) if selection.top_k is not None else None
+
+    def score_chunk(self, candidates, context, job_id):
+        """Results ready to be sent for this chunk (featurize_resume_chunk output; None scores nothing)."""
+        if candidates is None:
+            return []
+        match_results, _ = score_candidates(self.job_context, candidates, context, job_id, self.selection)
+        if self.top_matches is None:
+            return match_results
+        self.top_matches.add(match_results)
+        return []
+
+    def finish(self):
+        """Results held back until every chunk was seen (the merged top-K)."""
+        return self.top_matches.results() if self.top_matches is not None else []
+
+
+def read_resume_chunks(lines, chunk_size):
+    """Group NDJSON resume lines into lists of at most chunk_size parsed resumes."""
+    chunk = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            chunk.append(json.loads(line))
+        except json.JSONDecodeError as e:
+            eprint(f"Warning: Skipping resume line that is not valid JSON: {e}")
+            continue
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def stream_job(context, in_stream, out_stream, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Score one job against resumes read as NDJSON, writing one result line per candidate.
+
+    The first input line is the job ({"jobId", "jobData"}, plus optional 'scoreAbove'/'topK');
+    every following line is one resume as it would appear in the "resumes" list. Resumes are
+    scored in chunks of chunk_size and each chunk's results are flushed before the next one
+    is read, so memory is bounded by the chunk, not the applicant pool (with topK the merged
+    top-K is written at the end). The stream ends with {"event": "done", "jobId", "count"},
+    or with an error line if scoring fails.
+
+    Returns:
+        True if every chunk was scored
+    """
+    def emit(payload):
+        out_stream.write(json.dumps(payload) + "\n")
+
+    header_line = in_stream.readline()
+    try:
+        header = json.loads(header_line)
+    except json.JSONDecodeError as e:
+        emit({"error": f"Could not decode stream header JSON: {str(e)}", "jobId": None})
+        return False
+    job_id = header.get('jobId', 'unknown_job')
+    if not header.get('jobData'):
+        emit({"error": "Missing 'jobData' in stream header.", "jobId": job_id})
+        return False
+
+    count = 0
+    try:
+        selection = MatchSelection.from_request(header, job_id)
+        session = JobSession(JobContext.for_job(header['jobData'], context.feature_preserver), selection)
+        for chunk in read_resume_chunks(in_stream, chunk_size):
+            for match_result in session.score_chunk(featurize_resume_chunk(chunk, context, job_id), context, job_id):
+                emit(match_result)
+                count += 1
+            out_stream.flush()
+            eprint(f"Streamed {count} results for job {job_id}.")
+        for match_result in session.finish():
+            emit(match_result)
+            count += 1
+    except ScoringError as e:
+        emit(e.to_dict())
+        return False
+    except Exception as e:
+        eprint(traceback.format_exc())
+        emit({"error": f"Error while streaming results: {str(e)}", "jobId": job_id})
+        return False
+
+    emit({"event": "done", "jobId": job_id, "count": count})
+    out_stream.flush()
+    return True
+
+
+def handle_job_session_request(op, request, context):
+    """
+    Chunked scoring through the daemon: openJob prepares the job once (with any
+    'scoreAbove'/'topK' selection), scoreChunk scores one chunk of resumes against it and
+    closeJob releases it, returning the merged top-K if one was requested. A scoreChunk
+    with 'jobIds' instead of 'jobId' featurizes the chunk once for several open jobs and
+    answers {"jobResults": [{"jobId", "matchResults"}, ...]}.
+    """
+    job_id = request.get('jobId')
+    if op == 'openJob':
+        if not request.get('jobData'):
+            raise ScoringError("Missing 'jobData' in openJob request.", job_id)
+        selection = MatchSelection.from_request(request, job_id)
+        try:
+            job_context = JobContext.for_job(request['jobData'], context.feature_preserver)
+        except Exception as e:
+            eprint(traceback.format_exc())
+            raise ScoringError(f"Error during preprocessing: {str(e)}", job_id)
+        context.open_jobs[job_id] = JobSession(job_context, selection)
+        return {"status": "ok", "jobId": job_id}
+    if op == 'closeJob':
+        session = context.open_jobs.pop(job_id, None)
+        return {"status": "ok", "jobId": job_id, "matchResults": session.finish() if session else []}
+
+    # scoreChunk
+    job_ids = request.get('jobIds')
+    if job_ids is not None and (not isinstance(job_ids, list) or not job_ids):
+        raise ScoringError(f"'jobIds' must be a non-empty list, got {job_ids!r}.")
+    sessions = []
+    for session_job_id in job_ids if job_ids is not None else [job_id]:
+        if session_job_id not in context.open_jobs:
+            raise ScoringError(f"Job '{session_job_id}' is not open; send openJob first.", session_job_id)
+        sessions.append((session_job_id, context.open_jobs[session_job_id]))
+    candidates = featurize_resume_chunk(request.get('resumes') or [], context, job_id if job_ids is None else None)
+    job_results = [{"jobId": session_job_id, "matchResults": session.score_chunk(candidates, context, session_job_id)}
+                   for session_job_id, session in sessions]
+    return job_results[0] if job_ids is None else {"jobResults": job_results}
+
+
+def read_request_file(input_file):
+    """Read a scoring request written to disk by the caller."""
+    try:
+        eprint("Attempting to read input file...") # Debug print
+        with open(input_file, 'r') as f:
+            data = json.load(f)
+        eprint("Input file read successfully.") # Debug print
+        return data
+    except FileNotFoundError:
+        raise ScoringError(f"Input file '{input_file}' not found.")
+    except json.JSONDecodeError as e:
+        raise ScoringError(f"Could not decode JSON from '{input_file}': {str(e)}")
+    except Exception as e:
+        eprint(traceback.format_exc()) # Print full traceback to stderr
+        raise ScoringError(f"Error reading input file: {str(e)}")
+
+
+def featurize_resumes(resumes, context):
+    """CandidateFeatures for raw applicant resumes, or None when none of them is usable."""
+    input_df = build_candidate_frame(resumes, 'candidate_store')
+    if input_df.empty:
+        return None
+    return featurize_candidates(input_df, context.feature_preserver, context.candidate_cache)
+
+
+def empty_candidates(feature_preserver):
+    """Zero-row CandidateFeatures, cut from one blank resume so every matrix keeps its width."""
+    blank = build_candidate_frame([{'_id': '', 'resume': {}}], 'candidate_store')
+    return CandidateFeatures.from_frame(blank, feature_preserver).take(np.zeros(0, dtype=np.int64))
+
+
+def handle_store_request(op, request, context):
+    """Build, update or shrink the candidate store from the applicant resumes in the request."""
+    if 'inputFile' in request:
+        request = {**read_request_file(request['inputFile']), **{k: v for k, v in request.items() if k != 'inputFile'}}
+    resumes = request.get('resumes') or []
+
+    if op == 'buildStore':
+        candidates = featurize_resumes(resumes, context)
+        if candidates is None:
+            # A new deployment has no applicants yet; job posts then match no one
+            eprint("Warning: No valid resumes processed. Building an empty candidate store.")
+            candidates = empty_candidates(context.feature_preserver)
+        context.write_store(candidates)
+        return {"status": "ok", "count": len(candidates)}
+    if op == 'upsertCandidates':
+        count = context.upsert_store(featurize_resumes(resumes, context))
+        return {"status": "ok", "count": count}
+    # removeCandidates
+    count = context.upsert_store(None, removed_ids=request.get('ids') or [])
+    return {"status": "ok", "count": count}
+
+
+def handle_job_store_request(op, request, context):
+    """Build, update or shrink the job store from the open job posts in the request."""
+    if op == 'removeJobs':
+        context.job_store = context.job_store.remove([str(job_id) for job_id in request.get('jobIds') or []])
+        return {"status": "ok", "count": len(context.job_store)}
+
+    jobs = request.get('jobs') or []
+    if not isinstance(jobs, list) or not all(isinstance(job, dict) and 'jobId' in job and isinstance(job.get('jobData'), dict)
+                                             for job in jobs):
+        raise ScoringError("'jobs' must be a list of {\"jobId\", \"jobData\"} objects.")
+    job_datas = {str(job['jobId']): job['jobData'] for job in jobs} # The last entry for a jobId wins
+    job_store = JobStore() if op == 'buildJobStore' else context.job_store
+    if job_datas:
+        try:
+            jobs = JobContext.for_jobs(list(job_datas.values()), context.feature_preserver)
+        except Exception as e:
+            eprint(traceback.format_exc())
+            raise ScoringError(f"Error featurizing job posts: {str(e)}")
+        job_store = job_store.upsert(list(job_datas), jobs)
+    context.job_store = job_store
+    eprint(f"Job store holds {len(job_store)} open jobs.")
+    return {"status": "ok", "count": len(job_store)}
+
+
+def match_resume(request, context):
+    """
+    Score one resume against every job in the job store ("matchResume" op).
+
+    The resume is featurized once ('resume', through the candidate cache) or read from the
+    candidate store ('candidateId' with "source": "store"), then repeated once per job
+    against the store's row-aligned JobContext, so pairwise_features and each forest run in
+    a single batch for all open jobs. Optional 'scoreAbove'/'topK'/'targets' select jobs
+    and scores the way MatchSelection does for candidates.
+
+    Returns:
+        {"candidateId", "jobMatches"}: every job with its scores and match_category, or for
+        a compact selection {"jobId", "matchScore"} of the selected jobs (best first with topK)
+    """
+    selection = MatchSelection.from_request(request)
+    if request.get('source') == 'store':
+        candidate_id = request.get('candidateId')
+        position = context.candidate_store().position(candidate_id)
+        if position is None:
+            raise ScoringError(f"Candidate '{candidate_id}' is not in the candidate store.")
+        candidate = context.store_candidates().take([position])
+    else:
+        resume = request.get('resume')
+        if not isinstance(resume, dict):
+            raise ScoringError("Missing 'resume' in matchResume request.")
+        candidate = featurize_resumes([resume], context)
+        if candidate is None:
+            raise ScoringError("Resume could not be processed.")
+
+    job_store = context.job_store
+    response = {"candidateId": str(candidate.ids[0]), "jobMatches": []}
+    if len(job_store) == 0:
+        eprint("Warning: Job store is empty; no jobs to match.")
+        return response
+    try:
+        X_processed = pairwise_features(job_store.jobs, candidate.take(np.zeros(len(job_store), dtype=np.int64)),
+                                        context.feature_preserver)
+        predictions = LazyPredictions(context.trained_models, X_processed, context.feature_preserver)
+        scores = {target: np.asarray(predictions[target], dtype=float) for target in selection.output_targets(predictions)}
+    except Exception as e:
+        eprint(traceback.format_exc())
+        raise ScoringError(f"Error matching resume against open jobs: {str(e)}")
+
+    # Same thresholds as score_candidates (0: <40, 1: 40-60, 2: >60)
+    match_category = np.where(scores['matchScore'] > 60, 2, np.where(scores['matchScore'] >= 40, 1, 0))
+    for p in selection.positions(scores['matchScore']).tolist():
+        job_match = {"jobId": job_store.job_ids[p], **{target: float(values[p]) for target, values in scores.items()}}
+        if not selection.compact:
+            job_match['match_category'] = int(match_category[p])
+        response["jobMatches"].append(job_match)
+    eprint(f"Matched resume {response['candidateId']} against {len(job_store)} open jobs.")
+    return response
+
+
+def block_similarity(candidates, position, members):
+    """Mean of the skill, role and education cosine similarities between one candidate and `members`."""
+    blocks = [matrix for matrix in (candidates.skill_matrix, candidates.role_vectors, candidates.edu_vectors)
+              if matrix is not None]
+    similarity = np.zeros(len(members))
+    if len(members) == 0:
+        return similarity # normalize() rejects zero rows
+    for matrix in blocks:
+        target = normalize(csr_matrix(matrix[[position]], dtype=np.float64), norm='l2')
+        rows = normalize(csr_matrix(matrix[members], dtype=np.float64), norm='l2')
+        similarity += (rows @ target.T).toarray().ravel()
+    return similarity / max(len(blocks), 1)
+
+
+def similar_candidates(request, context):
+    """
+    Stored candidates most like one stored candidate ("similar" op).
+
+    Only the candidate's own applicant-base cluster is searched (all candidates with
+    "sameCluster": false); its members are ranked by block_similarity and the 'topK'
+    best (default 10) are returned.
+    """
+    candidate_id = request.get('candidateId')
+    top_k = request.get('topK', 10)
+    if candidate_id is None:
+        raise ScoringError("Missing 'candidateId' in similar request.")
+    if isinstance(top_k, bool) or not isinstance(top_k, int) or top_k < 1:
+        raise ScoringError(f"'topK' must be a positive integer, got {top_k!r}.")
+
+    store = context.candidate_store()
+    candidates = context.store_candidates()
+    position = store.position(candidate_id)
+    if position is None:
+        raise ScoringError(f"Candidate '{candidate_id}' is not in the candidate store.")
+    if candidates.clusters is None:
+        raise ScoringError("Candidate store has no clusters; rebuild it.")
+
+    labels = np.asarray(candidates.clusters)
+    cluster = int(labels[position])
+    in_scope = labels == cluster if request.get('sameCluster', True) else np.ones(len(labels), dtype=bool)
+    in_scope[position] = False
+    members = np.flatnonzero(in_scope)
+    similarity = block_similarity(candidates, position, members)
+    if top_k < len(members):
+        best = np.argpartition(-similarity, top_k - 1)[:top_k]
+    else:
+        best = np.arange(len(members))
+    best = best[np.argsort(-similarity[best], kind='stable')]
+    return {
+        "candidateId": str(candidate_id),
+        "candidateCluster": cluster,
+        "similarCandidates": [{"_id": candidates.ids[members[i]], "similarity": float(similarity[i]),
+                               "candidateCluster": int(labels[members[i]])} for i in best],
+    }
+
+
+def handle_request(request, context):
+    """Dispatch one daemon request line to the matching pipeline and build its response."""
+    op = request.get('op', 'score')
+    if op == 'ping':
+        return {"status": "ok"}
+    if op in ('buildStore', 'upsertCandidates', 'removeCandidates'):
+        return handle_store_request(op, request, context)
+    if op == 'storeStatus':
+        if not context.candidate_store_path:
+            raise ScoringError("No candidate store configured (start the scorer with --store).")
+        return CandidateStore.status(context.candidate_store_path, context.model_version)
+    if op in ('openJob', 'scoreChunk', 'closeJob'):
+        return handle_job_session_request(op, request, context)
+    if op == 'similar':
+        return similar_candidates(request, context)
+    if op in ('buildJobStore', 'upsertJobs', 'removeJobs'):
+        return handle_job_store_request(op, request, context)
+    if op == 'matchResume':
+        return match_resume(request, context)
+    if op != 'score':
+        raise ScoringError(f"Unknown op '{op}'.", request.get('jobId'))
+
+    if 'inputFile' in request:
+        request = read_request_file(request['inputFile'])
+    return score_jobs(request, context) if 'jobs' in request else score_job(request, context)
+
+
+def serve(context, in_stream=None, out_stream=None):
+    """
+    Long-lived scoring loop over a newline-delimited JSON protocol.
+
+    The models are loaded once by the caller; every stdin line is then one request,
+    either inline ({"jobId", "jobData", "resumes"}, or {"jobs", "resumes"} for a batch of
+    jobs) or by reference ({"inputFile": path}), and produces exactly one stdout line. An optional 'requestId' is echoed back so
+    the caller can have several requests in flight. Large applicant pools can be sent
+    in chunks with the openJob/scoreChunk/closeJob ops instead of one 'score' request,
+    and 'matchResume' scores one resume against the open jobs kept by the job store ops.
+    """
+    in_stream = in_stream or sys.stdin
+    out_stream = out_stream or sys.stdout
+
+    def respond(payload):
+        out_stream.write(json.dumps(payload) + "\n")
+        out_stream.flush()
+
+    respond({"event": "ready"})
+    eprint("Scoring server ready, waiting for requests on stdin.")
+
+    for line in in_stream:
+        line = line.strip()
+        if not line:
+            continue
+
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get('requestId')
+            response = handle_request(request, context)
+        except json.JSONDecodeError as e:
+            response = {"error": f"Could not decode request JSON: {str(e)}", "jobId": None}
+        except ScoringError as e:
+            eprint(f"Request {request_id} failed: {e}")
+            response = e.to_dict()
+        except Exception as e:
+            eprint(traceback.format_exc())
+            response = {"error": f"Unexpected error: {str(e)}", "jobId": None}
+
+        if request_id is not None:
+            response["requestId"] = request_id
+        try:
+            respond(response)
+        except (TypeError, ValueError) as e:
+            respond({"error": f"Error serializing results to JSON: {str(e)}", "requestId": request_id})
+
+    eprint("stdin closed, scoring server shutting down.")
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Score resumes against a job post with the trained models.")
+    parser.add_argument('input_file', nargs='?',
+                        help="JSON file with 'jobId', 'jobData' and 'resumes' (or 'jobs': [{jobId, jobData}, ...] for a batch)")
+    parser.add_argument('--serve', action='store_true',
+                        help="Load the model once and answer newline-delimited JSON requests on stdin")
+    parser.add_argument('--stream', action='store_true',
+                        help="Read a job line then one resume per line (NDJSON, from input_file or stdin) "
+                             "and write one result line per candidate")
+    parser.add_argument('--chunk-size', type=int, default=STREAM_CHUNK_SIZE,
+                        help="Resumes featurized and predicted together in --stream mode")
+    parser.add_argument('--artifact', default=script_path('model_artifact'),
+                        help="Versioned model artifact directory written by app2.py (used when present)")
+    parser.add_argument('--model', help="Load this model.pkl with its sklearn forests instead of the artifact "
+                                        "(default: model.pkl next to this script when there is no artifact)")
+    parser.add_argument('--candidate-cache', default=script_path('candidate_cache.sqlite'),
+                        help="SQLite file caching resume-side features between requests")
+    parser.add_argument('--no-candidate-cache', action='store_true', help="Featurize every resume from scratch")
+    parser.add_argument('--store', default=script_path('candidate_store'),
+                        help="Directory of the memory-mapped candidate store used by \"source\": \"store\" requests")
+    parser.add_argument('--build-store', action='store_true',
+                        help="Featurize the resumes in input_file ({\"resumes\": [...]}) into the candidate store and exit")
+    return parser.parse_args(argv)
+
+
+def main():
+    eprint("Python script started.") # Debug print
+    args = parse_args(sys.argv[1:])
+
+    if not (args.serve or args.stream) and not args.input_file:
+        # Output error JSON to stdout as intended for the calling process
+        print(json.dumps({"error": "No input file path provided."}))
+        eprint("Error: No input file path provided.") # Also log to stderr
+        sys.exit(1)
+
+    # In one-shot mode the request is read first so a bad input fails before the expensive unpickle
+    data = None
+    if not (args.serve or args.stream):
+        eprint(f"Input file: {args.input_file}") # Debug print
+        try:
+            data = read_request_file(args.input_file)
+        except ScoringError as e:
+            print(json.dumps({"error": str(e)}))
+            eprint(f"Error: {e}")
+            sys.exit(1)
+
+    # --- Load the trained model and feature preserver ---
+    use_artifact = args.model is None and os.path.exists(os.path.join(args.artifact, 'manifest.json'))
+    model_file = args.artifact if use_artifact else (args.model or default_model_path())
+    job_id = data.get('jobId', 'unknown_job') if data else None
+    try:
+        if use_artifact:
+            trained_models, feature_preserver, model_version = load_artifact(model_file)
+        else:
+            trained_models, feature_preserver, model_version = load_model(model_file)
+    except FileNotFoundError:
+         print(json.dumps({"error": f"Model file '{model_file}' not found.", "jobId": job_id}))
+         eprint(f"Error: Model file '{model_file}' not found.")
+         sys.exit(1)
+    except Exception as e:
+         print(json.dumps({"error": f"Error loading model file '{model_file}': {str(e)}", "jobId": job_id}))
+         eprint(f"Error loading model file '{model_file}': {str(e)}")
+         eprint(traceback.format_exc()) # Print full traceback to stderr
+         sys.exit(1)
+
+    candidate_cache = None
+    if not args.no_candidate_cache:
+        try:
+            candidate_cache = CandidateFeatureCache(args.candidate_cache, model_version)
+        except sqlite3.Error as e:
+            eprint(f"Warning: could not open candidate cache '{args.candidate_cache}': {e}. Continuing without it.")
+    context = ScoringContext(trained_models, feature_preserver, model_version, candidate_cache, args.store)
+
+    if args.serve:
+        serve(context)
+        return
+
+    if args.stream:
+        if args.input_file:
+            try:
+                with open(args.input_file, 'r') as in_stream:
+                    streamed = stream_job(context, in_stream, sys.stdout, args.chunk_size)
+            except FileNotFoundError:
+                print(json.dumps({"error": f"Input file '{args.input_file}' not found."}))
+                sys.exit(1)
+        else:
+            streamed = stream_job(context, sys.stdin, sys.stdout, args.chunk_size)
+        sys.exit(0 if streamed else 1)
+
+    try:
+        if args.build_store:
+            result = handle_store_request('buildStore', data, context)
+        else:
+            result = score_jobs(data, context) if 'jobs' in data else score_job(data, context)
+    except ScoringError as e:
+        print(json.dumps(e.to_dict()))
+        eprint(str(e))
         sys.exit(1)
 
     # Output the final results as JSON to stdout
@@ -540,4 +3132,4 @@ def main():
     eprint("Python script finished successfully.") # Debug print
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,35 @@
+"""
+CandidateClusters persistence: a saved tree, and one saved as changed rows over it, loads
+back to the same labels.
+"""
+import os
+
+import numpy as np
+
+import app
+
+
+def blobs(rng, n):
+    centers = rng.normal(size=(5, app.CANDIDATE_EMBEDDING_DIM))
+    return (centers[rng.integers(len(centers), size=n)] + rng.normal(scale=0.1, size=(n, centers.shape[1]))).astype(np.float32)
+
+
+def test_save_load_predict_round_trip(tmp_path):
+    rng = np.random.default_rng(0)
+    embeddings = blobs(rng, 2000)
+    clusters = app.CandidateClusters().fit(embeddings)
+    labels = clusters.label(embeddings)
+    os.makedirs(tmp_path / 'full')
+    clusters.save(str(tmp_path / 'full'))
+    loaded = app.CandidateClusters.load(str(tmp_path / 'full'), clusters.summary())
+    assert np.array_equal(loaded.predict(embeddings), labels)
+
+    added = embeddings[:20] + rng.normal(scale=0.05, size=(20, embeddings.shape[1]))
+    assert not loaded.partial_fit(added, replaced=20)
+    os.makedirs(tmp_path / 'update')
+    loaded.save(str(tmp_path / 'update'))
+    summary = loaded.summary()
+    assert 0 < summary['changed'] < summary['subclusters']
+    updated = app.CandidateClusters.load(str(tmp_path / 'update'), summary)
+    assert np.array_equal(updated.predict(embeddings), loaded.predict(embeddings))
+    assert updated.summary() == summary
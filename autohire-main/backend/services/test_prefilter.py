@@ -0,0 +1,103 @@
+"""
+Recall of Prefilter against full scoring, on a candidate store built from dataset.json.
+
+Needs the trained model: the model_artifact directory or model.pkl next to app.py, or the
+model.pkl named by AUTOHIRE_MODEL. Skipped when there is none.
+"""
+import ast
+import json
+import os
+
+import __main__
+import numpy as np
+import pytest
+
+import app
+
+DATASET = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'dataset.json')
+PREFILTER = {'minShortlist': 100, 'auditSize': 100, 'minRecall': 0.9}
+JOBS = 20
+
+
+def load_models():
+    model_file = os.environ.get('AUTOHIRE_MODEL')
+    artifact = app.script_path('model_artifact')
+    if model_file is None and os.path.exists(os.path.join(artifact, 'manifest.json')):
+        return app.load_artifact(artifact)
+    model_file = model_file or app.default_model_path()
+    if not os.path.exists(model_file):
+        pytest.skip("No trained model; set AUTOHIRE_MODEL to a model.pkl written by app2.py")
+    __main__.FeaturePreserver = app.FeaturePreserver # app2.py pickles it from its own __main__
+    return app.load_model(model_file)
+
+
+def parsed(value, default):
+    try:
+        return ast.literal_eval(value) if isinstance(value, str) else value
+    except (ValueError, SyntaxError):
+        return default
+
+
+def dataset_resume(position, row):
+    """The Node resume payload for a dataset.json row's resume columns."""
+    city, _, country = (row.get('resumeLocation') or '').partition(', ')
+    education = parsed(row.get('resumeEducation'), [])
+    return {'_id': str(position), 'resume': {
+        'professionalSummary': row.get('resumeSummary', ''),
+        'skills': parsed(row.get('resumeSkills'), []),
+        'experience': parsed(row.get('resumeExperience'), []),
+        'education': education[0] if education else {},
+        'personal': {'city': city, 'country': country},
+    }}
+
+
+def dataset_job(row):
+    return {'jobRole': row['jobRole'], 'jobDescription': row['jobDescription'],
+            'jobSkills': parsed(row['jobSkills'], []), 'requiredExperience': row['requiredExperience'],
+            'jobLocation': row['jobLocation']}
+
+
+@pytest.fixture(scope='module')
+def store(tmp_path_factory):
+    with open(DATASET) as f:
+        rows = json.load(f)
+    context = app.ScoringContext(*load_models(),
+                                 candidate_store_path=str(tmp_path_factory.mktemp('prefilter') / 'candidate_store'))
+    resumes = [dataset_resume(position, row) for position, row in enumerate(rows)]
+    context.write_store(app.featurize_candidates(app.build_candidate_frame(resumes, 'test'), context.feature_preserver))
+    jobs = list({row['jobRole']: dataset_job(row) for row in rows}.values())
+    return context, jobs[::max(1, len(jobs) // JOBS)][:JOBS]
+
+
+@pytest.mark.parametrize('selection', [app.MatchSelection(top_k=10), app.MatchSelection(score_above=60)],
+                         ids=['topK', 'scoreAbove'])
+def test_recall_reaches_min_recall(store, selection):
+    context, jobs = store
+    candidates = context.store_candidates()
+    skill_index = context.candidate_store().skill_index
+    prefilter = app.Prefilter.from_request({'prefilter': PREFILTER})
+    assert len(candidates) > PREFILTER['minShortlist'] + PREFILTER['auditSize']
+    scored = 0
+    for job in jobs:
+        job_context = app.JobContext.for_job(job, context.feature_preserver)
+        everyone, _ = app.score_candidates(job_context, candidates, context, job['jobRole'],
+                                           app.MatchSelection(top_k=len(candidates)))
+        scores = {result['_id']: result['matchScore'] for result in everyone}
+        response = app.match_job(job['jobRole'], job, job_context, candidates, skill_index,
+                                 (selection, prefilter, None), context)
+        returned = [result['_id'] for result in response['matchResults']]
+        stats = response['prefilter']
+        scored += stats['scored']
+
+        # The returned scores are the ones full scoring gives
+        assert all(result['matchScore'] == scores[result['_id']] for result in response['matchResults'])
+        if selection.top_k is not None:
+            # Ties at the K-th score may be broken either way, so count returned scores at or above it
+            floor = everyone[selection.top_k - 1]['matchScore']
+            recall = np.mean([scores[_id] >= floor for _id in returned]) if returned else 0.0
+        else:
+            expected = {_id for _id, score in scores.items() if score > selection.score_above}
+            recall = len(expected & set(returned)) / len(expected) if expected else 1.0
+        assert recall >= PREFILTER['minRecall'], (job['jobRole'], recall, stats)
+    # A prefilter that scores everyone would pass the recall checks trivially
+    assert scored < len(jobs) * len(candidates)